@@ -0,0 +1,110 @@
+"""Compare the size and the write and read throughput of frame codecs and compressions.
+
+Run from the repository root with `python -m benchmarks.frame_codecs --help` for the available options.
+"""
+
+import tempfile
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import typer
+from loguru import logger
+
+from boiling_learning.datasets.codecs import Float16Codec, UInt8Codec
+from boiling_learning.datasets.hdf5_cache import HDF5_FILE_POOL, HDF5NumpyCache
+from boiling_learning.datasets.sliceable import SliceableDataset
+from boiling_learning.utils.timing import Timer
+
+_CONFIGURATIONS: dict[str, dict[str, Any]] = {
+    "float32": {},
+    "float32-lzf": {"compression": "lzf"},
+    "float32-blosc-zstd": {"compression": "blosc-zstd"},
+    "float16": {"codec": Float16Codec()},
+    "float16-blosc-zstd": {"codec": Float16Codec(), "compression": "blosc-zstd"},
+    "uint8": {"codec": UInt8Codec(lossless=True)},
+    "uint8-lz4": {"codec": UInt8Codec(lossless=True), "compression": "lz4"},
+    "uint8-blosc-lz4": {"codec": UInt8Codec(lossless=True), "compression": "blosc-lz4"},
+    "uint8-blosc-zstd": {
+        "codec": UInt8Codec(lossless=True),
+        "compression": "blosc-zstd",
+    },
+    "uint8-zstd": {"codec": UInt8Codec(lossless=True), "compression": "zstd"},
+}
+
+
+def main(
+    *,
+    frames: int = 5_000,
+    height: int = 128,
+    width: int = 128,
+    batch_size: int = 256,
+    chunk_frames: int = 16,
+    configuration: list[str] = typer.Option(list(_CONFIGURATIONS)),
+) -> None:
+    # per-store debug logs would dominate the measurements
+    logger.disable("boiling_learning")
+
+    rng = np.random.default_rng(0)
+    # smooth synthetic 8-bit frames converted to `float32` the way the pipeline does
+    ramp = np.linspace(0, 255, width, dtype=np.float32)
+    stack = (
+        (ramp + rng.normal(0, 8, size=(frames, height, width)))
+        .clip(0, 255)
+        .astype(np.uint8)
+        .astype(np.float32)
+    ) * np.float32(1 / 255)
+    dataset = SliceableDataset.from_sequence(stack)
+
+    sequential_batches = [
+        range(start, min(start + batch_size, frames))
+        for start in range(0, frames, batch_size)
+    ]
+    random_batches = [
+        rng.choice(frames, size=batch_size, replace=False).tolist()
+        for _ in range(len(sequential_batches))
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name in configuration:
+            if name not in _CONFIGURATIONS:
+                raise typer.BadParameter(f"unsupported configuration: {name}")
+
+            cache = HDF5NumpyCache(
+                Path(directory) / name,
+                shape=stack.shape,
+                dtype=stack.dtype,
+                chunk_frames=chunk_frames,
+                **_CONFIGURATIONS[name],
+            )
+            cached = dataset.cache(cache)
+
+            write = _throughput(cached, sequential_batches)
+            sequential = _throughput(cached, sequential_batches)
+            random = _throughput(cached, random_batches)
+            size = (Path(directory) / name / "data.h5").stat().st_size
+            error = np.abs(cached.fetch(random_batches[0]) - stack[random_batches[0]])
+
+            print(
+                f"{name}: {size / 2**20:.1f} MiB ({stack.nbytes / size:.1f}x), "
+                f"write {write:.1f} frames/s, "
+                f"sequential {sequential:.1f} frames/s, "
+                f"random {random:.1f} frames/s, "
+                f"max error {error.max():.2e}"
+            )
+
+        HDF5_FILE_POOL.clear()
+
+
+def _throughput(
+    dataset: SliceableDataset[np.ndarray], batches: list[range] | list[list[int]]
+) -> float:
+    with Timer() as timer:
+        for batch in batches:
+            dataset.fetch(batch)
+    assert timer.duration is not None
+    return sum(map(len, batches)) / timer.duration.total_seconds()
+
+
+if __name__ == "__main__":
+    typer.run(main)
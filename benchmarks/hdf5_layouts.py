@@ -0,0 +1,98 @@
+"""Compare random and sequential fetch throughput of `HDF5NumpyCache` across layouts.
+
+Run from the repository root with `python -m benchmarks.hdf5_layouts --help` for the available options.
+"""
+
+import tempfile
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import typer
+from loguru import logger
+
+from boiling_learning.datasets.hdf5_cache import HDF5_FILE_POOL, HDF5NumpyCache
+from boiling_learning.datasets.sliceable import SliceableDataset
+from boiling_learning.utils.timing import Timer
+
+_LAYOUTS: dict[str, dict[str, Any]] = {
+    "contiguous": {},
+    "chunk-1": {"chunk_frames": 1},
+    "chunk-16": {"chunk_frames": 16},
+    "chunk-16-lzf": {"chunk_frames": 16, "compression": "lzf"},
+    "chunk-16-gzip": {"chunk_frames": 16, "compression": "gzip", "compression_opts": 1},
+}
+
+
+def main(
+    *,
+    frames: int = 10_000,
+    height: int = 128,
+    width: int = 128,
+    batch_size: int = 256,
+    chunk_cache_size: int = 64 * 2**20,
+    layout: list[str] = typer.Option(list(_LAYOUTS)),
+) -> None:
+    # per-store debug logs would dominate the measurements
+    logger.disable("boiling_learning")
+
+    rng = np.random.default_rng(0)
+    # smooth synthetic frames, so that compression has something to work with
+    ramp = np.linspace(0, 255, width, dtype=np.float32)
+    stack = (
+        (ramp + rng.normal(0, 8, size=(frames, height, width)))
+        .clip(0, 255)
+        .astype(np.uint8)
+    )
+    dataset = SliceableDataset.from_sequence(stack)
+
+    sequential_batches = [
+        range(start, min(start + batch_size, frames))
+        for start in range(0, frames, batch_size)
+    ]
+    random_batches = [
+        rng.choice(frames, size=batch_size, replace=False).tolist()
+        for _ in range(len(sequential_batches))
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name in layout:
+            if name not in _LAYOUTS:
+                raise typer.BadParameter(f"unsupported layout: {name}")
+
+            cache = HDF5NumpyCache(
+                Path(directory) / name,
+                shape=stack.shape,
+                dtype=stack.dtype,
+                chunk_cache_size=chunk_cache_size,
+                **_LAYOUTS[name],
+            )
+            cached = dataset.cache(cache)
+
+            write = _throughput(cached, sequential_batches)
+            sequential = _throughput(cached, sequential_batches)
+            random = _throughput(cached, random_batches)
+            size = (Path(directory) / name / "data.h5").stat().st_size
+
+            print(
+                f"{name}: write {write:.1f} frames/s, "
+                f"sequential {sequential:.1f} frames/s, "
+                f"random {random:.1f} frames/s, "
+                f"{size / 2**20:.1f} MiB"
+            )
+
+        HDF5_FILE_POOL.clear()
+
+
+def _throughput(
+    dataset: SliceableDataset[np.ndarray], batches: list[range] | list[list[int]]
+) -> float:
+    with Timer() as timer:
+        for batch in batches:
+            dataset.fetch(batch)
+    assert timer.duration is not None
+    return sum(map(len, batches)) / timer.duration.total_seconds()
+
+
+if __name__ == "__main__":
+    typer.run(main)
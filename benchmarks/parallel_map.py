@@ -0,0 +1,72 @@
+"""Compare serial and parallel `SliceableDataset.map` on a synthetic frame stack.
+
+Run from the repository root with `python -m benchmarks.parallel_map --help` for the available options.
+"""
+
+from typing import Literal
+
+import numpy as np
+import typer
+
+from boiling_learning.datasets.sliceable import SliceableDataset
+from boiling_learning.utils.timing import Timer
+
+
+def _preprocess(frame: np.ndarray) -> np.ndarray:
+    # a per-frame chain similar to the default preprocessors: convert to float, convert
+    # to grayscale, crop and downscale
+    image = frame.astype(np.float32) / 255
+    gray = image @ np.array([0.2989, 0.5870, 0.1140], dtype=np.float32)
+    height, width = gray.shape
+    cropped = gray[height // 4 : -height // 4, width // 4 : -width // 4]
+    return cropped.reshape(cropped.shape[0] // 4, 4, cropped.shape[1] // 4, 4).mean(
+        axis=(1, 3)
+    )
+
+
+def main(
+    *,
+    frames: int = 2048,
+    height: int = 512,
+    width: int = 512,
+    batch_size: int = 256,
+    num_parallel: list[int] = typer.Option([2, 4, 8]),
+    executor: list[str] = typer.Option(["thread", "process"]),
+) -> None:
+    rng = np.random.default_rng(0)
+    stack = rng.integers(0, 256, size=(frames, height, width, 3), dtype=np.uint8)
+    dataset = SliceableDataset.from_sequence(stack)
+
+    def _run(mapped: SliceableDataset[np.ndarray]) -> float:
+        with Timer() as timer:
+            for start in range(0, frames, batch_size):
+                mapped.fetch(range(start, min(start + batch_size, frames)))
+        assert timer.duration is not None
+        return frames / timer.duration.total_seconds()
+
+    serial = _run(dataset.map(_preprocess))
+    print(f"serial: {serial:.1f} frames/s")
+
+    for executor_kind in executor:
+        for workers in num_parallel:
+            parallel = _run(
+                dataset.map(
+                    _preprocess,
+                    num_parallel=workers,
+                    executor=_executor_kind(executor_kind),
+                )
+            )
+            print(
+                f"{executor_kind} x{workers}: {parallel:.1f} frames/s "
+                f"({parallel / serial:.2f}x)"
+            )
+
+
+def _executor_kind(executor: str) -> Literal["thread", "process"]:
+    if executor not in {"thread", "process"}:
+        raise typer.BadParameter(f"unsupported executor: {executor}")
+    return executor  # type: ignore[return-value]
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -1,5 +1,10 @@
+import atexit
+from pathlib import Path
+
 import typer
+from loguru import logger
 
+from boiling_learning.app import caches
 from boiling_learning.app.examples import image_standardization, uncertainties
 from boiling_learning.app.figures import (
     architectures,
@@ -35,8 +40,30 @@ from boiling_learning.app.studies import (
     visualization_window,
     visualization_window_multi_surface,
 )
+from boiling_learning.datasets.metrics import METRICS
 
 app = typer.Typer()
+
+
+@app.callback()
+def main(
+    dataset_metrics: bool = typer.Option(
+        False, help="Report cache and dataset metrics at the end of the run."
+    ),
+    dataset_metrics_jsonl: Path | None = typer.Option(
+        None, help="Also append the metrics to this JSON lines file after every epoch."
+    ),
+) -> None:
+    if dataset_metrics or dataset_metrics_jsonl is not None:
+        METRICS.enable(jsonl_path=dataset_metrics_jsonl)
+        atexit.register(_report_dataset_metrics)
+
+
+def _report_dataset_metrics() -> None:
+    METRICS.export(final=True)
+    logger.info(f"Dataset metrics:\n{METRICS.report()}")
+
+
 app.add_typer(animate.app, name="animate")
 app.add_typer(architectures.app, name="architectures")
 app.add_typer(automl.app, name="automl")
@@ -45,6 +72,7 @@ app.add_typer(automl_learning_curve.app, name="automl-learning-curve")
 app.add_typer(automl_strategies.app, name="automl-strategies")
 app.add_typer(automl_transfer_learning_curve.app, name="automl-transfer-learning-curve")
 app.add_typer(boiling_curve.app, name="boiling-curve")
+app.add_typer(caches.app, name="cache")
 app.add_typer(consecutive_frames.app, name="consecutive-frames")
 app.add_typer(cross_surface.app, name="cross-surface")
 app.add_typer(data_augmentation.app, name="data-augmentation")
@@ -0,0 +1,215 @@
+import concurrent.futures
+import functools
+import multiprocessing
+import os
+from typing import Any, Literal
+
+import tensorflow as tf
+import typer
+from rich.console import Console
+from rich.progress import Progress
+from rich.table import Table
+
+from boiling_learning.app import options
+from boiling_learning.app.datasets.generators import (
+    experiment_videos,
+    warm_frames_caches,
+)
+from boiling_learning.app.datasets.preprocessing import (
+    DEFAULT_DOWNSCALE_FACTOR,
+    default_boiling_preprocessors,
+    default_condensation_preprocessors,
+)
+from boiling_learning.app.datasets.raw.boiling1d import boiling_cases
+from boiling_learning.app.datasets.raw.condensation import condensation_datasets
+from boiling_learning.io.dataclasses import dataclass
+from boiling_learning.lazy import LazyDescribed
+from boiling_learning.preprocessing.experiment_video import ExperimentVideo
+from boiling_learning.preprocessing.experiment_video_dataset import (
+    ExperimentVideoDataset,
+)
+from boiling_learning.utils.timing import Timer
+
+app = typer.Typer()
+warm_app = typer.Typer(
+    help=(
+        "Precompute every frames cache stage, one video per worker process. "
+        "Interrupted runs resume from the frames already stored."
+    )
+)
+app.add_typer(warm_app, name="warm")
+console = Console()
+
+# every worker holds its own TensorFlow runtime and decoded videos in memory
+_DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+
+@warm_app.command()
+def boiling1d(
+    direct_visualization: bool = typer.Option(True, "--direct/--indirect"),
+    downscale_factor: int = typer.Option(DEFAULT_DOWNSCALE_FACTOR),
+    workers: int = typer.Option(_DEFAULT_WORKERS),
+    batch_size: int = typer.Option(64),
+    high_speed_cache: bool = typer.Option(False),
+) -> None:
+    _warm(
+        _WarmUpConfiguration(
+            experiment="boiling1d",
+            direct_visualization=direct_visualization,
+            downscale_factor=downscale_factor,
+            batch_size=batch_size,
+            high_speed_cache=high_speed_cache,
+        ),
+        workers=workers,
+    )
+
+
+@warm_app.command()
+def condensation(
+    downscale_factor: int = typer.Option(5),
+    workers: int = typer.Option(_DEFAULT_WORKERS),
+    batch_size: int = typer.Option(64),
+    high_speed_cache: bool = typer.Option(False),
+) -> None:
+    _warm(
+        _WarmUpConfiguration(
+            experiment="condensation",
+            downscale_factor=downscale_factor,
+            batch_size=batch_size,
+            high_speed_cache=high_speed_cache,
+        ),
+        workers=workers,
+    )
+
+
+@dataclass(frozen=True)
+class _WarmUpConfiguration:
+    experiment: Literal["boiling1d", "condensation"]
+    downscale_factor: int
+    batch_size: int
+    # warming every video at once would churn the size-bounded local caches
+    high_speed_cache: bool = False
+    direct_visualization: bool = True
+
+
+@dataclass(frozen=True)
+class _WarmUpTask:
+    configuration: _WarmUpConfiguration
+    dataset_index: int
+    video_name: str
+
+
+@dataclass(frozen=True)
+class _WarmUpResult:
+    video_name: str
+    computed_frames: int
+    seconds: float
+
+
+def _warm(configuration: _WarmUpConfiguration, *, workers: int) -> None:
+    # videos are listed up front, so that workers only read the cached listings
+    tasks = [
+        _WarmUpTask(configuration, dataset_index, video_name)
+        for dataset_index in range(len(_datasets(configuration.experiment)))
+        for video_name in _videos(configuration.experiment, dataset_index)
+    ]
+
+    results: list[_WarmUpResult] = []
+    # TensorFlow does not survive `fork`, so workers are started from scratch
+    context = multiprocessing.get_context("spawn")
+    with (
+        Timer() as timer,
+        Progress(console=console) as progress,
+        concurrent.futures.ProcessPoolExecutor(
+            workers,
+            mp_context=context,
+            initializer=_initialize_worker,
+            initargs=(configuration,),
+        ) as executor,
+    ):
+        progress_task = progress.add_task("Warming caches", total=len(tasks))
+        futures = [executor.submit(_warm_video, task) for task in tasks]
+        for future in concurrent.futures.as_completed(futures):
+            results.append(future.result())
+            progress.advance(progress_task)
+
+    assert timer.duration is not None
+    _print_summary(results, seconds=timer.duration.total_seconds())
+
+
+def _initialize_worker(configuration: _WarmUpConfiguration) -> None:
+    # preprocessing runs on the CPU; otherwise every worker would claim the GPU memory
+    tf.config.set_visible_devices([], "GPU")
+    options.USE_HIGH_SPEED_FRAMES_CACHE = configuration.high_speed_cache
+
+
+def _warm_video(task: _WarmUpTask) -> _WarmUpResult:
+    configuration = task.configuration
+    with Timer() as timer:
+        computed_frames = warm_frames_caches(
+            _videos(configuration.experiment, task.dataset_index)[task.video_name],
+            _preprocessors(configuration),
+            experiment=configuration.experiment,
+            batch_size=configuration.batch_size,
+        )
+
+    assert timer.duration is not None
+    return _WarmUpResult(
+        task.video_name, computed_frames, timer.duration.total_seconds()
+    )
+
+
+def _datasets(
+    experiment: Literal["boiling1d", "condensation"],
+) -> tuple[LazyDescribed[ExperimentVideoDataset], ...]:
+    return boiling_cases() if experiment == "boiling1d" else condensation_datasets()
+
+
+@functools.cache
+def _videos(
+    experiment: Literal["boiling1d", "condensation"], dataset_index: int
+) -> dict[str, ExperimentVideo]:
+    dataset = _datasets(experiment)[dataset_index]()
+    return {
+        video.name: video for video in experiment_videos(dataset, experiment=experiment)
+    }
+
+
+def _preprocessors(configuration: _WarmUpConfiguration) -> list[Any]:
+    # the same preprocessors as the studies use, so that the same caches are filled
+    if configuration.experiment == "boiling1d":
+        return default_boiling_preprocessors(
+            direct_visualization=configuration.direct_visualization,
+            downscale_factor=configuration.downscale_factor,
+        )
+    return default_condensation_preprocessors(
+        downscale_factor=configuration.downscale_factor
+    )
+
+
+def _print_summary(results: list[_WarmUpResult], *, seconds: float) -> None:
+    computed_frames = sum(result.computed_frames for result in results)
+    warm_videos = sum(not result.computed_frames for result in results)
+
+    table = Table("Videos", "Already warm", "Computed frames", "Time", "Throughput")
+    table.add_row(
+        str(len(results)),
+        str(warm_videos),
+        str(computed_frames),
+        f"{seconds:.1f} s",
+        f"{computed_frames / seconds:.1f} frames/s" if seconds else "-",
+    )
+    console.print(table)
+
+    computing = [result for result in results if result.computed_frames]
+    slowest = sorted(computing, key=lambda result: result.seconds, reverse=True)[:5]
+    if slowest:
+        table = Table("Slowest videos", "Computed frames", "Time", "Throughput")
+        for result in slowest:
+            table.add_row(
+                result.video_name,
+                str(result.computed_frames),
+                f"{result.seconds:.1f} s",
+                f"{result.computed_frames / result.seconds:.1f} frames/s",
+            )
+        console.print(table)
@@ -1,5 +1,7 @@
+from collections.abc import Mapping
 from typing import Any
 
+import numpy as np
 import tensorflow as tf
 
 from boiling_learning.app.datasets.bridging import to_tensorflow_triplet
@@ -24,6 +26,20 @@ DEFAULT_BOILING_OUTLIER_FILTER = LazyDescribed.from_value_and_description(
     _boiling_outlier_filter,
     f"abs(Power [W] - nominal_power) < {BOILING_OUTLIER_THRESHOLD}",
 )
+
+
+def _boiling_outlier_targets_filter(targets: Mapping[str, np.ndarray]) -> np.ndarray:
+    return (
+        np.abs(targets["Power [W]"] - targets["nominal_power"])
+        < BOILING_OUTLIER_THRESHOLD
+    )
+
+
+DEFAULT_BOILING_OUTLIER_TARGETS_FILTER = LazyDescribed.from_value_and_description(
+    _boiling_outlier_targets_filter,
+    f"abs(Power [W] - nominal_power) < {BOILING_OUTLIER_THRESHOLD}",
+)
+"""Vectorized version of `DEFAULT_BOILING_OUTLIER_FILTER` over columns of targets."""
 DEFAULT_BOILING_HEAT_FLUX_TARGET = "Flux [W/cm**2]"
 
 
@@ -35,7 +51,7 @@ def default_boiling_bridging(
 ) -> DatasetTriplet[LazyDescribed[tf.data.Dataset]]:
     ds_train, ds_val, ds_test = to_tensorflow_triplet(
         dataset,
-        prefilterer=DEFAULT_BOILING_OUTLIER_FILTER,
+        targets_prefilterer=DEFAULT_BOILING_OUTLIER_TARGETS_FILTER,
         batch_size=batch_size,
         target=target,
         experiment="boiling1d",
@@ -52,10 +68,11 @@ def default_boiling_bridging_gt10(
 ) -> DatasetTriplet[LazyDescribed[tf.data.Dataset]]:
     ds_train, ds_val, ds_test = to_tensorflow_triplet(
         dataset,
-        prefilterer=DEFAULT_BOILING_OUTLIER_FILTER,
+        targets_prefilterer=DEFAULT_BOILING_OUTLIER_TARGETS_FILTER,
         filterer=(
-            lambda _frame, data: data[DEFAULT_BOILING_HEAT_FLUX_TARGET]
-            >= NON_ZERO_POWER_THRESHOLD
+            lambda _frame, data: (
+                data[DEFAULT_BOILING_HEAT_FLUX_TARGET] >= NON_ZERO_POWER_THRESHOLD
+            )
         ),
         batch_size=batch_size,
         target=target,
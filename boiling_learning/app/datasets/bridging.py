@@ -1,5 +1,6 @@
-from collections.abc import Callable
-from functools import cache, partial
+import functools
+from collections.abc import Callable, Mapping
+from functools import partial
 from typing import Literal
 
 import numpy as np
@@ -7,9 +8,19 @@ import tensorflow as tf
 from loguru import logger
 
 from boiling_learning.app.constants import high_speed_cache_path
-from boiling_learning.app.options import PREFETCH_BUFFER_SIZE, USE_HIGH_SPEED_CACHE
+from boiling_learning.app.options import (
+    PREFETCH_BUFFER_SIZE,
+    PREFETCH_IN_FLIGHT_BUFFERS,
+    USE_HIGH_SPEED_CACHE,
+)
 from boiling_learning.app.paths import shared_cache_path
 from boiling_learning.datasets.bridging import sliceable_dataset_to_tensorflow_dataset
+from boiling_learning.datasets.sliceable import (
+    SliceableDataset,
+    features,
+    filter_targets,
+    targets,
+)
 from boiling_learning.datasets.splits import DatasetTriplet
 from boiling_learning.image_datasets import (
     Image,
@@ -19,6 +30,7 @@ from boiling_learning.image_datasets import (
 )
 from boiling_learning.lazy import LazyDescribed
 from boiling_learning.management.allocators import JSONAllocator
+from boiling_learning.management.cacher import cache
 from boiling_learning.transforms import subset
 
 
@@ -28,27 +40,39 @@ def to_tensorflow(
     experiment: Literal["boiling1d", "condensation"],
     batch_size: int | None = None,
     prefilterer: LazyDescribed[Callable[[Image, Targets], bool]] | None = None,
+    targets_prefilterer: (
+        LazyDescribed[Callable[[Mapping[str, np.ndarray]], np.ndarray]] | None
+    ) = None,
     filterer: Callable[..., bool] | None = None,
     target: str | None = None,
     shuffle: bool | int = True,
 ) -> LazyDescribed[tf.data.Dataset]:
-    dataset_value = dataset()
-
-    default_prefilterer = _default_filter_for_frames_dataset(dataset_value)
+    dataset_value = (
+        dataset()
+        if targets_prefilterer is None
+        else _filter_by_targets(dataset, targets_prefilterer, experiment=experiment)
+    )
 
     def _prefilterer(element: tuple[Image, Targets]) -> bool:
         image, targets = element
-        return default_prefilterer(image, targets) and (
-            prefilterer is None or prefilterer()(image, targets)
-        )
+        return prefilterer is None or prefilterer()(image, targets)
 
     if shuffle is True:
         dataset_value = dataset_value.shuffle()
 
+    # the targets prefilterer is only part of the keys when given, so that the datasets
+    # and models of callers that do not use it are not invalidated
+    targets_prefiltering = (
+        {}
+        if targets_prefilterer is None
+        else {"targets_prefilterer": targets_prefilterer}
+    )
+
     save_path = _training_datasets_allocator(experiment).allocate(
         dataset,
         prefilterer,
         shuffle,
+        **targets_prefiltering,
     )
 
     logger.debug(f"Converting dataset to TF and saving to {save_path}")
@@ -58,11 +82,14 @@ def to_tensorflow(
         save_path=save_path,
         cache=True,
         batch_size=batch_size,
-        prefilterer=_prefilterer,
+        prefilterer=None if prefilterer is None else _prefilterer,
+        column_prefilterer=_default_filter_for_frames_dataset,
         filterer=filterer,
         prefetch=PREFETCH_BUFFER_SIZE,
+        prefetch_in_flight=PREFETCH_IN_FLIGHT_BUFFERS,
         deterministic=False,
         target=target,
+        columnar=True,
     )
 
     if shuffle and shuffle is not True:
@@ -73,6 +100,7 @@ def to_tensorflow(
         (
             dataset,
             ("prefilterer", prefilterer),
+            *targets_prefiltering.items(),
             ("batch", batch_size),
             ("target", target),
         ),
@@ -85,6 +113,9 @@ def to_tensorflow_triplet(
     experiment: Literal["boiling1d", "condensation"],
     batch_size: int | None = None,
     prefilterer: LazyDescribed[Callable[[Image, Targets], bool]] | None = None,
+    targets_prefilterer: (
+        LazyDescribed[Callable[[Mapping[str, np.ndarray]], np.ndarray]] | None
+    ) = None,
     filterer: Callable[..., bool] | None = None,
     target: str | None = None,
     shuffle: bool | int = True,
@@ -93,6 +124,7 @@ def to_tensorflow_triplet(
         to_tensorflow,
         batch_size=batch_size,
         prefilterer=prefilterer,
+        targets_prefilterer=targets_prefilterer,
         filterer=filterer,
         target=target,
         shuffle=shuffle,
@@ -108,7 +140,7 @@ def to_tensorflow_triplet(
     return DatasetTriplet(ds_train, ds_val, ds_test)
 
 
-@cache
+@functools.cache
 def _training_datasets_allocator(
     experiment: Literal["boiling1d", "condensation"],
 ) -> JSONAllocator:
@@ -118,11 +150,49 @@ def _training_datasets_allocator(
     return JSONAllocator(cache_path / "datasets" / "training" / experiment)
 
 
-def _default_filter_for_frames_dataset(
-    dataset: ImageDataset,
-) -> Callable[[Image, Targets], bool]:
-    def _pred(image: Image, _targets: Targets) -> bool:
-        first_frame, _first_targets = dataset[0]
-        return image.shape == first_frame.shape and not np.allclose(image, 0)
+def _filter_by_targets(
+    dataset: LazyDescribed[ImageDataset],
+    predicate: LazyDescribed[Callable[[Mapping[str, np.ndarray]], np.ndarray]],
+    *,
+    experiment: Literal["boiling1d", "condensation"],
+) -> ImageDataset:
+    indices = _filtered_indices_getter(experiment)(dataset, predicate)
+    return dataset()[indices]
+
+
+@functools.cache
+def _filtered_indices_getter(
+    experiment: Literal["boiling1d", "condensation"],
+) -> Callable[
+    [
+        LazyDescribed[ImageDataset],
+        LazyDescribed[Callable[[Mapping[str, np.ndarray]], np.ndarray]],
+    ],
+    list[int],
+]:
+    @cache(
+        JSONAllocator(
+            shared_cache_path() / "datasets" / "filtered-indices" / experiment
+        )
+    )
+    def _filtered_indices(
+        dataset: LazyDescribed[ImageDataset],
+        predicate: LazyDescribed[Callable[[Mapping[str, np.ndarray]], np.ndarray]],
+    ) -> list[int]:
+        dataset_value = dataset()
+        indexed_targets = SliceableDataset.zip(
+            SliceableDataset.range(len(dataset_value)), targets(dataset_value)
+        )
+        filtered = filter_targets(indexed_targets, predicate())
+        return [int(index) for index in features(filtered).fetch()]
+
+    return _filtered_indices
 
-    return _pred
+
+def _default_filter_for_frames_dataset(
+    columns: tuple[np.ndarray, Mapping[str, np.ndarray]],
+) -> np.ndarray:
+    # frames of a different shape never reach the columns, so only blank frames are
+    # left to be dropped
+    images, _targets = columns
+    return ~np.isclose(images, 0).all(axis=tuple(range(1, images.ndim)))
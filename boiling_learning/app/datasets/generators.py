@@ -1,18 +1,26 @@
 import functools
+import shutil
 from collections.abc import Callable, Iterable
 from fractions import Fraction
 from pathlib import Path
-from typing import Literal
+from typing import BinaryIO, Literal
 
 import funcy
+import more_itertools as mit
 import numpy as np
 import pandas as pd
+from loguru import logger
 
 from boiling_learning.app import options
-from boiling_learning.app.datasets.multimap import MultiMapSliceableDataset
+from boiling_learning.app.constants import high_speed_cache_path
 from boiling_learning.app.paths import analyses_path, shared_cache_path
+from boiling_learning.datasets.cache import ByteBudget, MemoryCache, TieredCache
 from boiling_learning.datasets.hdf5_cache import HDF5NumpyCache
-from boiling_learning.datasets.sliceable import SliceableDataset
+from boiling_learning.datasets.sliceable import (
+    SliceableDataset,
+    SliceableDatasetCache,
+    unzip,
+)
 from boiling_learning.datasets.splits import DatasetSplits, DatasetTriplet
 from boiling_learning.image_datasets import (
     Image,
@@ -32,6 +40,7 @@ from boiling_learning.preprocessing.extract import ExtractedFramesDataset
 from boiling_learning.preprocessing.image import image_dtype_converter
 from boiling_learning.preprocessing.transformers import Transformer
 from boiling_learning.transforms import map_transformers
+from boiling_learning.utils.locking import file_lock, lock_file
 from boiling_learning.utils.random import random_state
 
 
@@ -50,9 +59,7 @@ def get_image_dataset(
     shuffle: bool = True,
     cache_stages: tuple[int, ...] | None = None,
 ) -> LazyDescribed[ImageDatasetTriplet]:
-    purged_experiment_videos = _experiment_video_purger(experiment=experiment)(
-        image_dataset
-    )
+    purged_experiment_videos = experiment_videos(image_dataset, experiment=experiment)
 
     ds_train_list = []
     ds_val_list = []
@@ -79,10 +86,14 @@ def get_image_dataset(
         ds_val_list.append(ev_val)
         ds_test_list.append(ev_test)
 
-    # TODO: re-add memory caching here
-    ds_train = SliceableDataset.concatenate(*ds_train_list)  # .cache(MemoryCache())
-    ds_val = SliceableDataset.concatenate(*ds_val_list)  # .cache(MemoryCache())
-    ds_test = SliceableDataset.concatenate(*ds_test_list)  # .cache(MemoryCache())
+    ds_train = SliceableDataset.concatenate(*ds_train_list)
+    ds_val = SliceableDataset.concatenate(*ds_val_list)
+    ds_test = SliceableDataset.concatenate(*ds_test_list)
+
+    if options.MEMORY_CACHE_MAX_BYTES is not None:
+        # the validation set is re-read every epoch, so it benefits the most from a
+        # bounded in-memory cache in front of the frame caches
+        ds_val = ds_val.cache(MemoryCache(max_bytes=options.MEMORY_CACHE_MAX_BYTES))
 
     return LazyDescribed.from_value_and_description(
         DatasetTriplet(ds_train, ds_val, ds_test),
@@ -116,6 +127,45 @@ def compile_transformers(
     )
 
 
+def experiment_videos(
+    image_dataset: ExperimentVideoDataset,
+    *,
+    experiment: Literal["boiling1d", "condensation"],
+) -> list[ExperimentVideo]:
+    """Return the videos of `image_dataset` that have data, sorted by name."""
+    return _experiment_video_purger(experiment=experiment)(image_dataset)
+
+
+def warm_frames_caches(
+    experiment_video: ExperimentVideo,
+    transformers: Iterable[
+        list[Transformer[Image, Image] | dict[str, Transformer[Image, Image]]]
+    ],
+    *,
+    experiment: Literal["boiling1d", "condensation"],
+    batch_size: int = 64,
+) -> int:
+    """Fill every cache stage of the frames of `experiment_video`.
+
+    Only the frames missing from the last stage are computed, in batches that are stored
+    as soon as they are ready, so an interrupted warm-up resumes where it stopped.
+    Return the number of frames computed.
+    """
+    frames = _described_video_dataset_from_video_and_transformers(
+        experiment_video, transformers, experiment=experiment
+    )
+    missing = sorted(
+        _shared_frames_cache(frames, experiment=experiment).missing_indices(
+            range(len(frames()))
+        )
+    )
+
+    for batch in mit.chunked(missing, batch_size):
+        frames().fetch(batch)
+
+    return len(missing)
+
+
 def _experiment_video_purger(
     *, experiment: Literal["boiling1d", "condensation"]
 ) -> Callable[[ExperimentVideoDataset], list[ExperimentVideo]]:
@@ -217,6 +267,23 @@ def _video_dataset_from_video_and_transformers(
     experiment: Literal["boiling1d", "condensation"],
     cache_stages: tuple[int, ...] | None = None,
 ) -> SliceableDataset[Image]:
+    return _described_video_dataset_from_video_and_transformers(
+        experiment_video,
+        transformers,
+        experiment=experiment,
+        cache_stages=cache_stages,
+    )()
+
+
+def _described_video_dataset_from_video_and_transformers(
+    experiment_video: ExperimentVideo,
+    transformers: Iterable[
+        list[Transformer[Image, Image] | dict[str, Transformer[Image, Image]]]
+    ],
+    *,
+    experiment: Literal["boiling1d", "condensation"],
+    cache_stages: tuple[int, ...] | None = None,
+) -> LazyDescribed[SliceableDataset[Image]]:
     if options.EXTRACT_FRAMES:
         extracted_frames_directory = _extracted_frames_directory_allocator(
             experiment
@@ -244,10 +311,7 @@ def _video_dataset_from_video_and_transformers(
                 else transformer
             )
             mapped_frames = (
-                MultiMapSliceableDataset(
-                    compiled_transformer,
-                    frames(),
-                )
+                frames().map_batched(compiled_transformer)
                 if _should_be_multimapped(compiled_transformer)
                 else frames().map(compiled_transformer)
             )
@@ -255,22 +319,129 @@ def _video_dataset_from_video_and_transformers(
                 mapped_frames, described_frames
             )
         if cache_stages is None or index in cache_stages:
-            video_info = _video_info_getter()(frames)
-            numpy_cache_directory = _numpy_directory_allocator(experiment).allocate(
-                frames
-            )
             frames = LazyDescribed.from_value_and_description(
-                frames().cache(
-                    HDF5NumpyCache(
-                        numpy_cache_directory,
-                        shape=(video_info.length, *video_info.shape),
-                        dtype=np.dtype(video_info.dtype),
-                    )
-                ),
+                frames().cache(_frames_cache(frames, experiment=experiment)),
                 frames,
             )
 
-    return frames()
+    return frames
+
+
+def _frames_cache(
+    frames: LazyDescribed[SliceableDataset[Image]],
+    *,
+    experiment: Literal["boiling1d", "condensation"],
+) -> SliceableDatasetCache[Image]:
+    shared_cache = _shared_frames_cache(frames, experiment=experiment)
+    if not options.USE_HIGH_SPEED_FRAMES_CACHE:
+        return shared_cache
+
+    video_info = _video_info_getter()(frames)
+    shape = (video_info.length, *video_info.shape)
+    dtype = np.dtype(video_info.dtype)
+
+    local_allocator = _high_speed_numpy_directory_allocator(experiment)
+    local_directory = local_allocator.allocate(frames)
+    # marked before pruning, so that the directory about to be used is never pruned
+    _mark_in_use(local_directory)
+    budget = _high_speed_frames_budget(local_allocator.path)
+
+    local_cache = HDF5NumpyCache(local_directory, shape=shape, dtype=dtype)
+    (local_directory / _LAST_USED_FILE_NAME).touch()
+    budgets = {} if budget is None else {local_cache: budget}
+
+    if options.FRAMES_MEMORY_CACHE_MAX_BYTES is None:
+        return TieredCache(local_cache, shared_cache, budgets=budgets)
+
+    return TieredCache(
+        MemoryCache(max_bytes=options.FRAMES_MEMORY_CACHE_MAX_BYTES),
+        local_cache,
+        shared_cache,
+        budgets=budgets,
+    )
+
+
+def _shared_frames_cache(
+    frames: LazyDescribed[SliceableDataset[Image]],
+    *,
+    experiment: Literal["boiling1d", "condensation"],
+) -> HDF5NumpyCache:
+    video_info = _video_info_getter()(frames)
+    return HDF5NumpyCache(
+        _numpy_directory_allocator(experiment).allocate(frames),
+        shape=(video_info.length, *video_info.shape),
+        dtype=np.dtype(video_info.dtype),
+    )
+
+
+_LAST_USED_FILE_NAME = "last-used"
+_IN_USE_FILE_NAME = ".in-use"
+_PRUNING_LOCK_FILE_NAME = ".pruning.lock"
+
+_IN_USE_FILES: dict[Path, BinaryIO] = {}
+"""Files holding a shared lock on every local frames cache used by this process."""
+
+
+def _mark_in_use(directory: Path) -> None:
+    """Keep `directory` from being pruned for as long as this process runs."""
+    if directory not in _IN_USE_FILES:
+        _IN_USE_FILES[directory] = lock_file(directory / _IN_USE_FILE_NAME, shared=True)
+
+
+@functools.cache
+def _high_speed_frames_budget(root: Path) -> ByteBudget | None:
+    """Prune the local frames caches under `root` and return what is left to fill.
+
+    Pruning only happens once per process and root, under a lock shared by every
+    process, and the bytes left are then reserved by the promotions of this process.
+    """
+    if (max_bytes := options.HIGH_SPEED_FRAMES_CACHE_MAX_BYTES) is None:
+        return None
+
+    with file_lock(root / _PRUNING_LOCK_FILE_NAME)():
+        used_bytes = _prune_high_speed_frames_caches(root, max_bytes=max_bytes)
+    return ByteBudget(max_bytes, used_bytes=used_bytes)
+
+
+def _prune_high_speed_frames_caches(root: Path, *, max_bytes: int) -> int:
+    """Delete the least recently used local frames caches until they fit `max_bytes`.
+
+    Local copies can always be restored from the shared cache, so they are safe to
+    delete, unless some process is still using them. Return the bytes left on disk.
+    """
+    sizes = {
+        directory: _disk_usage(directory)
+        for directory in root.iterdir()
+        if directory.is_dir()
+    }
+    total = sum(sizes.values())
+
+    for directory in sorted(sizes, key=_last_used):
+        if total <= max_bytes:
+            break
+
+        try:
+            in_use = lock_file(directory / _IN_USE_FILE_NAME, blocking=False)
+        except BlockingIOError:
+            logger.debug(f"Not pruning high-speed frames cache {directory}: in use")
+            continue
+
+        with in_use:
+            logger.info(f"Pruning high-speed frames cache {directory}")
+            shutil.rmtree(directory)
+        total -= sizes[directory]
+
+    return total
+
+
+def _disk_usage(directory: Path) -> int:
+    # sparse files only count the blocks that were actually written
+    return sum(path.stat().st_blocks * 512 for path in directory.rglob("*"))
+
+
+def _last_used(directory: Path) -> float:
+    last_used_path = directory / _LAST_USED_FILE_NAME
+    return (last_used_path if last_used_path.is_file() else directory).stat().st_mtime
 
 
 @functools.cache
@@ -287,6 +458,13 @@ def _numpy_directory_allocator(
     return JSONAllocator(analyses_path() / "datasets" / "numpy" / experiment)
 
 
+@functools.cache
+def _high_speed_numpy_directory_allocator(
+    experiment: Literal["boiling1d", "condensation"],
+) -> JSONAllocator:
+    return JSONAllocator(high_speed_cache_path() / "datasets" / "numpy" / experiment)
+
+
 @dataclass
 class VideoInfo:
     length: int
@@ -311,15 +489,18 @@ def _video_info_getter() -> Callable[[SliceableDataset[Image]], VideoInfo]:
 def _add_indices_to_targets(
     dataset: ImageDataset, /, *, current_size: int
 ) -> ImageDataset:
-    return dataset.enumerate(start=current_size).map(_convert_enumerate_index_to_target)
+    # keep images and targets in separate branches so that `features` and `targets`
+    # can project the dataset without touching the other branch
+    images, targets = unzip(dataset)
+    indexed_targets = targets.enumerate(start=current_size).map(
+        _convert_enumerate_index_to_target
+    )
+    return SliceableDataset.zip(images, indexed_targets)
 
 
-def _convert_enumerate_index_to_target(
-    element: tuple[int, tuple[Image, Targets]],
-) -> tuple[Image, Targets]:
-    index, (image, targets) = element
-    expanded_targets = targets | {"index": index}
-    return image, expanded_targets
+def _convert_enumerate_index_to_target(element: tuple[int, Targets]) -> Targets:
+    index, targets = element
+    return targets | {"index": index}
 
 
 def _should_be_multimapped(transformer: Transformer[Image, Image]) -> bool:
@@ -1,3 +1,8 @@
 PREFETCH_BUFFER_SIZE = 2048 * 2
+PREFETCH_IN_FLIGHT_BUFFERS = 2
 EXTRACT_FRAMES = True
 USE_HIGH_SPEED_CACHE = True
+MEMORY_CACHE_MAX_BYTES: int | None = None
+USE_HIGH_SPEED_FRAMES_CACHE = False
+HIGH_SPEED_FRAMES_CACHE_MAX_BYTES: int | None = 256 * 2**30
+FRAMES_MEMORY_CACHE_MAX_BYTES: int | None = None
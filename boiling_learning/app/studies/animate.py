@@ -5,7 +5,7 @@ import typer
 
 from boiling_learning.app.constants import BOILING_BASELINE_BATCH_SIZE
 from boiling_learning.app.datasets.bridged.boiling1d import (
-    DEFAULT_BOILING_OUTLIER_FILTER,
+    DEFAULT_BOILING_OUTLIER_TARGETS_FILTER,
 )
 from boiling_learning.app.datasets.bridging import to_tensorflow_triplet
 from boiling_learning.app.datasets.preprocessed.boiling1d import boiling_datasets
@@ -75,7 +75,7 @@ def _tensorflow_datasets(
         .as_numpy_iterator()
         for subset in to_tensorflow_triplet(
             dataset,
-            prefilterer=DEFAULT_BOILING_OUTLIER_FILTER,
+            targets_prefilterer=DEFAULT_BOILING_OUTLIER_TARGETS_FILTER,
             batch_size=BOILING_BASELINE_BATCH_SIZE,
             experiment="boiling1d",
             shuffle=False,
@@ -39,7 +39,7 @@ def boiling1d() -> None:
                 [
                     (target["nominal_power"], target[DEFAULT_BOILING_HEAT_FLUX_TARGET])
                     for subset in dataset()
-                    for target in targets(subset.prefetch(1024))
+                    for target in targets(subset).prefetch(1024)
                     if DEFAULT_BOILING_OUTLIER_FILTER()(None, target)
                 ],
                 columns=["nominal power", "heat flux"],
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
-from collections.abc import Callable, Hashable, Mapping
+from collections.abc import Callable, Hashable, Iterator, Mapping, Sequence
 from functools import partial
-from typing import TypeVar
+from typing import Any, TypeVar
 
 import funcy
+import numpy as np
 import tensorflow as tf
 from loguru import logger
 
@@ -29,16 +30,47 @@ def sliceable_dataset_to_tensorflow_dataset(
     save_path: PathLike | None = None,
     batch_size: int | None = None,
     prefilterer: Callable[[_T], bool] | None = None,
+    column_prefilterer: Callable[[Any], np.ndarray] | None = None,
     filterer: Callable[..., bool] | None = None,
     prefetch: int = 0,
+    prefetch_in_flight: int = 0,
     deterministic: bool = False,
     target: str | None = None,
+    columnar: bool = False,
+    input_context: tf.distribute.InputContext | None = None,
 ) -> tf.data.Dataset:
+    if column_prefilterer is not None and not columnar:
+        raise ValueError("a column prefilterer requires a columnar conversion")
+
+    # shards may be empty, so the element spec is taken from the whole dataset
+    spec_dataset = dataset
+    if input_context is not None:
+        # each input pipeline reads only its own shard
+        dataset = dataset.shard(
+            input_context.num_input_pipelines, input_context.input_pipeline_id
+        )
+        if save_path is not None:
+            save_path = resolve(save_path)
+            save_path = save_path.with_name(
+                f"{save_path.name}-shard{input_context.input_pipeline_id}"
+                f"-of-{input_context.num_input_pipelines}"
+            )
+
+    creator = (
+        partial(
+            _create_columnar_tensorflow_dataset,
+            column_prefilterer=column_prefilterer,
+        )
+        if columnar
+        else _create_tensorflow_dataset
+    )
     creator = partial(
-        _create_tensorflow_dataset,
+        creator,
         dataset,
+        spec_dataset=spec_dataset,
         prefilterer=prefilterer,
         prefetch=prefetch,
+        prefetch_in_flight=prefetch_in_flight,
     )
 
     if save_path is None:
@@ -90,6 +122,22 @@ def sliceable_dataset_to_tensorflow_dataset(
     return ds
 
 
+def distribute_sliceable_dataset(
+    strategy: tf.distribute.Strategy,
+    dataset: SliceableDataset[_T],
+    **kwargs: Any,
+) -> tf.distribute.DistributedDataset:
+    """Distribute a dataset so that each input pipeline converts only its own shard.
+
+    Keyword arguments are forwarded to `sliceable_dataset_to_tensorflow_dataset`.
+    """
+    return strategy.distribute_datasets_from_function(
+        lambda input_context: sliceable_dataset_to_tensorflow_dataset(
+            dataset, input_context=input_context, **kwargs
+        )
+    )
+
+
 def _make_reader_func(
     *, deterministic: bool = True
 ) -> Callable[[tf.data.Dataset], tf.data.Dataset]:
@@ -106,18 +154,103 @@ def _make_reader_func(
 def _create_tensorflow_dataset(
     dataset: SliceableDataset[_T],
     *,
+    spec_dataset: SliceableDataset[_T],
     prefilterer: Callable[[_T], bool] | None = None,
     prefetch: int = 0,
+    prefetch_in_flight: int = 0,
 ) -> tf.data.Dataset:
     if prefetch:
-        dataset = dataset.prefetch(prefetch)
+        dataset = dataset.prefetch(prefetch, in_flight=prefetch_in_flight)
 
     return tf.data.Dataset.from_generator(
         lambda: iter(dataset if prefilterer is None else filter(prefilterer, dataset)),
-        output_signature=auto_spec(dataset[0]),
+        output_signature=auto_spec(spec_dataset[0]),
     )
 
 
+def _create_columnar_tensorflow_dataset(
+    dataset: SliceableDataset[_T],
+    *,
+    spec_dataset: SliceableDataset[_T],
+    prefilterer: Callable[[_T], bool] | None = None,
+    column_prefilterer: Callable[[Any], np.ndarray] | None = None,
+    prefetch: int = 0,
+    prefetch_in_flight: int = 0,
+) -> tf.data.Dataset:
+    spec = auto_spec(spec_dataset[0])
+    buffers = (
+        SliceableDataset.range(len(dataset))
+        .batch(prefetch or max(len(dataset), 1))
+        .map(partial(_fetch_columns, dataset, spec=spec, prefilterer=prefilterer))
+    )
+    if prefetch_in_flight:
+        buffers = buffers.prefetch(1, in_flight=prefetch_in_flight)
+
+    def _generate() -> Iterator[NestedStructure[np.ndarray]]:
+        for columns in buffers:
+            yield (
+                columns
+                if column_prefilterer is None
+                else _filter_columns(columns, column_prefilterer(columns))
+            )
+
+    return tf.data.Dataset.from_generator(
+        _generate,
+        output_signature=tf.nest.map_structure(_batched_spec, spec),
+    ).unbatch()
+
+
+def _fetch_columns(
+    dataset: SliceableDataset[_T],
+    indices: Sequence[int],
+    *,
+    spec: NestedTypeSpec,
+    prefilterer: Callable[[_T], bool] | None = None,
+) -> NestedStructure[np.ndarray]:
+    if prefilterer is None:
+        try:
+            return dataset.fetch_columns(indices)
+        except ValueError:
+            # elements of different shapes cannot be stacked, take the row path below
+            pass
+
+    rows = dataset.fetch(indices)
+    if prefilterer is not None:
+        rows = [row for row in rows if prefilterer(row)]
+
+    # rows that do not match the element spec could not be delivered anyway
+    fitting = [row for row in rows if _fits_spec(row, spec)]
+    if len(fitting) < len(rows):
+        logger.warning(
+            f"Dropping {len(rows) - len(fitting)} elements that do not match {spec}"
+        )
+
+    if not fitting:
+        return tf.nest.map_structure(_empty_column, spec)
+    return SliceableDataset.from_sequence(fitting).fetch_columns()
+
+
+def _fits_spec(element: Any, spec: NestedTypeSpec) -> bool:
+    return all(
+        spec_leaf.shape.is_compatible_with(np.shape(leaf))
+        for leaf, spec_leaf in zip(tf.nest.flatten(element), tf.nest.flatten(spec))
+    )
+
+
+def _empty_column(spec: tf.TensorSpec) -> np.ndarray:
+    return np.empty((0, *spec.shape), dtype=spec.dtype.as_numpy_dtype)
+
+
+def _filter_columns(
+    columns: NestedStructure[np.ndarray], mask: np.ndarray
+) -> NestedStructure[np.ndarray]:
+    return tf.nest.map_structure(lambda column: column[mask], columns)
+
+
+def _batched_spec(spec: tf.TensorSpec) -> tf.TensorSpec:
+    return tf.TensorSpec((None, *spec.shape), spec.dtype)
+
+
 def auto_spec(elem: NestedTensorLike) -> NestedTypeSpec:
     try:
         return tf.type_spec_from_value(elem)
@@ -1,17 +1,29 @@
 from __future__ import annotations
 
 import abc
+import collections
+import contextlib
+import dataclasses
 import json as _json
-from collections.abc import Iterable, Sequence
+import sys
+import threading
+from collections.abc import Iterable, Mapping, Sequence
 from pathlib import Path
-from typing import Literal, TypeVar
+from typing import Any, TypeVar
 
 import numpy as np
 from loguru import logger
 
-from boiling_learning.datasets.sliceable import SliceableDataset, SliceableDatasetCache
+from boiling_learning.datasets.codecs import FrameCodec
+from boiling_learning.datasets.metrics import METRICS
+from boiling_learning.datasets.sliceable import (
+    SliceableDataset,
+    SliceableDatasetCache,
+    check_output_length,
+)
 from boiling_learning.image_datasets import Image, Images
 from boiling_learning.utils.iterutils import unsort
+from boiling_learning.utils.locking import file_lock
 from boiling_learning.utils.pathutils import PathLike, resolve
 
 _Any = TypeVar("_Any")
@@ -38,7 +50,9 @@ class NoCache(SliceableDatasetCache[_Any]):
         source: SliceableDataset[_Any],
         indices: Iterable[int] | None = None,
     ) -> Sequence[_Any]:
-        return source.fetch(indices)
+        fetched = source.fetch(indices)
+        METRICS.record(self, misses=len(fetched))
+        return fetched
 
     def __repr__(self) -> str:
         return "NoCache()"
@@ -57,6 +71,10 @@ class MinimalFetchCache(SliceableDatasetCache[_Any]):
     def _current_indices(self) -> frozenset[int]:
         pass
 
+    def _fetch_into(self, indices: tuple[int, ...], out: np.ndarray) -> np.ndarray:
+        out[...] = self._fetch(indices)
+        return out
+
     def missing_indices(self, indices: Iterable[int]) -> frozenset[int]:
         return frozenset(indices) - self._current_indices()
 
@@ -64,146 +82,700 @@ class MinimalFetchCache(SliceableDatasetCache[_Any]):
         self,
         source: SliceableDataset[_Any],
         indices: Iterable[int] | None = None,
+        *,
+        read_ahead: Iterable[int] = (),
     ) -> Sequence[_Any]:
-        indices = tuple(range(len(source)) if indices is None else indices)
-
-        if missing_indices := tuple(self.missing_indices(indices)):
-            self._store(
-                dict(
-                    zip(
-                        missing_indices,
-                        source.fetch(missing_indices),
-                    )
-                )
+        """Fetch `indices`, storing the missing `read_ahead` elements along the way.
+
+        Missing requested and read-ahead elements are computed in a single fetch from
+        `source`, but only the requested ones are read back.
+        """
+        indices = self._ensure_stored(source, indices, read_ahead=read_ahead)
+        with METRICS.timing(self):
+            fetched = self._fetch(indices)
+
+        if METRICS.enabled:
+            METRICS.record(self, items_read=len(fetched), bytes_read=_nbytes(fetched))
+        return fetched
+
+    def fetch_into_from(
+        self,
+        source: SliceableDataset[_Any],
+        indices: Iterable[int] | None,
+        out: np.ndarray,
+    ) -> np.ndarray:
+        indices = self._ensure_stored(source, indices)
+        check_output_length(out, len(indices))
+        with METRICS.timing(self):
+            self._fetch_into(indices, out)
+
+        METRICS.record(self, items_read=len(out), bytes_read=out.nbytes)
+        return out
+
+    def _ensure_stored(
+        self,
+        source: SliceableDataset[_Any],
+        indices: Iterable[int] | None,
+        *,
+        read_ahead: Iterable[int] = (),
+    ) -> tuple[int, ...]:
+        length = len(source)
+        indices = tuple(
+            range(length)
+            if indices is None
+            # plain `int`s keep the JSON index files serializable, and negative indices
+            # are normalized once so that caches only ever see the same keys
+            else (int(index) + length if index < 0 else int(index) for index in indices)
+        )
+        # the requested elements come first, so that they are computed first
+        stored_indices = tuple(
+            dict.fromkeys((*indices, *(int(index) for index in read_ahead)))
+        )
+
+        missing_count = 0
+        if missing := self.missing_indices(stored_indices):
+            # elements are computed without holding the lock, so that readers are only
+            # blocked while they are stored
+            missing_indices = tuple(
+                index for index in stored_indices if index in missing
             )
+            computed = source.fetch(missing_indices)
+            missing_count = sum(index in missing for index in indices)
+
+            with self._locked():
+                # concurrent writers may have stored some of the elements in the meantime
+                still_missing = self.missing_indices(missing_indices)
+                pairs = {
+                    index: element
+                    for index, element in zip(missing_indices, computed)
+                    if index in still_missing
+                }
+                if pairs:
+                    with METRICS.writing(self):
+                        self._store(pairs)
+
+                    if METRICS.enabled:
+                        METRICS.record(
+                            self,
+                            items_written=len(pairs),
+                            bytes_written=_nbytes(tuple(pairs.values())),
+                        )
+
+        METRICS.record(self, hits=len(indices) - missing_count, misses=missing_count)
+        return indices
+
+    def _locked(self) -> contextlib.AbstractContextManager[None]:
+        """Guard stores against concurrent writers.
+
+        Caches shared between processes hold an inter-process lock while they re-check
+        which elements are missing and store them. Elements are computed before the lock
+        is taken, so concurrent writers may compute the same element, but only the
+        first one stores it.
+        """
+        return contextlib.nullcontext()
+
+
+@dataclasses.dataclass
+class MemoryCacheStatistics:
+    """Counters of a `MemoryCache`, where hits and misses count requested elements."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    stored_items: int = 0
+    stored_bytes: int = 0
 
-        return self._fetch(indices)
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
 
 
 class MemoryCache(MinimalFetchCache[_Any]):
-    def __init__(self) -> None:
-        self._storage: dict[int, _Any] = {}
+    """Keep fetched elements in memory, optionally within a byte budget.
+
+    The size of an element is the total `nbytes` of the arrays it contains. When
+    `max_bytes` is given, the least recently used elements are evicted to make room for
+    new ones, except for the `pinned` indices (e.g. `range(0, 1000)`), which are never
+    evicted. Elements larger than the whole budget are not kept.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_bytes: int | None = None,
+        pinned: Iterable[int] = (),
+    ) -> None:
+        self._storage: collections.OrderedDict[int, _Any] = collections.OrderedDict()
+        self._sizes: dict[int, int] = {}
+        self._max_bytes = max_bytes
+        self._pinned: list[Iterable[int]] = []
+        self._mutex = threading.Lock()
+        self.statistics = MemoryCacheStatistics()
+        self.pin(pinned)
+
+    def pin(self, indices: Iterable[int]) -> None:
+        """Protect `indices` against eviction. Ranges are kept symbolic."""
+        self._pinned.append(
+            indices if isinstance(indices, range) else frozenset(indices)
+        )
+
+    def is_pinned(self, index: int) -> bool:
+        return any(index in pinned for pinned in self._pinned)
+
+    def fetch_from(
+        self,
+        source: SliceableDataset[_Any],
+        indices: Iterable[int] | None = None,
+        *,
+        read_ahead: Iterable[int] = (),
+    ) -> tuple[_Any, ...]:
+        indices = tuple(
+            range(len(source)) if indices is None else (int(index) for index in indices)
+        )
+
+        with METRICS.timing(self), self._mutex:
+            found = {
+                index: self._touch(index) for index in indices if index in self._storage
+            }
+            hits = sum(index in found for index in indices)
+            self.statistics.hits += hits
+            self.statistics.misses += len(indices) - hits
+
+        if missing := tuple(
+            dict.fromkeys(index for index in indices if index not in found)
+        ):
+            read_ahead = tuple(read_ahead)
+            missing_read_ahead = self.missing_indices(read_ahead).difference(missing)
+            missing += tuple(
+                index for index in read_ahead if index in missing_read_ahead
+            )
+            fetched = dict(zip(missing, source.fetch(missing)))
+            with METRICS.writing(self):
+                self._store(fetched)
+            found.update(fetched)
+
+        METRICS.record(
+            self, hits=hits, misses=len(indices) - hits, items_read=len(indices)
+        )
+        return tuple(found[index] for index in indices)
+
+    def fetch_into_from(
+        self,
+        source: SliceableDataset[_Any],
+        indices: Iterable[int] | None,
+        out: np.ndarray,
+    ) -> np.ndarray:
+        # evictions may happen between storing and fetching, so elements are never
+        # re-read from the storage after being stored
+        return SliceableDatasetCache.fetch_into_from(self, source, indices, out)
 
     def _store(self, pairs: dict[int, _Any]) -> None:
-        self._storage.update(pairs)
+        with self._mutex:
+            for index, value in pairs.items():
+                size = _nbytes(value)
+                if self._max_bytes is not None and size > self._max_bytes:
+                    continue
+
+                self._discard(index)
+                self._storage[index] = value
+                self._sizes[index] = size
+                self.statistics.stored_bytes += size
+            self._evict()
+            self.statistics.stored_items = len(self._storage)
 
     def _fetch(self, indices: tuple[int, ...]) -> tuple[_Any, ...]:
         if missing := self.missing_indices(indices).intersection(indices):
             raise ValueError(f"Required missing indices: {sorted(missing)}")
 
-        return tuple(self._storage[index] for index in indices)
+        with self._mutex:
+            return tuple(self._touch(index) for index in indices)
 
     def _current_indices(self) -> frozenset[int]:
         return frozenset(self._storage)
 
+    def _touch(self, index: int) -> _Any:
+        self._storage.move_to_end(index)
+        return self._storage[index]
+
+    def _discard(self, index: int) -> None:
+        if index in self._storage:
+            del self._storage[index]
+            self.statistics.stored_bytes -= self._sizes.pop(index)
+
+    def _evict(self) -> None:
+        if self._max_bytes is None or self.statistics.stored_bytes <= self._max_bytes:
+            return
+
+        # least recently used first
+        for index in tuple(self._storage):
+            if self.statistics.stored_bytes <= self._max_bytes:
+                break
+            if not self.is_pinned(index):
+                self._discard(index)
+                self.statistics.evictions += 1
+
     def __repr__(self) -> str:
-        return f"{self.__class__.__name__}()"
+        if self._max_bytes is None:
+            return f"{self.__class__.__name__}()"
+        return f"{self.__class__.__name__}(max_bytes={self._max_bytes})"
 
 
 class NumpyCache(MinimalFetchCache[Image]):
+    """Cache frames in a memory-mapped `.npy` file inside `directory`.
+
+    The data file has a regular `.npy` header, so it can be opened by other tools with
+    `np.load(cache.data_path, mmap_mode="r")`. It is preallocated as a sparse file and
+    a boolean `.npy` sidecar records which frames have been stored.
+
+    Frames are stored as encoded by `codec`, which is recorded in a JSON sidecar when the
+    data file is created. Consecutive frames stored as they are are fetched as views of
+    the memory map, without copying. Such views are read-only, so callers that modify
+    fetched frames in place must copy them first.
+    """
+
     def __init__(
         self,
         directory: PathLike,
         *,
         shape: tuple[int, ...],
         dtype: np.dtype,
+        codec: FrameCodec = FrameCodec(),
     ) -> None:
         self._directory = resolve(directory, dir=True)
         self._shape = shape
-        self._dtype = dtype
+        self._dtype = np.dtype(dtype)
+        self._codec = codec
+        self._reader: np.memmap | None = None
+        self._presence: np.memmap | None = None
+        self._lock = file_lock(self._directory / ".lock")
+
+    @property
+    def data_path(self) -> Path:
+        return self._directory / "data.npy"
 
     def _store(self, pairs: dict[int, Image]) -> None:
-        logger.debug(f"Storing {len(pairs)} items {sorted(pairs)} to {self._data_path}")
+        logger.debug(f"Storing {len(pairs)} items {sorted(pairs)} to {self.data_path}")
 
         indices = list(pairs)
+        frames = self._codec.encode(np.array(tuple(pairs.values())))
 
-        data = self._data(mode="a")
-        data[indices] = tuple(pairs.values())
-        data.flush()
+        with self._lock():
+            data = self._writer()
+            data[indices] = frames
+            data.flush()
+            del data
 
-        _current_indices = self._current_indices()
-        new_indices = sorted(_current_indices.union(indices))
+            # frames are flushed before being marked as present, so that readers never
+            # need to take the lock
+            presence = self._require_presence()
+            presence[indices] = True
+            presence.flush()
 
-        with self._indices_path.open("w") as file:
-            _json.dump(new_indices, file)
+    def _locked(self) -> contextlib.AbstractContextManager[None]:
+        return self._lock()
+
+    def missing_indices(self, indices: Iterable[int]) -> frozenset[int]:
+        indices = np.fromiter(indices, dtype=np.intp)
+        return frozenset(indices[~self._presence_bitmap()[indices]].tolist())
 
     def _fetch(self, indices: tuple[int, ...]) -> Images:
         if missing := self.missing_indices(indices).intersection(indices):
             raise ValueError(f"Required missing indices: {sorted(missing)}")
 
-        # sort the indices, fetch the frames and unsort them back
-        unsorters, sorted_indices = unsort(indices)
-        sorted_indices = list(sorted_indices)
+        # negative indices would turn the slice below into an empty one
+        indices = tuple(
+            index + self._shape[0] if index < 0 else index for index in indices
+        )
+        if indices and indices == tuple(range(indices[0], indices[0] + len(indices))):
+            # consecutive frames are read as a zero-copy, read-only view
+            frames = self._data()[indices[0] : indices[0] + len(indices)]
+        else:
+            # sort the indices, fetch the frames and unsort them back
+            unsorters, sorted_indices = unsort(indices)
+            sorted_indices = list(sorted_indices)
+            frames = self._data()[sorted_indices][list(unsorters)]
+
+        return self._codec.decode(frames, self._dtype)
+
+    def _fetch_into(self, indices: tuple[int, ...], out: Images) -> Images:
+        if missing := self.missing_indices(indices).intersection(indices):
+            raise ValueError(f"Required missing indices: {sorted(missing)}")
+
+        data = self._data()
+        if self._codec.is_identity and out.dtype == data.dtype:
+            return np.take(data, indices, axis=0, out=out)
 
-        return self._data(mode="r")[sorted_indices][list(unsorters)]
+        # assignment casts to the dtype of `out`, like the other implementations
+        out[...] = self._codec.decode(np.take(data, indices, axis=0), out.dtype)
+        return out
 
     def _current_indices(self) -> frozenset[int]:
-        if not self._indices_path.is_file():
-            with self._indices_path.open("w") as file:
-                _json.dump([], file)
-            return frozenset()
-
-        with self._indices_path.open("r") as file:
-            return frozenset(_json.load(file))
-
-    def _data(self, *, mode: Literal["r", "w", "a"]) -> np.memmap:
-        if mode == "a" and not self._data_path.is_file():
-            mode = "w"
-
-        memmap_mode = {
-            "a": "r+",
-            "w": "w+",
-            "r": "r",
-        }[mode]
-
-        return np.memmap(
-            self._data_path,
-            mode=memmap_mode,
-            dtype=self._dtype,
-            shape=self._shape,
+        return frozenset(np.flatnonzero(self._presence_bitmap()).tolist())
+
+    def _data(self) -> np.memmap:
+        # a single read-only mapping is kept for the lifetime of the cache; it shares
+        # pages with the writable mappings, so it observes every store
+        if self._reader is None:
+            if not _is_npy_file(self.data_path):
+                with self._lock():
+                    self._writer()
+            _check_codec(self._recorded_codec(), self._codec, self.data_path)
+            self._reader = np.load(self.data_path, mmap_mode="r")
+        return self._reader
+
+    def _writer(self) -> np.memmap:
+        if not self.data_path.is_file():
+            # the codec is recorded first, so that readers never see frames without it
+            with self._codec_path.open("w") as file:
+                _json.dump(self._codec.record(), file)
+
+            # `open_memmap` only writes the header and the last byte, so the file is
+            # sparse until frames are stored
+            return np.lib.format.open_memmap(
+                self.data_path,
+                mode="w+",
+                dtype=self._codec.storage_dtype(self._dtype),
+                shape=self._shape,
+            )
+
+        _check_codec(self._recorded_codec(), self._codec, self.data_path)
+
+        if not _is_npy_file(self.data_path):
+            self._migrate_raw_data()
+
+        return np.lib.format.open_memmap(self.data_path, mode="r+")
+
+    def _migrate_raw_data(self) -> None:
+        logger.info(f"Adding a .npy header to {self.data_path}")
+
+        raw = np.memmap(self.data_path, mode="r", dtype=self._dtype, shape=self._shape)
+        migrated_path = self.data_path.with_suffix(".migrating.npy")
+        migrated = np.lib.format.open_memmap(
+            migrated_path, mode="w+", dtype=self._dtype, shape=self._shape
         )
+        migrated[...] = raw
+        migrated.flush()
+        del raw, migrated
+        migrated_path.replace(self.data_path)
+
+        logger.info("Done")
+
+    def _presence_bitmap(self) -> np.ndarray:
+        if self._presence is not None:
+            return self._presence
+
+        if self._presence_path.is_file() or self._indices_path.is_file():
+            with self._lock():
+                return self._require_presence()
+
+        # nothing has been stored yet
+        return np.zeros(self._shape[:1], dtype=np.bool_)
+
+    def _require_presence(self) -> np.memmap:
+        if self._presence is None:
+            if not self._presence_path.is_file():
+                presence = np.lib.format.open_memmap(
+                    self._presence_path,
+                    mode="w+",
+                    dtype=np.bool_,
+                    shape=self._shape[:1],
+                )
+                if self._indices_path.is_file():
+                    logger.info(f"Migrating indices from {self._indices_path}")
+                    with self._indices_path.open("r") as file:
+                        presence[_json.load(file)] = True
+                    presence.flush()
+                    self._indices_path.unlink()
+                del presence
+
+            # the mapping is shared, so stores from other processes are observed too
+            self._presence = np.lib.format.open_memmap(self._presence_path, mode="r+")
+        return self._presence
+
+    def _recorded_codec(self) -> FrameCodec:
+        if not self._codec_path.is_file():
+            # caches created before codecs were recorded store frames as they are
+            return FrameCodec()
+
+        with self._codec_path.open("r") as file:
+            return FrameCodec.from_record(_json.load(file))
 
     @property
     def _indices_path(self) -> Path:
         return self._directory / "indices.json"
 
     @property
-    def _data_path(self) -> Path:
-        return self._directory / "data.npy"
+    def _presence_path(self) -> Path:
+        return self._directory / "present.npy"
+
+    @property
+    def _codec_path(self) -> Path:
+        return self._directory / "codec.json"
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}({self._directory})"
 
 
+@dataclasses.dataclass
+class ReadAheadStatistics:
+    """Counters of the read-ahead of an `EagerCache`.
+
+    `used` counts the elements read ahead that were requested afterwards, so `usage`
+    measures how much of the read-ahead was not wasted.
+    """
+
+    requests: int = 0
+    predicted_requests: int = 0
+    read_ahead: int = 0
+    used: int = 0
+
+    @property
+    def usage(self) -> float:
+        return self.used / self.read_ahead if self.read_ahead else 0.0
+
+
 class EagerCache(SliceableDatasetCache[_Any]):
+    """Read ahead the elements that the access pattern predicts will be requested next.
+
+    Sequential and strided patterns, e.g. `0, 1, 2` or `[0, 4], [8, 12]`, are detected
+    from consecutive requests, and the missing elements that continue the pattern are
+    computed and stored in the same fetch from the source as the requested ones. The
+    read-ahead window starts at a quarter of `window` (by default `buffer_size`) and
+    doubles every time the previous read-ahead is used, up to `window`. Random accesses
+    read nothing ahead, so no element is computed in vain. Every fetch is capped at
+    `buffer_size` elements.
+    """
+
     def __init__(
         self,
         wrapped: MinimalFetchCache[_Any],
         buffer_size: int,
+        *,
+        window: int | None = None,
     ) -> None:
         self._wrapped = wrapped
         self._buffer_size = buffer_size
+        self._max_window = buffer_size if window is None else window
+        self._initial_window = max(1, self._max_window // 4)
+        self._window = self._initial_window
+        self._last_index: int | None = None
+        self._stride: int | None = None
+        self._pending: set[int] = set()
+        self._pending_used = False
+        self._mutex = threading.Lock()
+        self.statistics = ReadAheadStatistics()
 
     def fetch_from(
         self,
         source: SliceableDataset[_Any],
         indices: Iterable[int] | None = None,
     ) -> Sequence[_Any]:
-        all_indices = range(len(source))
-        indices = tuple(all_indices if indices is None else indices)
-
-        if len(indices) >= self._buffer_size:
+        indices = tuple(
+            range(len(source)) if indices is None else (int(index) for index in indices)
+        )
+        if not indices:
             return self._wrapped.fetch_from(source, indices)
 
-        all_missing_indices = self._wrapped.missing_indices(all_indices)
-        extra_missing_indices = all_missing_indices.difference(indices)
-        eagerly_fetched_indices = (indices + tuple(extra_missing_indices))[
-            : self._buffer_size
-        ]
-        eagerly_fetched_values = self._wrapped.fetch_from(
-            source, eagerly_fetched_indices
-        )
-        return eagerly_fetched_values[: len(indices)]
+        # reading ahead on hits would split the source fetches into tiny ones, so the
+        # window is only read on misses
+        has_missing = bool(self._wrapped.missing_indices(indices))
+        with self._mutex:
+            read_ahead = self._read_ahead(
+                indices, length=len(source), has_missing=has_missing
+            )
+
+        if read_ahead:
+            # only the elements that are actually computed count as read ahead
+            missing = self._wrapped.missing_indices(read_ahead)
+            read_ahead = tuple(index for index in read_ahead if index in missing)
+            with self._mutex:
+                self._pending.update(read_ahead)
+                self.statistics.read_ahead += len(read_ahead)
+
+        return self._wrapped.fetch_from(source, indices, read_ahead=read_ahead)
+
+    def _read_ahead(
+        self, indices: tuple[int, ...], *, length: int, has_missing: bool
+    ) -> range:
+        self.statistics.requests += 1
+        if used := self._pending.intersection(indices):
+            self._pending.difference_update(used)
+            self.statistics.used += len(used)
+            self._pending_used = True
+
+        stride = self._predicted_stride(indices)
+        self._last_index = indices[-1]
+        if stride is None:
+            self._window = self._initial_window
+            self._pending_used = False
+            return range(0)
+
+        self.statistics.predicted_requests += 1
+        if not has_missing:
+            return range(0)
+
+        if self._pending_used:
+            self._window = min(2 * self._window, self._max_window)
+        self._pending_used = False
+
+        count = min(self._window, self._buffer_size - len(indices))
+        start = indices[-1] + stride
+        if count <= 0 or not 0 <= start < length:
+            return range(0)
+
+        stop = min(max(start + stride * count, -1), length)
+        return range(start, stop, stride)
+
+    def _predicted_stride(self, indices: tuple[int, ...]) -> int | None:
+        """Return the stride of the pattern followed by the latest requests, if any."""
+        gap = None if self._last_index is None else indices[0] - self._last_index
+
+        if len(indices) > 1:
+            strides = np.diff(indices)
+            stride = int(strides[0])
+            # a single request following a pattern is evidence enough, unless it jumps
+            # away from the previous one
+            if stride and (strides == stride).all() and gap in (None, stride):
+                self._stride = stride
+                return stride
+            self._stride = None
+            return None
+
+        # single elements need two consecutive equal gaps
+        previous_stride, self._stride = self._stride, gap or None
+        if gap and gap == previous_stride:
+            return gap
+        return None
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}({self._wrapped}, buffer_size={self._buffer_size})"
+
+
+class ByteBudget:
+    """Bytes that may still be written to the caches sharing this budget.
+
+    Reservations are thread-safe, but each process keeps its own count.
+    """
+
+    def __init__(self, max_bytes: int, *, used_bytes: int = 0) -> None:
+        self.max_bytes = max_bytes
+        self.used_bytes = used_bytes
+        self._mutex = threading.Lock()
+
+    def reserve(self, nbytes: int) -> bool:
+        """Reserve `nbytes` if they fit in the budget, and return whether they did."""
+        with self._mutex:
+            if self.used_bytes + nbytes > self.max_bytes:
+                return False
+            self.used_bytes += nbytes
+            return True
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.used_bytes}/{self.max_bytes})"
+
+
+class TieredCache(SliceableDatasetCache[_Any]):
+    """Stack caches from the fastest to the slowest tier.
+
+    Elements are read from the fastest tier holding them and promoted to every faster
+    tier. Elements missing from all tiers are computed through the slowest tier, which
+    is the authoritative store, and then written through to the faster ones. Capacity
+    limits are enforced by the tiers themselves, e.g. a `MemoryCache` with a byte
+    budget in front of a local and a shared `HDF5NumpyCache`, or by the `budgets` of
+    the faster tiers, which stop receiving promotions once their budget is spent.
+    """
+
+    def __init__(
+        self,
+        *tiers: MinimalFetchCache[_Any],
+        budgets: Mapping[MinimalFetchCache[_Any], ByteBudget] | None = None,
+    ) -> None:
+        if not tiers:
+            raise ValueError("at least one tier is required")
+
+        self._tiers = tiers
+        self._budgets = {} if budgets is None else dict(budgets)
+
+    @property
+    def tiers(self) -> tuple[MinimalFetchCache[_Any], ...]:
+        return self._tiers
+
+    def fetch_from(
+        self,
+        source: SliceableDataset[_Any],
+        indices: Iterable[int] | None = None,
+    ) -> Sequence[_Any]:
+        indices = tuple(
+            range(len(source)) if indices is None else (int(index) for index in indices)
+        )
+
+        values: dict[int, _Any] = {}
+        remaining = tuple(dict.fromkeys(indices))
+        *faster_tiers, slowest_tier = self._tiers
+        for level, tier in enumerate(faster_tiers):
+            if not remaining:
+                break
+
+            missing = tier.missing_indices(remaining)
+            if found := tuple(index for index in remaining if index not in missing):
+                fetched = tier.fetch_from(source, found)
+                self._promote(level, found, fetched)
+                values.update(zip(found, fetched))
+            remaining = tuple(index for index in remaining if index in missing)
+            # the tier is only asked for its hits, so its misses are counted here
+            METRICS.record(tier, misses=len(remaining))
+
+        if remaining:
+            fetched = slowest_tier.fetch_from(source, remaining)
+            self._promote(len(faster_tiers), remaining, fetched)
+            values.update(zip(remaining, fetched))
+
+        collected = [values[index] for index in indices]
+        if collected and all(isinstance(value, np.ndarray) for value in collected):
+            return np.stack(collected)
+        return tuple(collected)
+
+    def _promote(
+        self, level: int, indices: tuple[int, ...], values: Sequence[_Any]
+    ) -> None:
+        if not level:
+            return
+
+        pairs = dict(zip(indices, values))
+        nbytes = _nbytes(values)
+        for tier in self._tiers[:level]:
+            budget = self._budgets.get(tier)
+            if budget is not None and not budget.reserve(nbytes):
+                logger.debug(f"Not promoting {len(pairs)} items to {tier}: {budget}")
+                continue
+
+            with METRICS.writing(tier):
+                tier._store(pairs)
+            METRICS.record(tier, items_written=len(pairs), bytes_written=nbytes)
+
+    def __repr__(self) -> str:
+        tiers = ", ".join(repr(tier) for tier in self._tiers)
+        return f"{self.__class__.__name__}({tiers})"
+
+
+def _check_codec(recorded: FrameCodec, codec: FrameCodec, path: Path) -> None:
+    if recorded != codec:
+        raise ValueError(
+            f"frames in {path} are stored with {recorded}, but {codec} was given"
+        )
+
+
+def _is_npy_file(path: Path) -> bool:
+    with path.open("rb") as file:
+        return file.read(len(np.lib.format.MAGIC_PREFIX)) == np.lib.format.MAGIC_PREFIX
+
+
+def _nbytes(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, tuple | list):
+        return sum(_nbytes(item) for item in value)
+    if isinstance(value, Mapping):
+        return sum(_nbytes(item) for item in value.values())
+    return sys.getsizeof(value)
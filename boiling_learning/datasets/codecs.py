@@ -0,0 +1,128 @@
+"""Codecs converting frames to and from the representation stored by the frame caches.
+
+A codec is recorded by each cache the first time it stores frames, so that frames are
+always decoded the way they were encoded.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+from collections.abc import Mapping
+from typing import Any, ClassVar
+
+import numpy as np
+import numpy.typing as npt
+
+
+@dataclasses.dataclass(frozen=True)
+class FrameCodec:
+    """Store frames as they are."""
+
+    name: ClassVar[str] = "identity"
+
+    @property
+    def is_identity(self) -> bool:
+        return type(self) is FrameCodec
+
+    @property
+    def max_error(self) -> float:
+        """Upper bound of the absolute error introduced by an encode-decode round trip."""
+        return 0.0
+
+    def storage_dtype(self, dtype: npt.DTypeLike) -> np.dtype:
+        return np.dtype(dtype)
+
+    def encode(self, frames: np.ndarray) -> np.ndarray:
+        return frames
+
+    def decode(self, stored: np.ndarray, dtype: npt.DTypeLike) -> np.ndarray:
+        return stored.astype(dtype, copy=False)
+
+    def record(self) -> dict[str, Any]:
+        return {"name": self.name, **dataclasses.asdict(self)}
+
+    @staticmethod
+    def from_record(record: Mapping[str, Any]) -> FrameCodec:
+        parameters = dict(record)
+        codec_type = _CODECS[parameters.pop("name")]
+        return codec_type(**parameters)
+
+
+@dataclasses.dataclass(frozen=True)
+class UInt8Codec(FrameCodec):
+    """Quantize floating-point frames in `[0, 1]` to `uint8`.
+
+    Frames converted from 8-bit video, i.e. multiples of `1 / scale`, round-trip
+    exactly. Other frames are off by at most half a quantization step, unless
+    `lossless` is set, in which case they are rejected.
+    """
+
+    name: ClassVar[str] = "uint8"
+
+    scale: float = 255.0
+    lossless: bool = False
+
+    @property
+    def max_error(self) -> float:
+        return 0.0 if self.lossless else 0.5 / self.scale
+
+    def storage_dtype(self, dtype: npt.DTypeLike) -> np.dtype:
+        _check_floating(self, dtype)
+        return np.dtype(np.uint8)
+
+    def encode(self, frames: np.ndarray) -> np.ndarray:
+        encoded = np.rint(np.clip(frames, 0, 1) * self.scale).astype(np.uint8)
+        _check_round_trip(self, frames, encoded)
+        return encoded
+
+    def decode(self, stored: np.ndarray, dtype: npt.DTypeLike) -> np.ndarray:
+        # the same operations as `tf.image.convert_image_dtype`, so that frames converted
+        # from `uint8` are recovered bit for bit
+        dtype = np.dtype(dtype)
+        return stored.astype(dtype) * dtype.type(1 / self.scale)
+
+
+@dataclasses.dataclass(frozen=True)
+class Float16Codec(FrameCodec):
+    """Store floating-point frames as `float16`, with a relative error of at most 2**-11.
+
+    With `lossless`, frames that are not exactly representable are rejected.
+    """
+
+    name: ClassVar[str] = "float16"
+
+    lossless: bool = False
+
+    @property
+    def max_error(self) -> float:
+        # half a unit in the last place of the values in [0.5, 1]
+        return 0.0 if self.lossless else 2.0**-12
+
+    def storage_dtype(self, dtype: npt.DTypeLike) -> np.dtype:
+        _check_floating(self, dtype)
+        return np.dtype(np.float16)
+
+    def encode(self, frames: np.ndarray) -> np.ndarray:
+        encoded = frames.astype(np.float16)
+        _check_round_trip(self, frames, encoded)
+        return encoded
+
+
+_CODECS: dict[str, type[FrameCodec]] = {
+    codec.name: codec for codec in (FrameCodec, UInt8Codec, Float16Codec)
+}
+
+
+def _check_round_trip(
+    codec: FrameCodec, frames: np.ndarray, encoded: np.ndarray
+) -> None:
+    if codec.max_error:
+        return
+
+    if not np.array_equal(codec.decode(encoded, frames.dtype), frames):
+        raise ValueError(f"frames cannot be stored losslessly with {codec}")
+
+
+def _check_floating(codec: FrameCodec, dtype: npt.DTypeLike) -> None:
+    if not np.issubdtype(dtype, np.floating):
+        raise TypeError(f"{codec} only encodes floating-point frames, got {dtype}")
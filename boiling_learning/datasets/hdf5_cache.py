@@ -1,22 +1,139 @@
 from __future__ import annotations
 
 import json as _json
-from collections.abc import Iterator
+import os
+import threading
+from collections import Counter
+from collections.abc import Iterable, Iterator
 from contextlib import contextmanager
 from pathlib import Path
+from typing import Any
 
 import h5py
+import hdf5plugin
 import numpy as np
 from loguru import logger
 
-from boiling_learning.datasets.cache import MinimalFetchCache
+from boiling_learning.datasets.cache import (
+    MinimalFetchCache,
+    _check_codec,
+    _is_npy_file,
+)
+from boiling_learning.datasets.codecs import FrameCodec
 from boiling_learning.image_datasets import Image, Images
 from boiling_learning.preprocessing.extract import is_empty_frame
-from boiling_learning.utils.iterutils import unsort
+from boiling_learning.utils.locking import file_lock
 from boiling_learning.utils.pathutils import PathLike, resolve
 
 
+class HDF5FilePool:
+    """Process-wide pool of open HDF5 files, keyed by path.
+
+    Reads share a long-lived read-only handle per file. HDF5 refuses to open a file for
+    writing while it is open read-only in the same process, so writers close the pooled
+    handle first and readers reopen it lazily afterwards. Files written by other
+    processes are detected through the `version` given by readers, which reopen the
+    handle whenever it changes.
+
+    HDF5's own file locking is disabled: it would make long-lived read handles fail the
+    writers of other processes. Callers coordinate through their own locks instead.
+
+    At most `max_open_files` handles are kept open; opening another one closes the least
+    recently used handle that is not being read.
+    """
+
+    def __init__(self, *, max_open_files: int = 128) -> None:
+        if max_open_files < 1:
+            raise ValueError(f"max_open_files must be positive, got {max_open_files}")
+
+        # ordered from the least to the most recently used
+        self._files: dict[Path, tuple[h5py.File, object]] = {}
+        self._reading: Counter[Path] = Counter()
+        self._max_open_files = max_open_files
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+
+    @contextmanager
+    def reading(
+        self,
+        path: Path,
+        *,
+        chunk_cache_size: int | None = None,
+        version: object = None,
+    ) -> Iterator[h5py.File]:
+        with self._lock:
+            self._forget_inherited_files()
+
+            file, opened_version = self._files.pop(path, (None, None))
+            if not file or opened_version != version:
+                if file:
+                    file.close()
+                self._evict(self._max_open_files - 1)
+                file = h5py.File(path, "r", rdcc_nbytes=chunk_cache_size, locking=False)
+            self._files[path] = (file, version)
+
+            self._reading[path] += 1
+            try:
+                yield file
+            finally:
+                self._reading[path] -= 1
+                if not self._reading[path]:
+                    del self._reading[path]
+
+    @contextmanager
+    def writing(
+        self, path: Path, *, chunk_cache_size: int | None = None
+    ) -> Iterator[h5py.File]:
+        with self._lock:
+            self._forget_inherited_files()
+            self.close(path)
+
+            with h5py.File(
+                path, "a", rdcc_nbytes=chunk_cache_size, locking=False
+            ) as file:
+                yield file
+
+    def close(self, path: Path) -> None:
+        with self._lock:
+            if entry := self._files.pop(path, None):
+                file, _version = entry
+                file.close()
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in tuple(self._files):
+                self.close(path)
+
+    def _evict(self, max_open_files: int) -> None:
+        idle = [path for path in self._files if path not in self._reading]
+        for path in idle[: max(len(self._files) - max_open_files, 0)]:
+            self.close(path)
+
+    def _forget_inherited_files(self) -> None:
+        # handles inherited from a parent process through `fork` must not be reused
+        if (pid := os.getpid()) != self._pid:
+            self._files = {}
+            self._reading = Counter()
+            self._pid = pid
+
+
+HDF5_FILE_POOL = HDF5FilePool()
+
+
 class HDF5NumpyCache(MinimalFetchCache[Image]):
+    """Cache frames in an HDF5 file inside `directory`.
+
+    By default, frames are stored contiguously and uncompressed. With `chunk_frames`,
+    the dataset is chunked along the frame axis, `chunk_frames` frames per chunk, and can
+    be compressed with any `h5py` filter (e.g. `"gzip"` or `"lzf"`) or with one of
+    `"blosc-zstd"`, `"blosc-lz4"`, `"zstd"` and `"lz4"`, whose level is given by
+    `compression_opts`. `chunk_cache_size` sets the size in bytes of the chunk cache of
+    each open file. Layout options only take effect when the dataset is created.
+
+    Frames are stored as encoded by `codec`, which is recorded as an attribute of the
+    dataset. Opening a cache with a different codec raises a `ValueError`.
+    """
+
     def __init__(
         self,
         directory: PathLike,
@@ -24,61 +141,149 @@ class HDF5NumpyCache(MinimalFetchCache[Image]):
         shape: tuple[int, ...],
         dtype: np.dtype,
         disallow_null: bool = True,
+        chunk_frames: int | None = None,
+        chunk_cache_size: int | None = None,
+        compression: str | None = None,
+        compression_opts: Any = None,
+        codec: FrameCodec = FrameCodec(),
+        pool: HDF5FilePool = HDF5_FILE_POOL,
     ) -> None:
         self._directory = resolve(directory, dir=True)
         self._shape = shape
         self._dtype = dtype
         self._disallow_null = disallow_null
+        self._chunk_frames = chunk_frames
+        self._chunk_cache_size = chunk_cache_size
+        self._compression = compression
+        self._compression_opts = compression_opts
+        self._codec = codec
+        self._codec_checked = False
+        self._pool = pool
+        self._lock = file_lock(self._directory / ".lock")
+        # in-memory copy of the presence bitmap stored alongside the frames
+        self._presence: np.ndarray | None = None
 
     def _store(self, pairs: dict[int, Image]) -> None:
         logger.debug(f"Storing {len(pairs)} items {sorted(pairs)} to {self._data_path}")
 
         indices_frames = sorted(pairs.items(), key=lambda pair: pair[0])
         indices = [index for index, _ in indices_frames]
-        frames = np.array([frame for _, frame in indices_frames])
-
-        with self._open_data() as data:
-            data[indices] = frames
+        frames = self._codec.encode(np.array([frame for _, frame in indices_frames]))
 
-        _current_indices = self._current_indices()
-        new_indices = sorted(_current_indices.union(indices))
+        with self._lock(), self._open_file() as file:
+            self._require_data(file)[indices] = frames
 
-        with self._indices_path.open("w") as file:
-            _json.dump(new_indices, file)
+            presence = self._require_presence(file)
+            if self._presence is None:
+                self._presence = presence[...]
+            self._presence[indices] = True
+            # only the span covering the new indices needs to be written back
+            start, stop = indices[0], indices[-1] + 1
+            presence[start:stop] = self._presence[start:stop]
+            self._bump_generation()
 
         logger.debug("Done")
 
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with self._lock():
+            # drop the presence bitmap, which may miss stores from other processes
+            self._presence = None
+            yield
+
+    def missing_indices(self, indices: Iterable[int]) -> frozenset[int]:
+        indices = np.fromiter(indices, dtype=np.intp)
+        return frozenset(indices[~self._presence_bitmap()[indices]].tolist())
+
     def _fetch(self, indices: tuple[int, ...]) -> Images:
+        if not indices:
+            # there may be no frames stored yet
+            return np.empty((0, *self._shape[1:]), dtype=self._dtype)
+
         if missing := self.missing_indices(indices).intersection(indices):
             raise ValueError(f"Required missing indices: {sorted(missing)}")
 
-        # sort the indices, fetch the frames and unsort them back
-        unsorters, sorted_indices = unsort(indices)
-        sorted_indices = list(sorted_indices)
+        requested = np.asarray(indices, dtype=np.intp)
+        unique_indices, inverse = np.unique(requested, return_inverse=True)
 
-        with self._open_data() as data:
-            fetched_data = data[sorted_indices][list(unsorters)]
+        with self._read_data() as data:
+            frames = np.empty((len(unique_indices), *data.shape[1:]), dtype=data.dtype)
+            _read_runs(data, unique_indices, frames)
+
+        frames = self._codec.decode(frames, self._dtype)
+        if not np.array_equal(unique_indices, requested):
+            frames = frames[inverse]
+
+        self._check_not_null(indices, frames)
+        return frames
+
+    def _fetch_into(self, indices: tuple[int, ...], out: Images) -> Images:
+        if not indices:
+            return out
+
+        if missing := self.missing_indices(indices).intersection(indices):
+            raise ValueError(f"Required missing indices: {sorted(missing)}")
 
+        requested = np.asarray(indices, dtype=np.intp)
+        unique_indices, inverse = np.unique(requested, return_inverse=True)
+
+        with self._read_data() as data:
+            if (
+                self._codec.is_identity
+                and np.array_equal(unique_indices, requested)
+                and out.flags.c_contiguous
+            ):
+                # strictly increasing indices can be read straight into `out`
+                _read_runs(data, unique_indices, out)
+            else:
+                frames = np.empty((len(unique_indices), *data.shape[1:]), data.dtype)
+                _read_runs(data, unique_indices, frames)
+                out[...] = self._codec.decode(frames, out.dtype)[inverse]
+
+        self._check_not_null(indices, out)
+        return out
+
+    def _check_not_null(self, indices: tuple[int, ...], frames: Images) -> None:
         if self._disallow_null:
-            for index, image in zip(indices, fetched_data):
+            for index, image in zip(indices, frames):
                 if is_empty_frame(image):
                     raise ValueError(
                         f"got empty image from {self._data_path} @ {index}: {image}"
                     )
 
-        return fetched_data
-
     def _current_indices(self) -> frozenset[int]:
-        if not self._indices_path.is_file():
-            with self._indices_path.open("w") as file:
-                _json.dump([], file)
-            return frozenset()
+        return frozenset(np.flatnonzero(self._presence_bitmap()).tolist())
+
+    def _presence_bitmap(self) -> np.ndarray:
+        if self._presence is not None:
+            return self._presence
+
+        if not self._needs_migration():
+            with self._lock(shared=True):
+                if not self._data_path.exists():
+                    # nothing was stored yet, so there is no file to create for readers
+                    return np.zeros(self._shape[:1], dtype=np.bool_)
 
-        with self._indices_path.open("r") as file:
-            return frozenset(_json.load(file))
+                with self._read_file() as file:
+                    if self._presence_dataset_name in file:
+                        self._presence = file[self._presence_dataset_name][...]
+                        return self._presence
+
+        # legacy layouts are migrated, which only writers may do
+        with self._lock(), self._open_file() as file:
+            self._presence = self._require_presence(file)[...]
+        return self._presence
+
+    def _needs_migration(self) -> bool:
+        return self._numpy_data_path.exists() or self._indices_path.exists()
 
     @contextmanager
     def _open_data(self, *, migrate: bool = True) -> Iterator[h5py.Dataset]:
+        with self._open_file(migrate=migrate) as file:
+            yield self._require_data(file)
+
+    @contextmanager
+    def _open_file(self, *, migrate: bool = True) -> Iterator[h5py.File]:
         if migrate and self._numpy_data_path.exists():
             if not self._data_path.exists():
                 logger.info(
@@ -88,22 +293,117 @@ class HDF5NumpyCache(MinimalFetchCache[Image]):
                 logger.info("Done")
             self._numpy_data_path.unlink()
 
-        with h5py.File(self._data_path, "a") as file:
-            yield file.require_dataset(
-                self._data_dataset_name,
-                shape=self._shape,
-                dtype=self._dtype,
-                exact=True,
+        with self._pool.writing(
+            self._data_path, chunk_cache_size=self._chunk_cache_size
+        ) as file:
+            yield file
+
+    @contextmanager
+    def _read_data(self) -> Iterator[h5py.Dataset]:
+        with self._lock(shared=True), self._read_file() as file:
+            data = file[self._data_dataset_name]
+            if not self._codec_checked:
+                self._check_codec(data)
+            yield data
+
+    @contextmanager
+    def _read_file(self) -> Iterator[h5py.File]:
+        with self._pool.reading(
+            self._data_path,
+            chunk_cache_size=self._chunk_cache_size,
+            version=self._generation(),
+        ) as file:
+            yield file
+
+    def _generation(self) -> int:
+        """Return the number of stores so far, used to detect stale read handles."""
+        try:
+            return int(self._generation_path.read_text())
+        except FileNotFoundError:
+            return 0
+
+    def _bump_generation(self) -> None:
+        self._generation_path.write_text(str(self._generation() + 1))
+
+    def _require_data(self, file: h5py.File) -> h5py.Dataset:
+        if self._data_dataset_name in file:
+            data = file[self._data_dataset_name]
+            if not self._codec_checked:
+                self._check_codec(data)
+            return data
+
+        data = file.create_dataset(
+            self._data_dataset_name,
+            shape=self._shape,
+            dtype=self._codec.storage_dtype(self._dtype),
+            chunks=(
+                None
+                if self._chunk_frames is None
+                else (min(self._chunk_frames, self._shape[0]), *self._shape[1:])
+            ),
+            **_compression_options(self._compression, self._compression_opts),
+        )
+        data.attrs[self._codec_attribute_name] = _json.dumps(self._codec.record())
+        self._codec_checked = True
+        return data
+
+    def _check_codec(self, data: h5py.Dataset) -> None:
+        record = data.attrs.get(self._codec_attribute_name)
+        # datasets created before codecs were recorded store frames as they are
+        recorded = (
+            FrameCodec()
+            if record is None
+            else FrameCodec.from_record(_json.loads(record))
+        )
+        _check_codec(recorded, self._codec, self._data_path)
+
+        expected_dtype = self._codec.storage_dtype(self._dtype)
+        if data.shape != self._shape or data.dtype != expected_dtype:
+            raise TypeError(
+                f"frames in {self._data_path} have shape {data.shape} and dtype "
+                f"{data.dtype}, expected {self._shape} and {expected_dtype}"
+            )
+        self._codec_checked = True
+
+    def _require_presence(self, file: h5py.File) -> h5py.Dataset:
+        if self._presence_dataset_name in file:
+            return file[self._presence_dataset_name]
+
+        presence = file.create_dataset(
+            self._presence_dataset_name, shape=self._shape[:1], dtype=np.bool_
+        )
+
+        if self._indices_path.is_file():
+            logger.info(
+                f"Migrating indices from {self._indices_path} to {file.filename}"
             )
+            with self._indices_path.open("r") as indices_file:
+                indices = _json.load(indices_file)
+
+            bitmap = np.zeros(self._shape[:1], dtype=np.bool_)
+            bitmap[indices] = True
+            presence[...] = bitmap
+            file.flush()
+            self._indices_path.unlink()
+            logger.info("Done")
+
+        return presence
 
     def _migrate_from_numpy(self) -> None:
-        with self._open_data(migrate=False) as data:
-            data[:] = np.memmap(
+        frames = (
+            np.load(self._numpy_data_path, mmap_mode="r")
+            if _is_npy_file(self._numpy_data_path)
+            else np.memmap(
                 self._numpy_data_path,
                 mode="r",
                 dtype=self._dtype,
                 shape=self._shape,
             )
+        )
+        with self._open_data(migrate=False) as data:
+            for start in range(0, len(frames), _MIGRATION_BATCH_SIZE):
+                stop = start + _MIGRATION_BATCH_SIZE
+                data[start:stop] = self._codec.encode(np.asarray(frames[start:stop]))
 
     @property
     def _indices_path(self) -> Path:
@@ -113,13 +413,126 @@ class HDF5NumpyCache(MinimalFetchCache[Image]):
     def _data_path(self) -> Path:
         return self._directory / "data.h5"
 
+    @property
+    def _generation_path(self) -> Path:
+        return self._directory / "generation"
+
     @property
     def _data_dataset_name(self) -> str:
         return "default"
 
+    @property
+    def _presence_dataset_name(self) -> str:
+        return "present"
+
+    @property
+    def _codec_attribute_name(self) -> str:
+        return "codec"
+
     @property
     def _numpy_data_path(self) -> Path:
         return self._directory / "data.npy"
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}({self._directory})"
+
+
+_MIGRATION_BATCH_SIZE = 1024
+
+_PLUGIN_COMPRESSIONS = {
+    "blosc-zstd": lambda level: hdf5plugin.Blosc(
+        cname="zstd",
+        clevel=5 if level is None else level,
+        shuffle=hdf5plugin.Blosc.SHUFFLE,
+    ),
+    "blosc-lz4": lambda level: hdf5plugin.Blosc(
+        cname="lz4",
+        clevel=5 if level is None else level,
+        shuffle=hdf5plugin.Blosc.SHUFFLE,
+    ),
+    "zstd": lambda level: hdf5plugin.Zstd(clevel=3 if level is None else level),
+    "lz4": lambda _level: hdf5plugin.LZ4(),
+}
+
+
+def _compression_options(
+    compression: str | None, compression_opts: Any
+) -> dict[str, Any]:
+    """Return the `create_dataset` keyword arguments for `compression`."""
+    if compression in _PLUGIN_COMPRESSIONS:
+        return dict(_PLUGIN_COMPRESSIONS[compression](compression_opts))
+    return {"compression": compression, "compression_opts": compression_opts}
+
+
+_MIN_MEAN_RUN_LENGTH = 4
+"""Minimum mean run length for reading runs one by one from contiguous datasets."""
+
+
+def _read_runs(data: h5py.Dataset, indices: np.ndarray, out: np.ndarray) -> None:
+    """Read the frames at the sorted unique `indices` of `data` into `out`.
+
+    Each run of consecutive indices is read as a single hyperslab instead of a point
+    selection. When the layout allows it, whole chunks covered by a run bypass the
+    filter pipeline and are copied straight from the file.
+    """
+    if not len(indices):
+        return
+
+    run_starts = np.flatnonzero(np.diff(indices, prepend=indices[0] - 2) != 1)
+    if data.chunks is None and len(run_starts) * _MIN_MEAN_RUN_LENGTH > len(indices):
+        # mostly scattered indices in a contiguous dataset: one selection beats many
+        # tiny reads, whereas chunked datasets would decode each chunk repeatedly
+        data.read_direct(out, np.s_[indices.tolist()])
+        return
+
+    run_stops = np.append(run_starts[1:], len(indices))
+    chunk_frames = _direct_chunk_frames(data)
+
+    for position, stop_position in zip(run_starts.tolist(), run_stops.tolist()):
+        start = int(indices[position])
+        stop = start + stop_position - position
+        _read_run(data, start, stop, out[position:stop_position], chunk_frames)
+
+
+def _read_run(
+    data: h5py.Dataset,
+    start: int,
+    stop: int,
+    out: np.ndarray,
+    chunk_frames: int | None,
+) -> None:
+    if chunk_frames is not None:
+        first_chunk = -(-start // chunk_frames)
+        last_chunk = stop // chunk_frames
+        if first_chunk < last_chunk:
+            head_stop = first_chunk * chunk_frames
+            tail_start = last_chunk * chunk_frames
+            _read_hyperslab(data, start, head_stop, out[: head_stop - start])
+
+            origin = (0,) * (data.ndim - 1)
+            for offset in range(head_stop, tail_start, chunk_frames):
+                _filter_mask, chunk = data.id.read_direct_chunk((offset, *origin))
+                out[offset - start : offset - start + chunk_frames] = np.frombuffer(
+                    chunk, dtype=data.dtype
+                ).reshape(chunk_frames, *data.shape[1:])
+
+            _read_hyperslab(data, tail_start, stop, out[tail_start - start :])
+            return
+
+    _read_hyperslab(data, start, stop, out)
+
+
+def _read_hyperslab(data: h5py.Dataset, start: int, stop: int, out: np.ndarray) -> None:
+    if start < stop:
+        data.read_direct(out, np.s_[start:stop], np.s_[: stop - start])
+
+
+def _direct_chunk_frames(data: h5py.Dataset) -> int | None:
+    """Return the number of frames per chunk if chunks can be read without decoding."""
+    if (
+        data.chunks is None
+        or data.chunks[1:] != data.shape[1:]
+        or data.id.get_create_plist().get_nfilters()
+    ):
+        return None
+    return data.chunks[0]
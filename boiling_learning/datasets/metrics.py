@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import bisect
+import dataclasses
+import json as _json
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+from boiling_learning.utils.pathutils import PathLike, resolve
+
+_LATENCY_BOUNDS = tuple(2.0**exponent * 1e-6 for exponent in range(31))
+"""Upper bounds in seconds of the latency buckets, from 1 µs to about 18 minutes."""
+
+
+@dataclasses.dataclass
+class LatencyHistogram:
+    """Latencies counted in power-of-two buckets, the last one being unbounded."""
+
+    counts: list[int] = dataclasses.field(
+        default_factory=lambda: [0] * (len(_LATENCY_BOUNDS) + 1)
+    )
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def record(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(_LATENCY_BOUNDS, seconds)] += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Return an upper bound of the `q`-quantile, within a factor of two."""
+        if not (count := self.count):
+            return 0.0
+
+        rank = q * count
+        seen = 0
+        for bound, bucket_count in zip(_LATENCY_BOUNDS, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.max_seconds)
+        return self.max_seconds
+
+
+@dataclasses.dataclass
+class NodeMetrics:
+    """Counters of a cache or dataset node.
+
+    Hits and misses count requested elements. Latencies only cover the work of the node
+    itself, e.g. reading from a cache or applying a map, and not that of its upstream
+    nodes. Time spent storing elements is counted separately in `write_seconds`.
+    """
+
+    fetches: int = 0
+    hits: int = 0
+    misses: int = 0
+    items_read: int = 0
+    bytes_read: int = 0
+    items_written: int = 0
+    bytes_written: int = 0
+    write_seconds: float = 0.0
+    latency: LatencyHistogram = dataclasses.field(default_factory=LatencyHistogram)
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "fetches": self.fetches,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "items_read": self.items_read,
+            "bytes_read": self.bytes_read,
+            "items_written": self.items_written,
+            "bytes_written": self.bytes_written,
+            "write_seconds": self.write_seconds,
+            "total_seconds": self.latency.total_seconds,
+            "p50_seconds": self.latency.quantile(0.5),
+            "p99_seconds": self.latency.quantile(0.99),
+            "max_seconds": self.latency.max_seconds,
+            "latency_counts": self.latency.counts,
+        }
+
+
+class MetricsRegistry:
+    """Collect `NodeMetrics` from caches and dataset nodes, keyed by node name.
+
+    Collection is disabled by default, and costs next to nothing until it is enabled.
+    Nodes running in worker processes report to the registry of their own process.
+    """
+
+    def __init__(self) -> None:
+        self._nodes: dict[str, NodeMetrics] = {}
+        self._lock = threading.Lock()
+        self._jsonl_path: Path | None = None
+        self.enabled = False
+
+    def enable(self, *, jsonl_path: PathLike | None = None) -> None:
+        """Start collecting, exporting to `jsonl_path` on every `export`."""
+        self._jsonl_path = (
+            None if jsonl_path is None else resolve(jsonl_path, parents=True)
+        )
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._nodes = {}
+
+    def record(
+        self,
+        node: object,
+        *,
+        hits: int = 0,
+        misses: int = 0,
+        items_read: int = 0,
+        bytes_read: int = 0,
+        items_written: int = 0,
+        bytes_written: int = 0,
+    ) -> None:
+        if not self.enabled:
+            return
+
+        with self._lock:
+            metrics = self._node(node)
+            metrics.hits += hits
+            metrics.misses += misses
+            metrics.items_read += items_read
+            metrics.bytes_read += bytes_read
+            metrics.items_written += items_written
+            metrics.bytes_written += bytes_written
+
+    @contextmanager
+    def timing(self, node: object) -> Iterator[None]:
+        """Count a fetch of `node` and record its latency."""
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                metrics = self._node(node)
+                metrics.fetches += 1
+                metrics.latency.record(seconds)
+
+    @contextmanager
+    def writing(self, node: object) -> Iterator[None]:
+        """Record the time spent by `node` storing elements."""
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self._node(node).write_seconds += seconds
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return {name: metrics.as_dict() for name, metrics in self._nodes.items()}
+
+    def report(self) -> str:
+        """Summarize every node, slowest first."""
+        nodes = sorted(
+            self.snapshot().items(),
+            key=lambda item: item[1]["total_seconds"] + item[1]["write_seconds"],
+            reverse=True,
+        )
+        lines = [
+            f"{'time (s)':>10} {'write (s)':>10} {'fetches':>9} {'hit rate':>8} "
+            f"{'p50 (ms)':>9} {'p99 (ms)':>9} {'MiB read':>9} {'MiB written':>11}  node"
+        ]
+        lines.extend(
+            f"{metrics['total_seconds']:>10.2f} {metrics['write_seconds']:>10.2f} "
+            f"{metrics['fetches']:>9} {metrics['hit_rate']:>8.1%} "
+            f"{metrics['p50_seconds'] * 1e3:>9.2f} {metrics['p99_seconds'] * 1e3:>9.2f} "
+            f"{metrics['bytes_read'] / 2**20:>9.1f} "
+            f"{metrics['bytes_written'] / 2**20:>11.1f}  {name}"
+            for name, metrics in nodes
+        )
+        return "\n".join(lines)
+
+    def export(self, **fields: Any) -> None:
+        """Append a JSON line per node to the path given to `enable`, if any.
+
+        The extra `fields` (e.g. `epoch=3`) are added to every line. Counters are
+        cumulative, so consecutive exports can be subtracted to get per-epoch values.
+        """
+        if self._jsonl_path is None:
+            return
+
+        timestamp = time.time()
+        with self._jsonl_path.open("a", encoding="utf-8") as file:
+            for name, metrics in self.snapshot().items():
+                line = {"time": timestamp, **fields, "node": name, **metrics}
+                file.write(_json.dumps(line) + "\n")
+
+    def _node(self, node: object) -> NodeMetrics:
+        name = node_name(node)
+        if (metrics := self._nodes.get(name)) is None:
+            metrics = self._nodes[name] = NodeMetrics()
+        return metrics
+
+
+def node_name(node: object) -> str:
+    """Return the name `node` reports under: its `metrics_name`, or else its `repr`."""
+    if isinstance(node, str):
+        return node
+    return getattr(node, "metrics_name", None) or repr(node)
+
+
+METRICS = MetricsRegistry()
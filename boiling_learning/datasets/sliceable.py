@@ -1,11 +1,18 @@
 from __future__ import annotations
 
 import abc
+import atexit
+import concurrent.futures
+import contextlib
+import dataclasses
+import functools
 import itertools
 import math
+import multiprocessing
+import queue
 import random
-from collections import defaultdict
-from collections.abc import Callable, Iterable, Iterator, Sequence
+import threading
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
 from fractions import Fraction
 from operator import itemgetter
 from typing import (
@@ -19,9 +26,14 @@ from typing import (
 )
 
 import more_itertools as mit
+import numpy as np
+import numpy.typing as npt
 from iteround import saferound
 from typing_extensions import TypeVarTuple, Unpack
 
+from boiling_learning.datasets.metrics import METRICS
+from boiling_learning.utils.random import LazyPermutation
+
 _T = TypeVar("_T")
 _U = TypeVar("_U")
 _X = TypeVar("_X")
@@ -29,7 +41,8 @@ _X2 = TypeVar("_X2")
 _Y = TypeVar("_Y")
 _Y2 = TypeVar("_Y2")
 _Ts = TypeVarTuple("_Ts")
-BooleanMask = list[bool]
+BooleanMask = list[bool] | npt.NDArray[np.bool_]
+Indices: TypeAlias = range | np.ndarray | LazyPermutation
 
 
 class SliceableDataset(abc.ABC, Sequence[_T]):
@@ -58,14 +71,19 @@ class SliceableDataset(abc.ABC, Sequence[_T]):
     def __getitem__(
         self, key: int | slice | Sequence[bool] | Iterable[int]
     ) -> _T | SliceableDataset[_T]:
-        if isinstance(key, int):
+        if isinstance(key, int | np.integer):
+            key = int(key)
             length = len(self)
             if key >= length:
                 raise IndexError(key, length)
 
             return self.getitem_from_index(key)
 
-        if self._is_boolean_mask(key):
+        key = _as_array_key(key)
+
+        if self._is_boolean_mask(key) or (
+            isinstance(key, np.ndarray) and key.dtype == np.bool_
+        ):
             return self.getitem_from_boolean_mask(key)
 
         if isinstance(key, slice):
@@ -80,9 +98,7 @@ class SliceableDataset(abc.ABC, Sequence[_T]):
         if not self._is_boolean_mask(mask):
             raise ValueError(f"not a valid boolean mask: {mask}")
 
-        indices = range(len(self))
-        filtered_indices = tuple(itertools.compress(indices, mask))
-        return self.getitem_from_indices(filtered_indices)
+        return self.getitem_from_indices(np.flatnonzero(mask))
 
     def getitem_from_slice(self, slice_: slice) -> SliceableDataset[_T]:
         start, stop, step = slice_.start, slice_.stop, slice_.step
@@ -164,13 +180,27 @@ class SliceableDataset(abc.ABC, Sequence[_T]):
     def repeat(self, count: int) -> SliceableDataset[_T]:
         return SliceableDataset.concatenate(*(self for _ in range(count)))
 
-    def map(self, __map_func: Callable[[_T], _U]) -> SliceableDataset[_U]:
-        return MapSliceableDataset(__map_func, self)
+    def map(
+        self,
+        __map_func: Callable[[_T], _U],
+        /,
+        *,
+        num_parallel: int | None = None,
+        executor: Literal["thread", "process"] = "thread",
+    ) -> SliceableDataset[_U]:
+        return MapSliceableDataset(
+            __map_func, self, num_parallel=num_parallel, executor=executor
+        )
+
+    def map_batched(
+        self, __map_func: Callable[[np.ndarray], np.ndarray], /
+    ) -> BatchedMapSliceableDataset:
+        return BatchedMapSliceableDataset(__map_func, self)
 
-    def shuffle(self) -> SliceableDataset[_T]:
+    def shuffle(self, *, seed: int | None = None) -> SliceableDataset[_T]:
         # using `random.sample` indirectly as per the docs:
         # https://docs.python.org/3/library/random.html#random.shuffle
-        return self.sample(len(self))
+        return self.sample(len(self), seed=seed)
 
     def take(self, count: int | Fraction) -> SliceableDataset[_T]:
         if isinstance(count, Fraction):
@@ -186,13 +216,30 @@ class SliceableDataset(abc.ABC, Sequence[_T]):
 
         return self[count:]
 
-    def sample(self, count: int | Fraction) -> SliceableDataset[_T]:
+    def sample(
+        self, count: int | Fraction, *, seed: int | None = None
+    ) -> SliceableDataset[_T]:
+        """Sample `count` elements without replacement.
+
+        Without a `seed`, the global `random` state is used and the sampled indices are
+        materialized. With a `seed`, the sample is a lazily evaluated permutation that
+        takes constant memory and is independent of the global state.
+        """
         total = len(self)
 
         if isinstance(count, Fraction):
             count = int(count * total)
 
-        indices = random.sample(range(total), count)
+        if not 0 <= count <= total:
+            raise ValueError(
+                f"cannot sample {count} elements from a dataset of length {total}"
+            )
+
+        indices: Iterable[int] = (
+            random.sample(range(total), count)
+            if seed is None
+            else LazyPermutation(total, seed)[:count]
+        )
 
         return self[indices]
 
@@ -279,12 +326,55 @@ class SliceableDataset(abc.ABC, Sequence[_T]):
 
         return tuple(splits)
 
-    def prefetch(self, buffer_size: int | None = None) -> PrefetchedDataset[_T]:
-        return PrefetchedDataset(self, buffer_size)
+    def shard(
+        self,
+        num_shards: int,
+        shard_index: int,
+        *,
+        mode: Literal["contiguous", "interleaved"] = "contiguous",
+        alignment: int = 1,
+    ) -> SliceableDataset[_T]:
+        """Select the `shard_index`-th of `num_shards` disjoint parts of this dataset.
+
+        Shards are index-only views covering the whole dataset. In `"contiguous"` mode,
+        each shard is a single block whose boundaries are multiples of `alignment`
+        (for instance, the chunk length of an underlying HDF5 cache), so that shards
+        never share chunks. In `"interleaved"` mode, shard `i` takes every
+        `num_shards`-th element starting from `i`.
+        """
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(
+                f"shard index must be in [0, {num_shards}), got {shard_index}"
+            )
+
+        if mode == "interleaved":
+            return self[shard_index::num_shards]
+
+        if mode != "contiguous":
+            raise ValueError(f"unsupported sharding mode: {mode}")
+
+        blocks = math.ceil(len(self) / alignment)
+        start, stop = (
+            min(blocks * index // num_shards * alignment, len(self))
+            for index in (shard_index, shard_index + 1)
+        )
+        return self[start:stop]
+
+    def prefetch(
+        self, buffer_size: int | None = None, *, in_flight: int = 0
+    ) -> PrefetchedDataset[_T]:
+        return PrefetchedDataset(self, buffer_size, in_flight=in_flight)
 
     def batch(self, batch_size: int) -> BatchSliceableDataset[_T]:
         return BatchSliceableDataset(self, batch_size)
 
+    def window(
+        self, size: int, stride: int = 1, *, drop_remainder: bool = True
+    ) -> WindowSliceableDataset:
+        return WindowSliceableDataset(
+            self, size, stride=stride, drop_remainder=drop_remainder
+        )
+
     def unbatch(self: SliceableDataset[SliceableDataset[_U]]) -> SliceableDataset[_U]:
         return SliceableDataset.concatenate(*self)
 
@@ -294,7 +384,59 @@ class SliceableDataset(abc.ABC, Sequence[_T]):
     def fetch(self, indices: Iterable[int] | None = None) -> Sequence[_T]:
         return tuple(self[indices] if indices is not None else self)
 
+    def fetch_columns(self, indices: Iterable[int] | None = None) -> Any:
+        """Fetch elements in a columnar (struct-of-arrays) layout.
+
+        Tuples become tuples of columns, mappings become dictionaries of columns and
+        everything else is stacked into an array whose leading dimension indexes the
+        fetched elements. For instance, fetching `n` pairs `(image, {"power": p})`
+        yields `(images, {"power": powers})`, where both arrays have `n` rows.
+        """
+        fetched = self.fetch(indices)
+        if not len(fetched) and len(self):
+            # the layout of an empty fetch is taken from an element
+            return _empty_columns(self[0])
+        return _rows_to_columns(fetched)
+
+    def fetch_into(self, indices: Iterable[int] | None, out: np.ndarray) -> np.ndarray:
+        """Write the fetched elements into the preallocated array `out` and return it.
+
+        The leading dimension of `out` must match the number of requested elements.
+        Datasets that can write their elements in place override this method; the
+        default implementation copies the result of `fetch`.
+        """
+        fetched = self.fetch(indices)
+        check_output_length(out, len(fetched))
+        if isinstance(fetched, np.ndarray):
+            out[...] = fetched
+        else:
+            for position, element in enumerate(fetched):
+                out[position] = element
+        return out
+
+    def optimize(self) -> SliceableDataset[_T]:
+        """Return an equivalent dataset with a simpler graph.
+
+        Consecutive maps are fused, index selections are pushed below maps and zips,
+        nested index selections are collapsed and identity selections are dropped.
+        """
+        return _optimize(self)
+
+    def explain(self, count: int | None = None) -> str:
+        """Describe the optimized graph of this dataset, one node per line.
+
+        Each node is annotated with the estimated number of elements it fetches when
+        `count` elements (by default, all of them) are fetched from the root.
+        """
+        optimized = self.optimize()
+        return "\n".join(
+            _explain(optimized, len(optimized) if count is None else count, depth=0)
+        )
+
     def _is_boolean_mask(self, key: Any) -> TypeGuard[BooleanMask]:
+        if isinstance(key, np.ndarray):
+            return key.dtype == np.bool_ and key.shape == (len(self),)
+
         return (
             isinstance(key, list)
             and len(key) == len(self)
@@ -327,6 +469,12 @@ class ProxySliceableDataset(SliceableDataset[_T]):
     def fetch(self, indices: Iterable[int] | None = None) -> Sequence[_T]:
         return self._ancestor.fetch(indices)
 
+    def fetch_into(self, indices: Iterable[int] | None, out: np.ndarray) -> np.ndarray:
+        return self._ancestor.fetch_into(indices, out)
+
+    def fetch_columns(self, indices: Iterable[int] | None = None) -> Any:
+        return self._ancestor.fetch_columns(indices)
+
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}({self._ancestor})"
 
@@ -368,14 +516,21 @@ class GetItemSliceableDataset(SliceableDataset[_T]):
 
 class ComposedIndicesSliceableDataset(SliceableDataset[_T]):
     def __init__(self, ancestor: SliceableDataset[_T], indices: Iterable[int]) -> None:
-        self._ancestor = ancestor
-        self._indices = tuple(indices)
+        normalized_indices = _normalize_indices(indices, len(ancestor))
+
+        if isinstance(ancestor, ComposedIndicesSliceableDataset):
+            # collapse nested index selections into a single level
+            normalized_indices = ancestor._rebase_indices(normalized_indices)
+            ancestor = ancestor._ancestor
+
+        self._ancestor: SliceableDataset[_T] = ancestor
+        self._indices: Indices = normalized_indices
 
     def __len__(self) -> int:
         return len(self._indices)
 
     def getitem_from_index(self, index: int) -> _T:
-        return self._ancestor[self._indices[index]]
+        return self._ancestor[int(self._indices[index])]
 
     def getitem_from_indices(self, indices: Iterable[int]) -> SliceableDataset[_T]:
         return self._ancestor[self._rebase_indices(indices)]
@@ -389,8 +544,22 @@ class ComposedIndicesSliceableDataset(SliceableDataset[_T]):
         )
         return self._ancestor.fetch(rebased_indices)
 
-    def _rebase_indices(self, indices: Iterable[int]) -> tuple[int, ...]:
-        return tuple(self._indices[index] for index in indices)
+    def fetch_into(self, indices: Iterable[int] | None, out: np.ndarray) -> np.ndarray:
+        rebased_indices = (
+            self._indices if indices is None else self._rebase_indices(indices)
+        )
+        return self._ancestor.fetch_into(rebased_indices, out)
+
+    def fetch_columns(self, indices: Iterable[int] | None = None) -> Any:
+        rebased_indices = (
+            self._indices if indices is None else self._rebase_indices(indices)
+        )
+        return self._ancestor.fetch_columns(rebased_indices)
+
+    def _rebase_indices(self, indices: Iterable[int]) -> Indices:
+        return _compose_indices(
+            self._indices, _normalize_indices(indices, len(self._indices))
+        )
 
 
 class ZippedSliceableDataset(
@@ -434,7 +603,7 @@ class ZippedSliceableDataset(
 
     def fetch(self, indices: Iterable[int] | None = None) -> tuple[tuple[Unpack[_Ts]]]:
         if indices is not None:
-            indices = tuple(indices)
+            indices = _normalize_indices(indices, len(self))
 
         return tuple(
             zip(
@@ -445,6 +614,13 @@ class ZippedSliceableDataset(
             )
         )
 
+    def fetch_columns(self, indices: Iterable[int] | None = None) -> tuple[Any, ...]:
+        # ancestors may be longer than the zipped dataset
+        indices = _normalize_indices(
+            range(len(self)) if indices is None else indices, len(self)
+        )
+        return tuple(dataset.fetch_columns(indices) for dataset in self._ancestors)
+
     def _check_lengths(self, lengths: list[int]) -> None:
         if self._strictness == "one-off":
             self._check_one_off(lengths)
@@ -475,8 +651,14 @@ class ConcatenateSliceableDataset(SliceableDataset[_T]):
     def __init__(self, *datasets: SliceableDataset[_T]) -> None:
         self._ancestors = datasets
 
+    @functools.cached_property
+    def _offsets(self) -> np.ndarray:
+        # `_offsets[i]` is the absolute index of the first element of the i-th ancestor
+        lengths = [len(ancestor) for ancestor in self._ancestors]
+        return np.concatenate(([0], np.cumsum(lengths, dtype=np.intp)))
+
     def __len__(self) -> int:
-        return sum(len(ancestor) for ancestor in self._ancestors)
+        return int(self._offsets[-1])
 
     def __repr__(self) -> str:
         ancestors = ", ".join(repr(ancestor) for ancestor in self._ancestors)
@@ -488,7 +670,7 @@ class ConcatenateSliceableDataset(SliceableDataset[_T]):
         )
         return self._ancestors[ancestor_index][relative_index]
 
-    def fetch(self, indices: Iterable[int] | None = None) -> tuple[_T, ...]:
+    def fetch(self, indices: Iterable[int] | None = None) -> Sequence[_T]:
         if indices is None:
             return tuple(
                 itertools.chain.from_iterable(
@@ -496,45 +678,142 @@ class ConcatenateSliceableDataset(SliceableDataset[_T]):
                 )
             )
 
-        grouped_indices: defaultdict[int, list[tuple[int, int]]] = defaultdict(list)
-        for position, index in enumerate(indices):
-            ancestor_index, relative_index = (
-                self._absolute_index_to_ancestor_and_relative_index(index)
-            )
-            grouped_indices[ancestor_index].append((position, relative_index))
+        groups = tuple(self._group_indices(indices))
+        if not groups:
+            return ()
 
-        position_value_pairs: list[tuple[int, _T]] = []
-        for ancestor_index, position_relative_index_pairs in grouped_indices.items():
-            if not position_relative_index_pairs:
-                continue
+        sorted_positions = np.concatenate([positions for _, positions, _ in groups])
+        fetched_groups = [
+            self._ancestors[ancestor_index].fetch(relative_indices)
+            for ancestor_index, _, relative_indices in groups
+        ]
 
-            positions, relative_indices = mit.unzip(position_relative_index_pairs)
-            values = self._ancestors[ancestor_index].fetch(relative_indices)
-            position_value_pairs.extend(zip(positions, values))
+        # scatter the grouped values back into the requested positions
+        unsorters = np.argsort(sorted_positions)
+        if _are_stackable(fetched_groups):
+            return np.concatenate(fetched_groups)[unsorters]
 
-        return tuple(
-            value for _, value in sorted(position_value_pairs, key=itemgetter(0))
+        sorted_values = tuple(itertools.chain.from_iterable(fetched_groups))
+        return tuple(sorted_values[position] for position in unsorters)
+
+    def fetch_columns(self, indices: Iterable[int] | None = None) -> Any:
+        groups = tuple(
+            self._group_indices(range(len(self)) if indices is None else indices)
+        )
+        if not groups:
+            return next(
+                (
+                    ancestor.fetch_columns(())
+                    for ancestor in self._ancestors
+                    if len(ancestor)
+                ),
+                np.empty(0),
+            )
+
+        sorted_positions = np.concatenate([positions for _, positions, _ in groups])
+        columns = _concatenate_columns(
+            [
+                self._ancestors[ancestor_index].fetch_columns(relative_indices)
+                for ancestor_index, _, relative_indices in groups
+            ]
         )
+        return _take_columns(columns, np.argsort(sorted_positions))
+
+    def fetch_into(self, indices: Iterable[int] | None, out: np.ndarray) -> np.ndarray:
+        absolute_indices = _normalize_indices(
+            range(len(self)) if indices is None else indices, len(self)
+        )
+        check_output_length(out, len(absolute_indices))
+
+        for ancestor_index, positions, relative_indices in self._group_indices(
+            absolute_indices
+        ):
+            ancestor = self._ancestors[ancestor_index]
+            first, last = positions[0], positions[-1]
+            if last - first + 1 == len(positions) and (np.diff(positions) == 1).all():
+                # contiguous positions are written in place
+                ancestor.fetch_into(relative_indices, out[first : last + 1])
+            else:
+                out[positions] = ancestor.fetch_into(
+                    relative_indices,
+                    np.empty((len(positions), *out.shape[1:]), dtype=out.dtype),
+                )
+
+        return out
+
+    def _group_indices(
+        self, indices: Iterable[int]
+    ) -> Iterator[tuple[int, np.ndarray, np.ndarray]]:
+        """Group absolute indices by ancestor.
+
+        Yield triplets `(ancestor_index, positions, relative_indices)`, where `positions`
+        are the positions of the group in `indices`, in their requested order.
+        """
+        absolute_indices = np.asarray(_normalize_indices(indices, len(self)))
+        if not absolute_indices.size:
+            return
+
+        if absolute_indices.max() >= len(self):
+            raise IndexError(int(absolute_indices.max()), len(self))
+
+        ancestor_indices = self._route(absolute_indices)
+        relative_indices = absolute_indices - self._offsets[ancestor_indices]
+
+        order = np.argsort(ancestor_indices, kind="stable")
+        sorted_ancestor_indices = ancestor_indices[order]
+        group_starts = np.flatnonzero(np.diff(sorted_ancestor_indices, prepend=-1) != 0)
+        group_stops = np.append(group_starts[1:], order.size)
+
+        for group_start, group_stop in zip(group_starts, group_stops):
+            positions = order[group_start:group_stop]
+            yield (
+                int(sorted_ancestor_indices[group_start]),
+                positions,
+                relative_indices[positions],
+            )
 
     def _absolute_index_to_ancestor_and_relative_index(
         self, index: int
     ) -> tuple[int, int]:
-        relative_index = index
-        for ancestor_index, ancestor in enumerate(self._ancestors):
-            ancestor_length = len(ancestor)
-            if relative_index < ancestor_length:
-                return ancestor_index, relative_index
-            relative_index -= ancestor_length
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError(index)
 
-        raise IndexError(index)
+        ancestor_index = int(self._route(np.intp(index)))
+        return ancestor_index, index - int(self._offsets[ancestor_index])
+
+    def _route(self, indices: np.ndarray) -> np.ndarray:
+        # `side="right"` skips over empty ancestors, which share their offsets
+        return np.searchsorted(self._offsets, indices, side="right") - 1
 
 
 class MapSliceableDataset(SliceableDataset[_U]):
+    """Apply a function to each element of a dataset.
+
+    Args:
+        num_parallel: when greater than one, each fetch is split into this many chunks,
+            which are mapped concurrently on a persistent pool shared by all datasets
+            with the same settings. Output order is preserved.
+        executor: `"thread"` works best for functions that release the GIL, such as
+            most NumPy operations. `"process"` requires both the function and the
+            elements to be picklable. Workers are spawned rather than forked, since the
+            parent may hold TensorFlow state, threads and open HDF5 handles.
+    """
+
     def __init__(
-        self, map_func: Callable[[_T], _U], dataset: SliceableDataset[_T]
+        self,
+        map_func: Callable[[_T], _U],
+        dataset: SliceableDataset[_T],
+        *,
+        num_parallel: int | None = None,
+        executor: Literal["thread", "process"] = "thread",
     ) -> None:
         self._map = map_func
         self._ancestor = dataset
+        self._num_parallel = num_parallel
+        self._executor = executor
 
     def __iter__(self) -> Iterator[_U]:
         return (self._map(element) for element in self._ancestor)
@@ -546,14 +825,152 @@ class MapSliceableDataset(SliceableDataset[_U]):
         return self._map(self._ancestor[index])
 
     def getitem_from_indices(self, indices: Iterable[int]) -> MapSliceableDataset[_U]:
-        return MapSliceableDataset(self._map, self._ancestor[indices])
+        return MapSliceableDataset(
+            self._map,
+            self._ancestor[indices],
+            num_parallel=self._num_parallel,
+            executor=self._executor,
+        )
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}({self._map}, {self._ancestor})"
 
+    @property
+    def metrics_name(self) -> str:
+        # the ancestors are reported separately
+        return f"{self.__class__.__name__}({self._map})"
+
     def fetch(self, indices: Iterable[int] | None = None) -> tuple[_U, ...]:
         fetched = self._ancestor.fetch(indices)
-        return tuple(map(self._map, fetched))
+
+        with METRICS.timing(self):
+            mapped = self._map_fetched(fetched)
+        METRICS.record(self, items_read=len(fetched))
+        return mapped
+
+    def fetch_into(self, indices: Iterable[int] | None, out: np.ndarray) -> np.ndarray:
+        if self._num_parallel is not None and self._num_parallel > 1:
+            return super().fetch_into(indices, out)
+
+        fetched = self._ancestor.fetch(indices)
+        check_output_length(out, len(fetched))
+        with METRICS.timing(self):
+            for position, element in enumerate(fetched):
+                out[position] = self._map(element)
+        METRICS.record(self, items_read=len(fetched))
+        return out
+
+    def _map_fetched(self, fetched: Sequence[_T]) -> tuple[_U, ...]:
+        if self._num_parallel is None or self._num_parallel <= 1 or len(fetched) <= 1:
+            return tuple(map(self._map, fetched))
+
+        chunk_count = min(self._num_parallel, len(fetched))
+        boundaries = [
+            len(fetched) * index // chunk_count for index in range(chunk_count + 1)
+        ]
+        chunks = [fetched[start:stop] for start, stop in itertools.pairwise(boundaries)]
+
+        pool = _get_pool(self._executor, self._num_parallel)
+        mapped_chunks = pool.map(functools.partial(_map_chunk, self._map), chunks)
+        return tuple(itertools.chain.from_iterable(mapped_chunks))
+
+
+@functools.cache
+def _get_pool(
+    executor: Literal["thread", "process"], max_workers: int
+) -> concurrent.futures.Executor:
+    pool: concurrent.futures.Executor
+    if executor == "thread":
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers)
+    elif executor == "process":
+        pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    else:
+        raise ValueError(f"unsupported executor: {executor}")
+
+    atexit.register(pool.shutdown, cancel_futures=True)
+    return pool
+
+
+def _map_chunk(map_func: Callable[[_T], _U], chunk: Sequence[_T]) -> list[_U]:
+    return [map_func(element) for element in chunk]
+
+
+class BatchedMapSliceableDataset(SliceableDataset[Any]):
+    """Apply a vectorized function to whole fetches at once.
+
+    The mapping function receives the fetched elements stacked into a single array and
+    must return an array with the same leading dimension, where the `i`-th row is the
+    image of the `i`-th input row. Consecutive batched maps are fused into a single
+    dataset that applies all functions in one pass.
+    """
+
+    def __init__(
+        self,
+        map_func: Callable[[np.ndarray], np.ndarray],
+        ancestor: SliceableDataset[Any],
+        /,
+    ) -> None:
+        if isinstance(ancestor, BatchedMapSliceableDataset):
+            self._maps: tuple[Callable[[np.ndarray], np.ndarray], ...] = (
+                *ancestor._maps,
+                map_func,
+            )
+            self._ancestor: SliceableDataset[Any] = ancestor._ancestor
+        else:
+            self._maps = (map_func,)
+            self._ancestor = ancestor
+
+    def __len__(self) -> int:
+        return len(self._ancestor)
+
+    def __repr__(self) -> str:
+        maps = ", ".join(repr(map_func) for map_func in self._maps)
+        return f"{self.__class__.__name__}([{maps}], {self._ancestor})"
+
+    def getitem_from_index(self, index: int) -> Any:
+        return self.fetch((index,))[0]
+
+    def getitem_from_indices(
+        self, indices: Iterable[int]
+    ) -> BatchedMapSliceableDataset:
+        return self._with_ancestor(self._ancestor[indices])
+
+    @property
+    def metrics_name(self) -> str:
+        maps = ", ".join(str(map_func) for map_func in self._maps)
+        return f"{self.__class__.__name__}([{maps}])"
+
+    def fetch(self, indices: Iterable[int] | None = None) -> np.ndarray:
+        batch = _ensure_array(self._ancestor.fetch(indices))
+        if not len(batch):
+            return batch
+
+        with METRICS.timing(self):
+            for map_func in self._maps:
+                length = len(batch)
+                batch = map_func(batch)
+                if len(batch) != length:
+                    raise ValueError(
+                        f"batched map {map_func} changed the leading dimension "
+                        f"from {length} to {len(batch)}"
+                    )
+
+        METRICS.record(self, items_read=len(batch))
+        return batch
+
+    def _with_ancestor(
+        self, ancestor: SliceableDataset[Any]
+    ) -> BatchedMapSliceableDataset:
+        dataset = BatchedMapSliceableDataset(self._maps[0], ancestor)
+        for map_func in self._maps[1:]:
+            dataset = BatchedMapSliceableDataset(map_func, dataset)
+        return dataset
+
+
+def _ensure_array(sequence: Sequence[Any]) -> np.ndarray:
+    return sequence if isinstance(sequence, np.ndarray) else np.array(sequence)
 
 
 class BatchSliceableDataset(SliceableDataset[SliceableDataset[_T]], Generic[_T]):
@@ -573,17 +990,200 @@ class BatchSliceableDataset(SliceableDataset[SliceableDataset[_T]], Generic[_T])
         return f"{self.__class__.__name__}({self._ancestor}, {self._batch_size})"
 
 
+class WindowSliceableDataset(SliceableDataset[np.ndarray]):
+    """Stacks of `size` consecutive elements, starting every `stride` elements.
+
+    Each element is an array with shape `(size, *element_shape)`. Fetching many windows
+    reads each underlying element only once, even when windows overlap. Unless
+    `drop_remainder` is set, trailing windows may be shorter than `size`.
+    """
+
+    def __init__(
+        self,
+        ancestor: SliceableDataset[Any],
+        size: int,
+        *,
+        stride: int = 1,
+        drop_remainder: bool = True,
+    ) -> None:
+        if size < 1 or stride < 1:
+            raise ValueError(
+                f"window size and stride must be positive, got {size} and {stride}"
+            )
+
+        self._ancestor = ancestor
+        self._size = size
+        self._stride = stride
+        self._drop_remainder = drop_remainder
+
+    def __len__(self) -> int:
+        length = len(self._ancestor)
+        if self._drop_remainder:
+            return max(0, (length - self._size) // self._stride + 1)
+        return math.ceil(length / self._stride)
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}({self._ancestor}, {self._size}, "
+            f"stride={self._stride}, drop_remainder={self._drop_remainder})"
+        )
+
+    def getitem_from_index(self, index: int) -> np.ndarray:
+        return self.fetch((index,))[0]
+
+    def fetch(
+        self, indices: Iterable[int] | None = None
+    ) -> np.ndarray | tuple[np.ndarray, ...]:
+        window_indices = np.asarray(
+            _normalize_indices(
+                range(len(self)) if indices is None else indices, len(self)
+            )
+        )
+        if not window_indices.size:
+            return ()
+        if window_indices.max() >= len(self):
+            raise IndexError(int(window_indices.max()), len(self))
+
+        starts = window_indices * self._stride
+        stops = np.minimum(starts + self._size, len(self._ancestor))
+
+        # read the union of all windows once
+        needed = np.unique(
+            (starts[:, np.newaxis] + np.arange(self._size)).clip(
+                max=len(self._ancestor) - 1
+            )
+        )
+        elements = _ensure_array(self._ancestor.fetch(needed))
+        # every window is a contiguous run of `needed`
+        offsets = np.searchsorted(needed, starts)
+
+        if (stops - starts == self._size).all():
+            views = np.moveaxis(
+                np.lib.stride_tricks.sliding_window_view(elements, self._size, axis=0),
+                -1,
+                1,
+            )
+            return views[offsets]
+
+        return tuple(
+            elements[offset : offset + stop - start]
+            for offset, start, stop in zip(offsets, starts, stops)
+        )
+
+
 class PrefetchedDataset(ProxySliceableDataset[_T]):
-    def __init__(self, ancestor: SliceableDataset[_T], buffer_size: int | None) -> None:
+    """Iterate over a dataset fetching `buffer_size` elements at a time.
+
+    Args:
+        in_flight: when positive, buffers are fetched by a background thread while the
+            consumer iterates, keeping at most `in_flight` fetched buffers waiting to be
+            consumed. The thread is stopped as soon as the iterator is exhausted, closed
+            or garbage collected. Statistics about the latest iteration are available
+            through `statistics`.
+    """
+
+    def __init__(
+        self,
+        ancestor: SliceableDataset[_T],
+        buffer_size: int | None,
+        *,
+        in_flight: int = 0,
+    ) -> None:
         super().__init__(ancestor)
         self._buffer_size = buffer_size if buffer_size is not None else len(self)
+        self._in_flight = in_flight
+        self.statistics = PrefetchStatistics()
 
     def __iter__(self) -> Iterator[_T]:
-        for buffer_indices in SliceableDataset.range(len(self)).batch(
-            self._buffer_size
-        ):
+        if self._in_flight > 0:
+            return self._iter_in_background()
+        return self._iter_in_foreground()
+
+    def _iter_in_foreground(self) -> Iterator[_T]:
+        for buffer_indices in self._buffer_indices():
             yield from self.fetch(buffer_indices)
 
+    def _iter_in_background(self) -> Iterator[_T]:
+        statistics = self.statistics = PrefetchStatistics()
+        buffers: queue.Queue[tuple[Sequence[_T] | None, BaseException | None]] = (
+            queue.Queue(maxsize=self._in_flight)
+        )
+        stop = threading.Event()
+
+        def _put(item: tuple[Sequence[_T] | None, BaseException | None]) -> bool:
+            while not stop.is_set():
+                try:
+                    buffers.put(item, timeout=_PREFETCH_POLL_INTERVAL)
+                except queue.Full:
+                    continue
+                return True
+            return False
+
+        def _produce() -> None:
+            try:
+                for buffer_indices in self._buffer_indices():
+                    if stop.is_set() or not _put((self.fetch(buffer_indices), None)):
+                        return
+                _put((None, None))
+            except BaseException as error:  # re-raised by the consumer
+                _put((None, error))
+
+        producer = threading.Thread(target=_produce, daemon=True)
+        producer.start()
+
+        try:
+            while True:
+                depth = buffers.qsize()
+                statistics.record_depth(depth)
+                if not depth:
+                    statistics.consumer_waits += 1
+
+                buffer, error = buffers.get()
+                if error is not None:
+                    raise error
+                if buffer is None:
+                    return
+
+                statistics.buffers += 1
+                yield from buffer
+        finally:
+            stop.set()
+            # unblock the producer if it is waiting for room in the queue
+            with contextlib.suppress(queue.Empty):
+                while True:
+                    buffers.get_nowait()
+            producer.join()
+
+    def _buffer_indices(self) -> Iterator[SliceableDataset[int]]:
+        return iter(SliceableDataset.range(len(self)).batch(self._buffer_size))
+
+
+_PREFETCH_POLL_INTERVAL = 0.1
+
+
+@dataclasses.dataclass
+class PrefetchStatistics:
+    """Queue statistics of the latest background iteration over a `PrefetchedDataset`.
+
+    `consumer_waits` counts how many buffers the consumer had to wait for, i.e. how often
+    the queue was empty when a new buffer was needed.
+    """
+
+    buffers: int = 0
+    consumer_waits: int = 0
+    max_depth: int = 0
+    depth_samples: int = 0
+    total_depth: int = 0
+
+    def record_depth(self, depth: int) -> None:
+        self.depth_samples += 1
+        self.total_depth += depth
+        self.max_depth = max(self.max_depth, depth)
+
+    @property
+    def mean_depth(self) -> float:
+        return self.total_depth / self.depth_samples if self.depth_samples else 0.0
+
 
 class CachedSliceableDataset(SliceableDataset[_T]):
     def __init__(
@@ -601,10 +1201,106 @@ class CachedSliceableDataset(SliceableDataset[_T]):
     def fetch(self, indices: Iterable[int] | None = None) -> Sequence[_T]:
         return self._cache.fetch_from(self._ancestor, indices)
 
+    def fetch_into(self, indices: Iterable[int] | None, out: np.ndarray) -> np.ndarray:
+        return self._cache.fetch_into_from(self._ancestor, indices, out)
+
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}({self._ancestor}, {self._cache})"
 
 
+class BufferRing:
+    """A fixed set of preallocated arrays handed out in a round-robin fashion.
+
+    Use it to feed `fetch_into` without allocating a new array per batch. An array
+    returned by `next_buffer` is reused after `size` further calls, so consumers must
+    be done with it by then.
+    """
+
+    def __init__(
+        self, shape: tuple[int, ...], dtype: npt.DTypeLike, *, size: int = 2
+    ) -> None:
+        self._buffers = tuple(np.empty(shape, dtype=dtype) for _ in range(size))
+        self._cycle = itertools.cycle(self._buffers)
+
+    def next_buffer(self, length: int | None = None) -> np.ndarray:
+        """Return the next buffer, optionally truncated to its first `length` rows."""
+        buffer = next(self._cycle)
+        return buffer if length is None else buffer[:length]
+
+    def __repr__(self) -> str:
+        shape = self._buffers[0].shape
+        dtype = self._buffers[0].dtype
+        return f"{self.__class__.__name__}({shape}, {dtype}, size={len(self._buffers)})"
+
+
+def _rows_to_columns(rows: Sequence[Any]) -> Any:
+    if isinstance(rows, np.ndarray) or not len(rows):
+        return np.asarray(rows)
+
+    first = rows[0]
+    if isinstance(first, tuple):
+        return tuple(
+            _rows_to_columns([row[position] for row in rows])
+            for position in range(len(first))
+        )
+    if isinstance(first, Mapping):
+        return {key: _rows_to_columns([row[key] for row in rows]) for key in first}
+    return np.asarray(rows)
+
+
+def _empty_columns(element: Any) -> Any:
+    if isinstance(element, tuple):
+        return tuple(_empty_columns(item) for item in element)
+    if isinstance(element, Mapping):
+        return {key: _empty_columns(item) for key, item in element.items()}
+    element = np.asarray(element)
+    return np.empty((0, *element.shape), dtype=element.dtype)
+
+
+def _are_stackable(arrays: Sequence[Any]) -> bool:
+    """Return whether `arrays` can be concatenated without reshaping or upcasting."""
+    if not all(isinstance(array, np.ndarray) for array in arrays):
+        return False
+
+    first = arrays[0]
+    return all(
+        array.shape[1:] == first.shape[1:] and array.dtype == first.dtype
+        for array in arrays
+    )
+
+
+def _concatenate_columns(columns: Sequence[Any]) -> Any:
+    first = columns[0]
+    if isinstance(first, tuple):
+        return tuple(
+            _concatenate_columns([column[position] for column in columns])
+            for position in range(len(first))
+        )
+    if isinstance(first, Mapping):
+        return {
+            key: _concatenate_columns([column[key] for column in columns])
+            for key in first
+        }
+    return np.concatenate(columns)
+
+
+def _take_columns(columns: Any, positions: np.ndarray) -> Any:
+    if isinstance(columns, tuple):
+        return tuple(_take_columns(column, positions) for column in columns)
+    if isinstance(columns, Mapping):
+        return {
+            key: _take_columns(column, positions) for key, column in columns.items()
+        }
+    return columns[positions]
+
+
+def check_output_length(out: np.ndarray, length: int) -> None:
+    if len(out) != length:
+        raise ValueError(
+            f"output array has leading dimension {len(out)}, expected {length}"
+        )
+
+
 class SliceableDatasetCache(abc.ABC, Generic[_T]):
     @abc.abstractmethod
     def fetch_from(
@@ -612,6 +1308,17 @@ class SliceableDatasetCache(abc.ABC, Generic[_T]):
     ) -> Sequence[_T]:
         pass
 
+    def fetch_into_from(
+        self,
+        source: SliceableDataset[_T],
+        indices: Iterable[int] | None,
+        out: np.ndarray,
+    ) -> np.ndarray:
+        fetched = self.fetch_from(source, indices)
+        check_output_length(out, len(fetched))
+        out[...] = fetched
+        return out
+
     @abc.abstractmethod
     def __repr__(self) -> str:
         pass
@@ -621,19 +1328,11 @@ SupervisedSliceableDataset: TypeAlias = SliceableDataset[tuple[_X, _Y]]
 
 
 def features(dataset: SupervisedSliceableDataset[_X, _Y]) -> SliceableDataset[_X]:
-    # TODO: huge optimization opportunity:
-    # - for ZipSliceableDataset, return the first ancestor
-    # - for other types of datasets, try to inspect its parents and recurse using
-    # `features`. For instance:
-    #     features(ConcatenateSliceableDataset(dataset1, dataset2))
-    #     == ConcatSliceableDataset(features(dataset1), features(dataset2))
-    # - when impossible to recurse, use the current implementation
-    return dataset.map(itemgetter(0))
+    return _project(dataset, 0)
 
 
 def targets(dataset: SupervisedSliceableDataset[_X, _Y]) -> SliceableDataset[_Y]:
-    # TODO: huge optimization opportunity: similar to `features`
-    return dataset.map(itemgetter(1))
+    return _project(dataset, 1)
 
 
 def unzip(
@@ -645,21 +1344,42 @@ def unzip(
 def map_features(
     dataset: SupervisedSliceableDataset[_X, _Y], feature_mapper: Callable[[_X], _X2], /
 ) -> SupervisedSliceableDataset[_X2, _Y]:
-    def map_func(pair: tuple[_X, _Y]) -> tuple[_X2, _Y]:
-        feature, target = pair
-        return feature_mapper(feature), target
-
-    return dataset.map(map_func)
+    return dataset.map(_PairMapper(feature_mapper, None))
 
 
 def map_targets(
     dataset: SupervisedSliceableDataset[_X, _Y], target_mapper: Callable[[_Y], _Y2], /
 ) -> SupervisedSliceableDataset[_X, _Y2]:
-    def map_func(pair: tuple[_X, _Y]) -> tuple[_X, _Y2]:
-        feature, target = pair
-        return feature, target_mapper(target)
+    return dataset.map(_PairMapper(None, target_mapper))
+
 
-    return dataset.map(map_func)
+def filter_targets(
+    dataset: SupervisedSliceableDataset[_X, _Y],
+    predicate: Callable[[Any], Any],
+    /,
+) -> SupervisedSliceableDataset[_X, _Y]:
+    """Select the elements whose targets satisfy a vectorized predicate.
+
+    The predicate receives the targets in a columnar layout (see `fetch_columns`) and
+    must return one boolean per element. Only the targets are fetched, so rejected
+    features are never read.
+
+    >>> dataset = SliceableDataset.zip(
+    ...     SliceableDataset.from_sequence(["a", "b", "c"]),
+    ...     SliceableDataset.from_sequence([{"x": 1}, {"x": 5}, {"x": 3}]),
+    ... )
+    >>> list(filter_targets(dataset, lambda columns: columns["x"] > 2))
+    [('b', {'x': 5}), ('c', {'x': 3})]
+    """
+    if not len(dataset):
+        return dataset
+
+    mask = np.asarray(predicate(targets(dataset).fetch_columns()), dtype=bool)
+    if mask.shape != (len(dataset),):
+        raise ValueError(
+            f"predicate returned a mask of shape {mask.shape}, expected {(len(dataset),)}"
+        )
+    return dataset[np.flatnonzero(mask)]
 
 
 def map_pair(
@@ -668,14 +1388,297 @@ def map_pair(
     target_mapper: Callable[[_Y], _Y2],
     /,
 ) -> SupervisedSliceableDataset[_X2, _Y2]:
-    def map_func(pair: tuple[_X, _Y]) -> tuple[_X2, _Y2]:
+    return dataset.map(_PairMapper(feature_mapper, target_mapper))
+
+
+class _PairMapper:
+    """Map a `(feature, target)` pair element-wise, where `None` means identity.
+
+    Keeping both mappers inspectable allows `features` and `targets` to push the
+    projection through the map instead of evaluating the whole pair.
+    """
+
+    def __init__(
+        self,
+        feature_mapper: Callable[[Any], Any] | None,
+        target_mapper: Callable[[Any], Any] | None,
+    ) -> None:
+        self.mappers = (feature_mapper, target_mapper)
+
+    def __call__(self, pair: tuple[Any, Any]) -> tuple[Any, Any]:
         feature, target = pair
-        return feature_mapper(feature), target_mapper(target)
+        feature_mapper, target_mapper = self.mappers
+        return (
+            feature if feature_mapper is None else feature_mapper(feature),
+            target if target_mapper is None else target_mapper(target),
+        )
+
+    def __repr__(self) -> str:
+        feature_mapper, target_mapper = self.mappers
+        return f"{self.__class__.__name__}({feature_mapper}, {target_mapper})"
+
 
-    return dataset.map(map_func)
+def _project(dataset: SliceableDataset[Any], position: int) -> SliceableDataset[Any]:
+    """Select the `position`-th component of each element of a dataset of tuples.
+
+    Whenever the structure of the dataset allows it, the projection is pushed down to
+    the branch holding that component, so that other branches are never fetched.
+    """
+    if isinstance(dataset, ZippedSliceableDataset):
+        ancestor = dataset._ancestors[position]
+        # zipped datasets may be shorter than their ancestors
+        return ancestor if len(ancestor) == len(dataset) else ancestor[: len(dataset)]
+
+    if isinstance(dataset, ConcatenateSliceableDataset):
+        return ConcatenateSliceableDataset(
+            *(_project(ancestor, position) for ancestor in dataset._ancestors)
+        )
+
+    if isinstance(dataset, ComposedIndicesSliceableDataset):
+        return ComposedIndicesSliceableDataset(
+            _project(dataset._ancestor, position), dataset._indices
+        )
+
+    if isinstance(dataset, ProxySliceableDataset):
+        return _project(dataset._ancestor, position)
+
+    if isinstance(dataset, MapSliceableDataset) and isinstance(
+        dataset._map, _PairMapper
+    ):
+        projected = _project(dataset._ancestor, position)
+        mapper = dataset._map.mappers[position]
+        return projected if mapper is None else projected.map(mapper)
+
+    return dataset.map(itemgetter(position))
+
+
+def _optimize(dataset: SliceableDataset[_T]) -> SliceableDataset[_T]:  # noqa: PLR0911
+    if isinstance(dataset, ComposedIndicesSliceableDataset):
+        return _optimize_composed_indices(
+            _optimize(dataset._ancestor), dataset._indices
+        )
+
+    if isinstance(dataset, MapSliceableDataset):
+        ancestor = _optimize(dataset._ancestor)
+        map_func = dataset._map
+        if (
+            isinstance(ancestor, MapSliceableDataset)
+            and ancestor._num_parallel == dataset._num_parallel
+            and ancestor._executor == dataset._executor
+        ):
+            map_func = _FusedMap(ancestor._map, map_func)
+            ancestor = ancestor._ancestor
+        return MapSliceableDataset(
+            map_func,
+            ancestor,
+            num_parallel=dataset._num_parallel,
+            executor=dataset._executor,
+        )
+
+    if isinstance(dataset, BatchedMapSliceableDataset):
+        return dataset._with_ancestor(_optimize(dataset._ancestor))
+
+    if isinstance(dataset, ZippedSliceableDataset):
+        return ZippedSliceableDataset(
+            *map(_optimize, dataset._ancestors), strictness=dataset._strictness
+        )
+
+    if isinstance(dataset, ConcatenateSliceableDataset):
+        return ConcatenateSliceableDataset(*map(_optimize, dataset._ancestors))
+
+    if isinstance(dataset, PrefetchedDataset):
+        return PrefetchedDataset(
+            _optimize(dataset._ancestor),
+            dataset._buffer_size,
+            in_flight=dataset._in_flight,
+        )
+
+    if isinstance(dataset, CachedSliceableDataset):
+        return CachedSliceableDataset(_optimize(dataset._ancestor), dataset._cache)
+
+    return dataset
+
+
+def _optimize_composed_indices(
+    ancestor: SliceableDataset[_T], indices: Indices
+) -> SliceableDataset[_T]:
+    if isinstance(indices, range) and indices == range(len(ancestor)):
+        return ancestor
+
+    if isinstance(ancestor, MapSliceableDataset):
+        return MapSliceableDataset(
+            ancestor._map,
+            _optimize_composed_indices(ancestor._ancestor, indices),
+            num_parallel=ancestor._num_parallel,
+            executor=ancestor._executor,
+        )
+
+    if isinstance(ancestor, BatchedMapSliceableDataset):
+        return ancestor._with_ancestor(
+            _optimize_composed_indices(ancestor._ancestor, indices)
+        )
+
+    if isinstance(ancestor, ZippedSliceableDataset):
+        return ZippedSliceableDataset(  # type: ignore[return-value]
+            *(
+                _optimize_composed_indices(zipped, indices)
+                for zipped in ancestor._ancestors
+            )
+        )
+
+    if isinstance(ancestor, ProxySliceableDataset) and not isinstance(
+        ancestor, PrefetchedDataset
+    ):
+        return _optimize_composed_indices(ancestor._ancestor, indices)
+
+    return ComposedIndicesSliceableDataset(ancestor, indices)
+
+
+class _FusedMap:
+    def __init__(self, *map_funcs: Callable[[Any], Any]) -> None:
+        self.map_funcs = tuple(
+            fused
+            for map_func in map_funcs
+            for fused in (
+                map_func.map_funcs if isinstance(map_func, _FusedMap) else (map_func,)
+            )
+        )
+
+    def __call__(self, element: Any) -> Any:
+        for map_func in self.map_funcs:
+            element = map_func(element)
+        return element
+
+    def __repr__(self) -> str:
+        return " -> ".join(repr(map_func) for map_func in self.map_funcs)
+
+
+def _explain(dataset: SliceableDataset[Any], count: int, *, depth: int) -> list[str]:
+    lines = [
+        f"{'  ' * depth}{_explain_label(dataset)} [len={len(dataset)}, fetch~{count}]"
+    ]
+
+    if isinstance(dataset, ConcatenateSliceableDataset):
+        length = len(dataset)
+        for ancestor in dataset._ancestors:
+            ancestor_count = round(count * len(ancestor) / length) if length else 0
+            lines.extend(_explain(ancestor, ancestor_count, depth=depth + 1))
+    elif isinstance(dataset, ZippedSliceableDataset):
+        for ancestor in dataset._ancestors:
+            lines.extend(_explain(ancestor, count, depth=depth + 1))
+    elif (ancestor := getattr(dataset, "_ancestor", None)) is not None and isinstance(
+        ancestor, SliceableDataset
+    ):
+        lines.extend(_explain(ancestor, count, depth=depth + 1))
+
+    return lines
+
+
+def _explain_label(dataset: SliceableDataset[Any]) -> str:  # noqa: PLR0911
+    name = dataset.__class__.__name__
+
+    if isinstance(dataset, ComposedIndicesSliceableDataset):
+        indices = dataset._indices
+        return f"{name}({'array' if isinstance(indices, np.ndarray) else indices})"
+    if isinstance(dataset, MapSliceableDataset):
+        return f"{name}({dataset._map!r})"
+    if isinstance(dataset, BatchedMapSliceableDataset):
+        return f"{name}({' -> '.join(repr(map_func) for map_func in dataset._maps)})"
+    if isinstance(dataset, CachedSliceableDataset):
+        return f"{name}({dataset._cache!r})"
+    if isinstance(dataset, ProxySliceableDataset | ConcatenateSliceableDataset):
+        return name
+    if isinstance(dataset, ZippedSliceableDataset):
+        return f"{name}(strictness={dataset._strictness})"
+
+    return repr(dataset) if len(repr(dataset)) <= _MAX_LABEL_LENGTH else name
+
+
+_MAX_LABEL_LENGTH = 120
 
 
 def _is_nested_sliceable_dataset(
     ds: SliceableDataset[Any], /
 ) -> TypeGuard[SliceableDataset[SliceableDataset[Any]]]:
     return bool(ds) and isinstance(ds[0], SliceableDataset)
+
+
+def _as_array_key(key: Any) -> Any:
+    """Convert pandas objects used as keys to arrays, leaving other keys untouched.
+
+    Boolean arrays become masks and integer arrays become indices, so selections built
+    from queries over a targets dataframe, such as `dataset[df["Power [W]"] > 10]`, are
+    resolved without iterating over the key in Python.
+    """
+    to_numpy = getattr(key, "to_numpy", None)
+    if to_numpy is None or isinstance(key, np.ndarray):
+        return key
+
+    array = np.asarray(to_numpy())
+    if array.dtype != np.bool_ and not np.issubdtype(array.dtype, np.integer):
+        raise TypeError(f"expected a boolean or integer key, got dtype {array.dtype}")
+    return array
+
+
+def _normalize_indices(indices: Iterable[int], length: int) -> Indices:
+    """Convert `indices` to a `range` or a 1-D integer array of non-negative indices.
+
+    Ranges are kept symbolic whenever all of their elements are non-negative.
+    """
+    if isinstance(indices, range):
+        if not indices or min(indices[0], indices[-1]) >= 0:
+            return indices
+        indices = np.arange(indices.start, indices.stop, indices.step)
+    elif isinstance(indices, LazyPermutation):
+        return indices
+    elif isinstance(indices, np.ndarray):
+        indices = indices.astype(np.intp, copy=False)
+    else:
+        indices = np.fromiter(indices, dtype=np.intp)
+
+    if indices.ndim != 1:
+        raise ValueError(f"expected one-dimensional indices, got shape {indices.shape}")
+
+    negatives = indices < 0
+    if negatives.any():
+        indices = np.where(negatives, indices + length, indices)
+        if (indices < 0).any():
+            raise IndexError(int(indices.min()) - length, length)
+
+    return indices
+
+
+def _compose_indices(outer: Indices, inner: Indices) -> Indices:
+    """Return `outer[inner]`, where `inner` contains non-negative indices into `outer`.
+
+    Range-on-range compositions remain ranges and slices of lazy permutations remain
+    lazy. Everything else is a single gather.
+    """
+    if not len(inner):
+        return range(0)
+
+    if isinstance(inner, LazyPermutation):
+        inner = np.asarray(inner)
+
+    if isinstance(inner, range):
+        if inner[0] >= len(outer) or inner[-1] >= len(outer):
+            raise IndexError(inner, len(outer))
+
+        if isinstance(outer, range):
+            start = outer[inner[0]]
+            step = outer.step * inner.step
+            return range(start, start + step * len(inner), step)
+
+        stop = inner[-1] + (1 if inner.step > 0 else -1)
+        # a basic slice yields a view instead of a copy
+        return outer[inner[0] : stop if stop >= 0 else None : inner.step]
+
+    if isinstance(outer, range):
+        if inner.max() >= len(outer):
+            raise IndexError(int(inner.max()), len(outer))
+        return outer.start + outer.step * inner
+
+    if isinstance(outer, LazyPermutation):
+        return outer.take(inner)
+
+    return outer[inner]
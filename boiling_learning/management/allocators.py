@@ -9,6 +9,7 @@ from classes import AssociatedType, Supports, typeclass
 from boiling_learning.descriptions import describe
 from boiling_learning.io import json
 from boiling_learning.utils.functional import Pack
+from boiling_learning.utils.locking import file_lock
 from boiling_learning.utils.pathutils import PathLike, resolve
 
 # Ensure that all databases/tables will now use the smart query cache
@@ -94,6 +95,7 @@ class JSONAllocator(Allocator):
         self.path = resolve(root / "data", dir=True)
         self.db_path = root / "db.json"
         self._data: list[json.JSONDataType] | None = None
+        self._lock = file_lock(root / ".lock")
         self.describer = describer
         self.suffix = suffix
 
@@ -116,8 +118,16 @@ class JSONAllocator(Allocator):
         try:
             return self.data.index(serialized)
         except ValueError:
-            self.data = self.data + [serialized]
-            return len(self.data) - 1
+            pass
+
+        # other processes may have added descriptions since the database was loaded
+        with self._lock():
+            self._data = self._load_db()
+            try:
+                return self.data.index(serialized)
+            except ValueError:
+                self.data = self.data + [serialized]
+                return len(self.data) - 1
 
     def _load_db(self) -> list[json.JSONDataType]:
         try:
@@ -127,8 +137,11 @@ class JSONAllocator(Allocator):
             return []
 
     def _save_db(self) -> None:
-        with self.db_path.open("w", encoding="utf-8") as file:
+        # replace the database atomically, so that it is never read half-written
+        temporary_path = self.db_path.with_suffix(".tmp")
+        with temporary_path.open("w", encoding="utf-8") as file:
             _json.dump(self.data, file)
+        temporary_path.replace(self.db_path)
 
     def __call__(self, pack: Pack[Any, Any]) -> Path:
         args, kwargs = pack.pair()  # this normalizes `Pack` and `P`
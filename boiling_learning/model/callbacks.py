@@ -12,6 +12,7 @@ from tensorflow.keras.callbacks import BackupAndRestore as _BackupAndRestore
 from tensorflow.keras.callbacks import Callback
 from tensorflow.python.platform import tf_logging as logging
 
+from boiling_learning.datasets.metrics import METRICS
 from boiling_learning.io import json
 from boiling_learning.utils.pathutils import PathLike, resolve
 
@@ -355,6 +356,13 @@ class SaveHistory(Callback):
         self.history.append({key: float(value) for key, value in logs.items()})
 
 
+class ExportDatasetMetrics(Callback):
+    """Export the dataset metrics collected so far at the end of every epoch."""
+
+    def on_epoch_end(self, epoch: int, logs: dict[str, Any] | None = None) -> None:
+        METRICS.export(epoch=epoch)
+
+
 class BackupAndRestore(_BackupAndRestore):
     def __init__(self, backup_dir: PathLike, delete_on_end: bool = True) -> None:
         self.delete_on_end = delete_on_end
@@ -11,6 +11,7 @@ from tensorflow.keras.losses import Loss
 from tensorflow.keras.metrics import Metric
 from tensorflow.keras.optimizers import Optimizer
 
+from boiling_learning.datasets.metrics import METRICS
 from boiling_learning.datasets.splits import DatasetTriplet
 from boiling_learning.descriptions import describe
 from boiling_learning.distribute import strategy_scope
@@ -18,7 +19,11 @@ from boiling_learning.io import json
 from boiling_learning.io.dataclasses import dataclass
 from boiling_learning.io.storage import load
 from boiling_learning.lazy import Lazy, LazyDescribed, eager
-from boiling_learning.model.callbacks import RegisterEpoch, SaveHistory
+from boiling_learning.model.callbacks import (
+    ExportDatasetMetrics,
+    RegisterEpoch,
+    SaveHistory,
+)
 from boiling_learning.model.model import Evaluation, ModelArchitecture
 from boiling_learning.preprocessing.transformers import wrap_as_partial_transformer
 from boiling_learning.utils.timing import Timer
@@ -124,12 +129,16 @@ def get_fit_model(
 ) -> FitModelReturn:
     ds_train, ds_val, ds_test = datasets
 
+    callbacks = params.callbacks() + [history_registry, epoch_registry]
+    if METRICS.enabled:
+        callbacks.append(ExportDatasetMetrics())
+
     with Timer() as timer:
         model.model.fit(
             ds_train,
             validation_data=ds_val,
             epochs=params.epochs,
-            callbacks=params.callbacks() + [history_registry, epoch_registry],
+            callbacks=callbacks,
         )
 
     duration = timer.duration
@@ -9,7 +9,8 @@ import imageio
 import numpy as np
 from loguru import logger
 
-from boiling_learning.datasets.sliceable import SliceableDataset
+from boiling_learning.datasets.metrics import METRICS
+from boiling_learning.datasets.sliceable import SliceableDataset, check_output_length
 from boiling_learning.image_datasets import Image, Images
 from boiling_learning.preprocessing.video import Video
 from boiling_learning.utils.pathutils import PathLike, resolve
@@ -66,6 +67,25 @@ class ExtractedFramesDataset(SliceableDataset[Image]):
         return self.fetch((index,))[0]
 
     def fetch(self, indices: Iterable[int] | None = None) -> Images:
+        with METRICS.timing(self):
+            indices = self._ensure_extracted(indices)
+            frames = np.stack(list(self._load_frames(indices)))
+
+        METRICS.record(self, items_read=len(frames), bytes_read=frames.nbytes)
+        return frames
+
+    def fetch_into(self, indices: Iterable[int] | None, out: Images) -> Images:
+        with METRICS.timing(self):
+            indices = self._ensure_extracted(indices)
+            check_output_length(out, len(indices))
+
+            for position, frame in enumerate(self._load_frames(indices)):
+                out[position] = frame
+
+        METRICS.record(self, items_read=len(out), bytes_read=out.nbytes)
+        return out
+
+    def _ensure_extracted(self, indices: Iterable[int] | None) -> tuple[int, ...]:
         all_indices = range(len(self))
         indices = tuple(all_indices if indices is None else indices)
         unique_indices = frozenset(indices)
@@ -79,10 +99,13 @@ class ExtractedFramesDataset(SliceableDataset[Image]):
             if self._is_missing(index):
                 raise ExtractionError(f"failed to extract frame #{index} for {self}")
 
-        return np.stack(
-            list(self._robust_fetch_frames(indices))
+        return indices
+
+    def _load_frames(self, indices: tuple[int, ...], /) -> Iterator[Image]:
+        return (
+            self._robust_fetch_frames(indices)
             if self._robust
-            else [self._load_frame(index) for index in indices]
+            else (self._load_frame(index) for index in indices)
         )
 
     def _robust_fetch_frames(self, indices: tuple[int, ...], /) -> Iterator[Image]:
@@ -182,6 +205,8 @@ class ExtractedFramesDataset(SliceableDataset[Image]):
         except Exception as e:
             raise ExtractionError from e
 
+        METRICS.record(self, items_written=len(indices))
+
     def _filename_number_of_digits(self) -> int:
         return len(str(len(self)))
 
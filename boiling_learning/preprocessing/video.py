@@ -18,7 +18,8 @@ import numpy as np
 import numpy.typing as npt
 from loguru import logger
 
-from boiling_learning.datasets.sliceable import SliceableDataset
+from boiling_learning.datasets.metrics import METRICS
+from boiling_learning.datasets.sliceable import SliceableDataset, check_output_length
 from boiling_learning.descriptions import describe
 from boiling_learning.io import json
 from boiling_learning.io.storage import Metadata, deserialize, serialize
@@ -99,8 +100,23 @@ class Video(SliceableDataset[VideoFrame]):
     def fetch(self, indices: Iterable[int] | None = None) -> VideoFrames:
         indices = range(len(self)) if indices is None else list(indices)
 
-        with self as frames:
-            return frames.get_batch(indices).asnumpy()
+        with METRICS.timing(self), self as frames:
+            fetched = frames.get_batch(indices).asnumpy()
+
+        METRICS.record(self, items_read=len(fetched), bytes_read=fetched.nbytes)
+        return fetched
+
+    def fetch_into(
+        self, indices: Iterable[int] | None, out: VideoFrames
+    ) -> VideoFrames:
+        indices = range(len(self)) if indices is None else list(indices)
+        check_output_length(out, len(indices))
+
+        with METRICS.timing(self), self as frames:
+            out[...] = frames.get_batch(indices).asnumpy()
+
+        METRICS.record(self, items_read=len(out), bytes_read=out.nbytes)
+        return out
 
     def __iter__(self) -> Iterator[VideoFrameU8]:
         with self as frames:
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import fcntl
+import functools
+import os
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO
+
+from boiling_learning.utils.pathutils import PathLike, resolve
+
+
+class FileLock:
+    """An inter-process lock backed by `flock` on a lock file.
+
+    The lock is reentrant within a thread, so a method holding the lock may call other
+    methods that acquire it again. Threads of the same process are serialized. A shared
+    lock cannot be upgraded to an exclusive one.
+    """
+
+    def __init__(self, path: PathLike) -> None:
+        self._path = resolve(path)
+        self._mutex = threading.RLock()
+        self._file: BinaryIO | None = None
+        self._shared = False
+        self._depth = 0
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @contextmanager
+    def __call__(self, *, shared: bool = False) -> Iterator[None]:
+        with self._mutex:
+            if self._depth and self._shared and not shared:
+                raise RuntimeError(f"cannot upgrade a shared lock on {self._path}")
+
+            if not self._depth:
+                self._file = self._acquire(shared=shared)
+                self._shared = shared
+
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if not self._depth and self._file is not None:
+                    fcntl.flock(self._file, fcntl.LOCK_UN)
+                    self._file.close()
+                    self._file = None
+
+    def _acquire(self, *, shared: bool) -> BinaryIO:
+        return lock_file(self._path, shared=shared)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self._path})"
+
+
+def lock_file(
+    path: PathLike, *, shared: bool = False, blocking: bool = True
+) -> BinaryIO:
+    """Open `path` and lock it with `flock`, returning the open file.
+
+    The lock is held until the file is closed. Unlike `FileLock`, it is not shared with
+    the rest of the process, so it conflicts with every other lock on `path`, including
+    those of the same process. If `blocking` is false and the lock is held elsewhere,
+    `BlockingIOError` is raised.
+    """
+    path = resolve(path)
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    if not blocking:
+        operation |= fcntl.LOCK_NB
+
+    while True:
+        # the directory may have been deleted since the lock was created
+        file = resolve(path, parents=True).open("a+b")
+        try:
+            fcntl.flock(file, operation)
+            # if the lock file was deleted while waiting, the lock guards nothing
+            if os.fstat(file.fileno()).st_ino == os.stat(path).st_ino:
+                return file
+        except FileNotFoundError:
+            pass
+        except BaseException:
+            file.close()
+            raise
+        file.close()
+
+
+@functools.cache
+def _file_lock(path: Path) -> FileLock:
+    return FileLock(path)
+
+
+def file_lock(path: PathLike) -> FileLock:
+    """Return the lock for `path` shared by the whole process.
+
+    Two `flock`s taken through different file descriptors of the same process exclude
+    each other, so every user of a lock file in a process must go through the same
+    `FileLock`.
+    """
+    return _file_lock(resolve(path))
@@ -1,6 +1,16 @@
+from __future__ import annotations
+
+import math
 import random
-from collections.abc import Iterator
+from collections.abc import Iterator, Sequence
 from contextlib import contextmanager
+from typing import overload
+
+import numpy as np
+import numpy.typing as npt
+
+_FEISTEL_ROUNDS = 4
+_ITERATION_CHUNK_SIZE = 1 << 16
 
 
 @contextmanager
@@ -12,3 +22,107 @@ def random_state(seed_value: int | None = None) -> Iterator[None]:
         yield
     finally:
         random.setstate(state)
+
+
+class LazyPermutation(Sequence[int]):
+    """A seeded pseudo-random permutation of `range(length)` evaluated on demand.
+
+    The permutation is a keyed Feistel network over the smallest power of four that
+    covers `length`, restricted to `range(length)` by cycle-walking. Elements are
+    computed from their positions, so the permutation uses constant memory regardless
+    of its length and does not depend on the global `random` state.
+
+    Slicing returns another lazy permutation, and `take` evaluates many positions at
+    once:
+
+    >>> permutation = LazyPermutation(10, seed=42)
+    >>> sorted(permutation) == list(range(10))
+    True
+    >>> list(permutation[2:5]) == [permutation[2], permutation[3], permutation[4]]
+    True
+    >>> permutation.take(np.array([3, 2])).tolist() == [permutation[3], permutation[2]]
+    True
+    """
+
+    def __init__(self, length: int, seed: int, *, window: range | None = None) -> None:
+        self._length = length
+        self._seed = seed
+        self._window = range(length) if window is None else window
+
+        self._half_bits = max(1, math.ceil(max(length - 1, 1).bit_length() / 2))
+        self._keys = np.random.SeedSequence(seed).generate_state(
+            _FEISTEL_ROUNDS, dtype=np.uint64
+        )
+
+    def __len__(self) -> int:
+        return len(self._window)
+
+    @overload
+    def __getitem__(self, key: int) -> int: ...
+
+    @overload
+    def __getitem__(self, key: slice) -> LazyPermutation: ...
+
+    def __getitem__(self, key: int | slice) -> int | LazyPermutation:
+        if isinstance(key, slice):
+            return LazyPermutation(self._length, self._seed, window=self._window[key])
+
+        return int(self._permute(np.array([self._window[key]], dtype=np.uint64))[0])
+
+    def __iter__(self) -> Iterator[int]:
+        for start in range(0, len(self), _ITERATION_CHUNK_SIZE):
+            stop = min(start + _ITERATION_CHUNK_SIZE, len(self))
+            yield from self.take(np.arange(start, stop)).tolist()
+
+    def __array__(
+        self, dtype: npt.DTypeLike = None, copy: bool | None = None
+    ) -> np.ndarray:
+        return self.take(np.arange(len(self))).astype(dtype or np.intp, copy=False)
+
+    def take(self, indices: np.ndarray) -> np.ndarray:
+        """Evaluate the permutation at an array of non-negative positions."""
+        indices = np.asarray(indices)
+        if indices.size and indices.max() >= len(self):
+            raise IndexError(int(indices.max()), len(self))
+
+        positions = self._window.start + self._window.step * indices.astype(np.intp)
+        return self._permute(positions.astype(np.uint64)).astype(np.intp)
+
+    def _permute(self, values: np.ndarray) -> np.ndarray:
+        result = np.empty_like(values)
+        pending = np.arange(values.size)
+
+        # cycle-walk until every value falls back into `range(length)`
+        while pending.size:
+            values = self._feistel(values)
+            done = values < self._length
+            result[pending[done]] = values[done]
+            pending = pending[~done]
+            values = values[~done]
+
+        return result
+
+    def _feistel(self, values: np.ndarray) -> np.ndarray:
+        half_bits = np.uint64(self._half_bits)
+        mask = np.uint64((1 << self._half_bits) - 1)
+
+        left = values >> half_bits
+        right = values & mask
+        for key in self._keys:
+            left, right = right, left ^ (_mix(right ^ key) & mask)
+
+        return (left << half_bits) | right
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}"
+            f"({self._length}, seed={self._seed}, window={self._window})"
+        )
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    # the splitmix64 finalizer
+    with np.errstate(over="ignore"):
+        values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return values ^ (values >> np.uint64(31))
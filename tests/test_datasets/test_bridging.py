@@ -1,7 +1,10 @@
 import numpy as np
 import tensorflow as tf
 
-from boiling_learning.datasets.bridging import auto_spec
+from boiling_learning.datasets.bridging import (
+    auto_spec,
+    sliceable_dataset_to_tensorflow_dataset,
+)
 from boiling_learning.datasets.sliceable import SliceableDataset
 
 
@@ -56,3 +59,96 @@ def test_auto_spec() -> None:
         },
         tf.TensorSpec(shape=(), dtype=tf.bool),
     )
+
+
+def test_columnar_tensorflow_dataset() -> None:
+    images = SliceableDataset.from_sequence(np.random.rand(7, 3, 4))
+    targets = SliceableDataset.from_sequence(
+        [{"power": float(index), "name": f"frame{index}"} for index in range(7)]
+    )
+    sds = SliceableDataset.concatenate(
+        SliceableDataset.zip(images, targets)[:4],
+        SliceableDataset.zip(images, targets)[[6, 5, 4]],
+    )
+
+    columns = sds.fetch_columns([5, 0])
+    assert np.allclose(columns[0], images.fetch([5, 0]))
+    assert columns[1]["power"].tolist() == [5.0, 0.0]
+
+    ds = sliceable_dataset_to_tensorflow_dataset(
+        sds,
+        columnar=True,
+        prefetch=3,
+        prefetch_in_flight=2,
+        prefilterer=lambda pair: pair[1]["power"] != 2,
+    )
+    elements = list(ds.as_numpy_iterator())
+
+    expected = [pair for pair in sds if pair[1]["power"] != 2]
+    assert len(elements) == len(expected) == 6
+    for (image, target), (expected_image, expected_target) in zip(elements, expected):
+        assert np.allclose(image, expected_image)
+        assert target["power"] == expected_target["power"]
+        assert target["name"].decode() == expected_target["name"]
+
+
+def test_columnar_tensorflow_dataset_with_ragged_frames() -> None:
+    frames = [np.full((3, 4), index + 1.0) for index in range(6)]
+    frames[2] = np.ones((2, 4))
+    frames[4] = np.zeros((3, 4))
+    targets = [{"power": float(index)} for index in range(6)]
+    sds = SliceableDataset.zip(
+        SliceableDataset.from_sequence(frames), SliceableDataset.from_sequence(targets)
+    )
+
+    ds = sliceable_dataset_to_tensorflow_dataset(
+        sds,
+        columnar=True,
+        prefetch=4,
+        column_prefilterer=lambda columns: columns[0].any(axis=(1, 2)),
+    )
+    powers = [target["power"] for _image, target in ds.as_numpy_iterator()]
+
+    # the frame of a different shape and the blank frame are dropped
+    assert powers == [0.0, 1.0, 3.0, 5.0]
+
+
+def test_sharded_tensorflow_dataset() -> None:
+    sds = SliceableDataset.range(10)
+
+    elements = [
+        list(
+            sliceable_dataset_to_tensorflow_dataset(
+                sds,
+                input_context=tf.distribute.InputContext(
+                    num_input_pipelines=3, input_pipeline_id=index
+                ),
+            ).as_numpy_iterator()
+        )
+        for index in range(3)
+    ]
+
+    assert elements == [[0, 1, 2], [3, 4, 5], [6, 7, 8, 9]]
+
+
+def test_empty_columnar_tensorflow_dataset() -> None:
+    images = SliceableDataset.from_sequence(np.random.rand(2, 3, 4))
+    targets = SliceableDataset.from_sequence([{"power": 0.0}, {"power": 1.0}])
+    sds = SliceableDataset.concatenate(
+        SliceableDataset.zip(images, targets)[:0],
+        SliceableDataset.zip(images, targets),
+    )
+
+    images_column, targets_column = sds.fetch_columns([])
+    assert images_column.shape == (0, 3, 4)
+    assert targets_column["power"].shape == (0,)
+
+    # more input pipelines than elements leave the first shard empty
+    ds = sliceable_dataset_to_tensorflow_dataset(
+        sds,
+        columnar=True,
+        input_context=tf.distribute.InputContext(
+            num_input_pipelines=3, input_pipeline_id=0
+        ),
+    )
+    assert not list(ds.as_numpy_iterator())
@@ -0,0 +1,517 @@
+import fcntl
+import json
+import multiprocessing
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import h5py
+import numpy as np
+import pytest
+
+from boiling_learning.datasets.cache import (
+    ByteBudget,
+    EagerCache,
+    MemoryCache,
+    NumpyCache,
+    TieredCache,
+)
+from boiling_learning.datasets.codecs import Float16Codec, UInt8Codec
+from boiling_learning.datasets.hdf5_cache import HDF5FilePool, HDF5NumpyCache
+from boiling_learning.datasets.sliceable import SliceableDataset
+
+
+@pytest.fixture
+def frames() -> SliceableDataset[np.ndarray]:
+    return SliceableDataset.from_sequence(_frames())
+
+
+def _frames() -> np.ndarray:
+    return np.arange(1, 10 * 4 * 3 + 1, dtype=np.float32).reshape(10, 4, 3)
+
+
+class _LoggedFrames(SliceableDataset[np.ndarray]):
+    """Frames that record every fetched index in a log file shared by processes."""
+
+    def __init__(self, log_path: Path) -> None:
+        self._log_path = log_path
+
+    def __repr__(self) -> str:
+        return f"_LoggedFrames({self._log_path})"
+
+    def __len__(self) -> int:
+        return 10
+
+    def getitem_from_index(self, index: int) -> np.ndarray:
+        return self.fetch([index])[0]
+
+    def fetch(self, indices: Iterable[int] | None = None) -> np.ndarray:
+        indices = list(range(len(self)) if indices is None else indices)
+        with self._log_path.open("a") as file:
+            file.writelines(f"{index}\n" for index in indices)
+        return _frames()[indices]
+
+
+def _cache_from_another_process(
+    cache_type: type, directory: Path, indices: list[int], log_path: Path
+) -> np.ndarray:
+    cache = cache_type(directory, shape=(10, 4, 3), dtype=np.float32)
+    return _LoggedFrames(log_path).cache(cache).fetch(indices)
+
+
+@pytest.mark.parametrize("cache_type", [NumpyCache, HDF5NumpyCache])
+def test_concurrent_writers(tmp_path: Path, cache_type: type) -> None:
+    log_path = tmp_path / "fetched.log"
+    requests = [[0, 1, 2, 3, 4, 5, 6], [3, 4, 5, 6, 7, 8, 9], list(range(10)), [8, 2]]
+
+    with ProcessPoolExecutor(
+        max_workers=len(requests), mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        results = list(
+            executor.map(
+                _cache_from_another_process,
+                [cache_type] * len(requests),
+                [tmp_path / "cache"] * len(requests),
+                requests,
+                [log_path] * len(requests),
+            )
+        )
+
+    for indices, result in zip(requests, results):
+        assert np.array_equal(result, _frames()[indices])
+
+    # frames are computed outside the lock, so concurrent writers may compute the same
+    # frame, but every frame was computed by some writer
+    assert set(map(int, log_path.read_text().split())) == set(range(10))
+
+
+class _LockCheckingFrames(SliceableDataset[np.ndarray]):
+    """Frames that fail to compute while the lock file is held exclusively."""
+
+    def __init__(self, lock_path: Path) -> None:
+        self._lock_path = lock_path
+
+    def __repr__(self) -> str:
+        return f"_LockCheckingFrames({self._lock_path})"
+
+    def __len__(self) -> int:
+        return 10
+
+    def getitem_from_index(self, index: int) -> np.ndarray:
+        return self.fetch([index])[0]
+
+    def fetch(self, indices: Iterable[int] | None = None) -> np.ndarray:
+        # a separate open file description behaves like a reader in another process
+        with self._lock_path.open("a+b") as file:
+            fcntl.flock(file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            fcntl.flock(file, fcntl.LOCK_UN)
+        return _frames()[list(range(len(self)) if indices is None else indices)]
+
+
+@pytest.mark.parametrize("cache_type", [NumpyCache, HDF5NumpyCache])
+def test_frames_are_computed_without_the_lock(tmp_path: Path, cache_type: type) -> None:
+    cache = cache_type(tmp_path, shape=(10, 4, 3), dtype=np.float32)
+    cached = _LockCheckingFrames(tmp_path / ".lock").cache(cache)
+
+    assert np.array_equal(cached.fetch([4, 1]), _frames()[[4, 1]])
+
+
+@pytest.mark.parametrize("cache_type", [NumpyCache, HDF5NumpyCache])
+def test_fetch_into(
+    tmp_path: Path, frames: SliceableDataset[np.ndarray], cache_type: type
+) -> None:
+    cached = frames.cache(cache_type(tmp_path, shape=(10, 4, 3), dtype=np.float32))
+
+    out = np.empty((4, 4, 3), dtype=np.float32)
+    assert cached.fetch_into([7, 2, 3, 9], out) is out
+    assert np.array_equal(out, frames.fetch([7, 2, 3, 9]))
+
+    cached.fetch_into([0, 1, 2, 3], out)
+    assert np.array_equal(out, frames.fetch([0, 1, 2, 3]))
+
+    # the frames are cast to the dtype of the output array
+    wide = np.empty((2, 4, 3), dtype=np.float64)
+    assert cached.fetch_into([5, 1], wide) is wide
+    assert np.array_equal(wide, frames.fetch([5, 1]))
+
+
+@pytest.mark.parametrize("cache_type", [NumpyCache, HDF5NumpyCache])
+def test_codec_is_recorded(tmp_path: Path, cache_type: type) -> None:
+    frames = SliceableDataset.from_sequence(
+        (np.arange(10 * 4 * 3, dtype=np.uint8) * np.float32(1 / 255)).reshape(10, 4, 3)
+    )
+    codec = UInt8Codec(lossless=True)
+    cached = frames.cache(
+        cache_type(tmp_path, shape=(10, 4, 3), dtype=np.float32, codec=codec)
+    )
+
+    for indices in ([7, 2, 3, 9], [4, 5, 6]):
+        fetched = cached.fetch(indices)
+        assert fetched.dtype == np.float32
+        assert np.array_equal(fetched, frames.fetch(indices))
+
+        out = np.empty((len(indices), 4, 3), dtype=np.float32)
+        cached.fetch_into(indices, out)
+        assert np.array_equal(out, frames.fetch(indices))
+
+    reopened = cache_type(tmp_path, shape=(10, 4, 3), dtype=np.float32)
+    with pytest.raises(ValueError, match="stored with"):
+        frames.cache(reopened).fetch([2, 8])
+
+
+def test_memory_cache_fetch_into(frames: SliceableDataset[np.ndarray]) -> None:
+    cached = frames.cache(MemoryCache())
+
+    out = np.empty((2, 4, 3), dtype=np.float32)
+    cached.fetch_into([5, 1], out)
+    assert np.array_equal(out, frames.fetch([5, 1]))
+
+
+class TestHDF5NumpyCache:
+    def test_presence_persists(
+        self, tmp_path: Path, frames: SliceableDataset[np.ndarray]
+    ) -> None:
+        cache = HDF5NumpyCache(tmp_path, shape=(10, 4, 3), dtype=np.float32)
+        assert cache.missing_indices([1, 5]) == {1, 5}
+
+        frames.cache(cache).fetch([5, 1, 8])
+        assert cache.missing_indices(range(10)) == {0, 2, 3, 4, 6, 7, 9}
+
+        reopened = HDF5NumpyCache(tmp_path, shape=(10, 4, 3), dtype=np.float32)
+        assert reopened.missing_indices([1, 2, 8]) == {2}
+        assert not (tmp_path / "indices.json").exists()
+
+    def test_readers_do_not_create_the_file(
+        self, tmp_path: Path, frames: SliceableDataset[np.ndarray]
+    ) -> None:
+        cache = HDF5NumpyCache(tmp_path, shape=(10, 4, 3), dtype=np.float32)
+        assert cache.missing_indices(range(10)) == set(range(10))
+
+        fetched = frames.cache(cache).fetch([])
+        assert fetched.shape == (0, 4, 3)
+        assert not (tmp_path / "data.h5").exists()
+
+    def test_migrates_json_indices(
+        self, tmp_path: Path, frames: SliceableDataset[np.ndarray]
+    ) -> None:
+        with h5py.File(tmp_path / "data.h5", "w") as file:
+            data = file.create_dataset("default", shape=(10, 4, 3), dtype=np.float32)
+            data[[2, 3]] = frames.fetch([2, 3])
+        (tmp_path / "indices.json").write_text(json.dumps([2, 3]))
+
+        cache = HDF5NumpyCache(tmp_path, shape=(10, 4, 3), dtype=np.float32)
+        assert cache.missing_indices(range(5)) == {0, 1, 4}
+        assert not (tmp_path / "indices.json").exists()
+
+        empty = SliceableDataset.from_sequence(np.zeros((10, 4, 3), dtype=np.float32))
+        assert np.array_equal(empty.cache(cache).fetch([3, 2]), frames.fetch([3, 2]))
+
+    def test_chunked_compressed_layout(
+        self, tmp_path: Path, frames: SliceableDataset[np.ndarray]
+    ) -> None:
+        pool = HDF5FilePool()
+        cache = HDF5NumpyCache(
+            tmp_path,
+            shape=(10, 4, 3),
+            dtype=np.float32,
+            chunk_frames=4,
+            chunk_cache_size=2**16,
+            compression="gzip",
+            pool=pool,
+        )
+        cached = frames.cache(cache)
+
+        assert np.array_equal(cached.fetch([9, 0, 4]), frames.fetch([9, 0, 4]))
+        # storing new frames must not conflict with the pooled read-only handle
+        assert np.array_equal(cached.fetch([1, 9, 2]), frames.fetch([1, 9, 2]))
+
+        with pool.reading(tmp_path / "data.h5") as file:
+            assert file.mode == "r"
+            assert file["default"].chunks == (4, 4, 3)
+            assert file["default"].compression == "gzip"
+        pool.clear()
+
+    def test_pool_closes_least_recently_used_files(
+        self, tmp_path: Path, frames: SliceableDataset[np.ndarray]
+    ) -> None:
+        pool = HDF5FilePool(max_open_files=2)
+        cached = [
+            frames.cache(
+                HDF5NumpyCache(
+                    tmp_path / str(index), shape=(10, 4, 3), dtype=np.float32, pool=pool
+                )
+            )
+            for index in range(4)
+        ]
+        for dataset in cached:
+            dataset.fetch([0, 1])
+        pool.clear()
+
+        paths = [tmp_path / str(index) / "data.h5" for index in range(4)]
+        # files being read are never closed, even beyond the limit
+        with (
+            pool.reading(paths[0]) as first,
+            pool.reading(paths[1]) as second,
+            pool.reading(paths[2]) as third,
+        ):
+            assert first.id.valid and second.id.valid and third.id.valid
+
+        with pool.reading(paths[1]):
+            pass
+        with pool.reading(paths[3]) as fourth:
+            assert not first.id.valid
+            assert not third.id.valid
+            assert second.id.valid and fourth.id.valid
+
+        for dataset in cached:
+            assert np.array_equal(dataset.fetch([1, 0]), frames.fetch([1, 0]))
+        pool.clear()
+
+    @pytest.mark.parametrize(
+        "layout",
+        [
+            {},
+            {"chunk_frames": 1},
+            {"chunk_frames": 3},
+            {"chunk_frames": 3, "compression": "gzip"},
+            {"chunk_frames": 3, "compression": "blosc-zstd"},
+            {"chunk_frames": 3, "compression": "lz4", "codec": Float16Codec()},
+        ],
+    )
+    def test_run_coalesced_reads(
+        self,
+        tmp_path: Path,
+        frames: SliceableDataset[np.ndarray],
+        layout: dict[str, Any],
+    ) -> None:
+        cache = HDF5NumpyCache(tmp_path, shape=(10, 4, 3), dtype=np.float32, **layout)
+        cached = frames.cache(cache)
+        assert np.array_equal(cached.fetch([-1, -3]), frames.fetch([9, 7]))
+        assert cache.missing_indices(range(10)) == {0, 1, 2, 3, 4, 5, 6, 8}
+        cached.fetch()
+
+        for indices in (
+            [1, 2, 3, 4, 5, 6, 7, 9],
+            [9, 0, 1, 2, 0, 8, 7],
+            [4],
+            [-2, -1],
+            [-5, -4, -3, -2, -1],
+            [3, -6, 5, -1, 0, -10],
+        ):
+            assert np.array_equal(cached.fetch(indices), frames.fetch(indices))
+
+            out = np.empty((len(indices), 4, 3), dtype=np.float32)
+            cached.fetch_into(indices, out)
+            assert np.array_equal(out, frames.fetch(indices))
+
+
+class TestNumpyCache:
+    def test_data_is_a_regular_npy_file(
+        self, tmp_path: Path, frames: SliceableDataset[np.ndarray]
+    ) -> None:
+        cache = NumpyCache(tmp_path, shape=(10, 4, 3), dtype=np.float32)
+        cached = frames.cache(cache)
+
+        assert np.array_equal(cached.fetch([6, 2]), frames.fetch([6, 2]))
+        assert cache.missing_indices(range(10)) == {0, 1, 3, 4, 5, 7, 8, 9}
+        # the long-lived read-only mapping observes later stores
+        assert np.array_equal(cached.fetch([2, 3]), frames.fetch([2, 3]))
+
+        view = cached.fetch([2, 3])
+        assert np.shares_memory(view, cache._data())
+        assert not view.flags.writeable
+
+        data = np.load(cache.data_path, mmap_mode="r")
+        assert data.shape == (10, 4, 3)
+        assert np.array_equal(data[[2, 3, 6]], frames.fetch([2, 3, 6]))
+
+        reopened = NumpyCache(tmp_path, shape=(10, 4, 3), dtype=np.float32)
+        assert reopened.missing_indices([2, 3, 4]) == {4}
+
+    def test_negative_indices(
+        self, tmp_path: Path, frames: SliceableDataset[np.ndarray]
+    ) -> None:
+        cached = frames.cache(NumpyCache(tmp_path, shape=(10, 4, 3), dtype=np.float32))
+        cached.fetch()
+
+        assert np.array_equal(cached.fetch([-1]), frames.fetch([9]))
+        assert np.array_equal(cached.fetch([-2, -1]), frames.fetch([8, 9]))
+        assert np.array_equal(cached.fetch([9, -10]), frames.fetch([9, 0]))
+        assert np.array_equal(cached[-1], frames[9])
+
+    def test_migrates_raw_data_and_json_indices(
+        self, tmp_path: Path, frames: SliceableDataset[np.ndarray]
+    ) -> None:
+        raw = np.memmap(
+            tmp_path / "data.npy", mode="w+", dtype=np.float32, shape=(10, 4, 3)
+        )
+        raw[[1, 4]] = frames.fetch([1, 4])
+        raw.flush()
+        del raw
+        (tmp_path / "indices.json").write_text(json.dumps([1, 4]))
+
+        cache = NumpyCache(tmp_path, shape=(10, 4, 3), dtype=np.float32)
+        assert cache.missing_indices(range(5)) == {0, 2, 3}
+        assert not (tmp_path / "indices.json").exists()
+
+        empty = SliceableDataset.from_sequence(np.zeros((10, 4, 3), dtype=np.float32))
+        assert np.array_equal(empty.cache(cache).fetch([4, 1]), frames.fetch([4, 1]))
+        assert np.array_equal(np.load(cache.data_path)[[1, 4]], frames.fetch([1, 4]))
+
+
+class TestMemoryCache:
+    def test_unbounded(self, frames: SliceableDataset[np.ndarray]) -> None:
+        cache = MemoryCache()
+        cached = frames.cache(cache)
+
+        assert np.array_equal(cached.fetch([3, 1, 3]), frames.fetch([3, 1, 3]))
+        cached.fetch([1, 2])
+        assert cache.statistics.hits == 1
+        assert cache.statistics.misses == 4
+        assert cache.statistics.stored_items == 3
+        assert cache.statistics.stored_bytes == 3 * 4 * 3 * 4
+
+    def test_byte_budget_evicts_least_recently_used(
+        self, frames: SliceableDataset[np.ndarray]
+    ) -> None:
+        frame_size = 4 * 3 * 4
+        cache = MemoryCache(max_bytes=3 * frame_size)
+        cached = frames.cache(cache)
+
+        # a single fetch larger than the budget is still returned in full
+        assert np.array_equal(cached.fetch(range(5)), frames.fetch(range(5)))
+        assert cache.missing_indices(range(5)) == {0, 1}
+
+        cached.fetch([2])
+        cached.fetch([5])
+        assert cache.missing_indices(range(6)) == {0, 1, 3}
+        assert cache.statistics.evictions == 3
+        assert cache.statistics.stored_bytes == 3 * frame_size
+
+    def test_pinned_indices_are_never_evicted(
+        self, frames: SliceableDataset[np.ndarray]
+    ) -> None:
+        cache = MemoryCache(max_bytes=2 * 4 * 3 * 4, pinned=range(2))
+        cached = frames.cache(cache)
+
+        cached.fetch([0, 1])
+        cached.fetch([2, 3, 4])
+        assert cache.missing_indices(range(5)) == {2, 3, 4}
+
+        cached.fetch([0, 1])
+        assert cache.statistics.hits == 2
+
+
+class TestTieredCache:
+    def test_promotes_on_read_and_writes_through(self, tmp_path: Path) -> None:
+        log_path = tmp_path / "fetched.log"
+        memory = MemoryCache(max_bytes=2 * 4 * 3 * 4)
+        local = NumpyCache(tmp_path / "local", shape=(10, 4, 3), dtype=np.float32)
+        shared = HDF5NumpyCache(tmp_path / "shared", shape=(10, 4, 3), dtype=np.float32)
+        cached = _LoggedFrames(log_path).cache(TieredCache(memory, local, shared))
+
+        assert np.array_equal(cached.fetch([4, 1, 4]), _frames()[[4, 1, 4]])
+        assert local.missing_indices(range(10)) == shared.missing_indices(range(10))
+        assert shared.missing_indices(range(10)) == set(range(10)) - {1, 4}
+
+        # frames only present in the shared tier are promoted to the faster ones
+        warm = _LoggedFrames(log_path).cache(shared)
+        warm.fetch([7, 8])
+        local_only = _LoggedFrames(log_path).cache(TieredCache(local, shared))
+        assert np.array_equal(local_only.fetch([8, 1, 7]), _frames()[[8, 1, 7]])
+        assert not local.missing_indices([1, 4, 7, 8])
+
+        assert sorted(map(int, log_path.read_text().split())) == [1, 4, 7, 8]
+
+    def test_promotions_stop_when_the_budget_is_spent(self, tmp_path: Path) -> None:
+        local = NumpyCache(tmp_path / "local", shape=(10, 4, 3), dtype=np.float32)
+        shared = NumpyCache(tmp_path / "shared", shape=(10, 4, 3), dtype=np.float32)
+        # room for three frames
+        budget = ByteBudget(3 * 4 * 3 * 4)
+        cached = _LoggedFrames(tmp_path / "fetched.log").cache(
+            TieredCache(local, shared, budgets={local: budget})
+        )
+
+        assert np.array_equal(cached.fetch([0, 1]), _frames()[[0, 1]])
+        assert np.array_equal(cached.fetch([2, 3]), _frames()[[2, 3]])
+        assert np.array_equal(cached.fetch([4]), _frames()[[4]])
+
+        assert local.missing_indices(range(5)) == {2, 3}
+        assert not shared.missing_indices(range(5))
+        assert budget.used_bytes == budget.max_bytes
+
+
+class _BatchLoggedFrames(SliceableDataset[int]):
+    def __init__(self, length: int) -> None:
+        self._length = length
+        self.batches: list[list[int]] = []
+
+    def __repr__(self) -> str:
+        return f"_BatchLoggedFrames({self._length})"
+
+    def __len__(self) -> int:
+        return self._length
+
+    def getitem_from_index(self, index: int) -> int:
+        return self.fetch([index])[0]
+
+    def fetch(self, indices: Iterable[int] | None = None) -> list[int]:
+        indices = list(range(len(self)) if indices is None else indices)
+        self.batches.append(indices)
+        return [-index for index in indices]
+
+
+class TestEagerCache:
+    def test_sequential_reads_ahead_with_a_growing_window(self) -> None:
+        source = _BatchLoggedFrames(100)
+        cache = EagerCache(MemoryCache(), 32, window=16)
+        cached = source.cache(cache)
+
+        assert [cached[index] for index in range(40)] == [-index for index in range(40)]
+        assert source.batches[:3] == [[0], [1], list(range(2, 7))]
+        assert [len(batch) for batch in source.batches[3:]] == [9, 17, 17]
+        assert cache.statistics.used == 34
+        assert cache.statistics.usage > 0.75
+
+    @pytest.mark.parametrize("stride", [3, -2])
+    def test_strided_batches(self, stride: int) -> None:
+        source = _BatchLoggedFrames(100)
+        cached = source.cache(EagerCache(MemoryCache(), 8))
+        start = 0 if stride > 0 else 99
+
+        requests = [
+            [start + k * stride, start + (k + 1) * stride] for k in range(0, 8, 2)
+        ]
+        for request in requests:
+            assert list(cached.fetch(request)) == [-index for index in request]
+
+        # an evenly spaced batch is followed along its stride, and the window doubles
+        # once the elements read ahead are used
+        assert source.batches == [
+            [start + k * stride for k in range(4)],
+            [start + k * stride for k in range(4, 10)],
+        ]
+
+    def test_random_access_reads_nothing_ahead(self) -> None:
+        source = _BatchLoggedFrames(1000)
+        cache = EagerCache(MemoryCache(), 64)
+        cached = source.cache(cache)
+
+        requests = np.random.default_rng(0).choice(1000, size=(20, 4), replace=False)
+        for request in requests.tolist():
+            assert list(cached.fetch(request)) == [-index for index in request]
+
+        assert source.batches == requests.tolist()
+        assert cache.statistics.read_ahead == 0
+
+    def test_read_ahead_never_exceeds_buffer_size(self, tmp_path: Path) -> None:
+        source = _BatchLoggedFrames(100)
+        wrapped = NumpyCache(tmp_path, shape=(100,), dtype=np.int64)
+        cached = source.cache(EagerCache(wrapped, 10, window=64))
+
+        for start in range(0, 60, 6):
+            cached.fetch(range(start, start + 6))
+
+        assert max(map(len, source.batches)) == 10
+        assert not wrapped.missing_indices(range(60))
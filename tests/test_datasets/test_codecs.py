@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from boiling_learning.datasets.codecs import Float16Codec, FrameCodec, UInt8Codec
+
+
+@pytest.mark.parametrize(
+    "codec", [FrameCodec(), UInt8Codec(), Float16Codec(), UInt8Codec(scale=15.0)]
+)
+def test_record_round_trip(codec: FrameCodec) -> None:
+    assert FrameCodec.from_record(codec.record()) == codec
+
+
+def test_uint8_codec_recovers_8_bit_frames_exactly() -> None:
+    # how `tf.image.convert_image_dtype` converts `uint8` frames
+    frames = np.arange(256, dtype=np.uint8).astype(np.float32) * np.float32(1 / 255)
+    codec = UInt8Codec(lossless=True)
+
+    encoded = codec.encode(frames)
+    assert encoded.dtype == np.uint8
+    assert np.array_equal(codec.decode(encoded, np.float32), frames)
+
+
+@pytest.mark.parametrize("codec", [UInt8Codec(), Float16Codec()])
+def test_lossy_codecs_are_bounded(codec: FrameCodec) -> None:
+    frames = np.random.default_rng(0).random((8, 16, 16), dtype=np.float32)
+
+    decoded = codec.decode(codec.encode(frames), np.float32)
+    assert decoded.dtype == np.float32
+    assert np.abs(decoded - frames).max() <= codec.max_error
+
+
+@pytest.mark.parametrize(
+    "codec", [UInt8Codec(lossless=True), Float16Codec(lossless=True)]
+)
+def test_lossless_codecs_reject_inexact_frames(codec: FrameCodec) -> None:
+    with pytest.raises(ValueError, match="losslessly"):
+        codec.encode(np.full((2, 2), 0.1234567, dtype=np.float32))
+
+
+def test_quantizing_codecs_require_floating_point_frames() -> None:
+    with pytest.raises(TypeError):
+        UInt8Codec().storage_dtype(np.uint8)
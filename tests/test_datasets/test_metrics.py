@@ -0,0 +1,89 @@
+import json
+from collections.abc import Iterator
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from boiling_learning.datasets.cache import MemoryCache, NumpyCache
+from boiling_learning.datasets.metrics import (
+    METRICS,
+    LatencyHistogram,
+    MetricsRegistry,
+    node_name,
+)
+from boiling_learning.datasets.sliceable import SliceableDataset
+
+
+@pytest.fixture
+def metrics(tmp_path: Path) -> Iterator[MetricsRegistry]:
+    METRICS.reset()
+    METRICS.enable(jsonl_path=tmp_path / "metrics.jsonl")
+    try:
+        yield METRICS
+    finally:
+        METRICS.disable()
+        METRICS.reset()
+
+
+def _frames() -> SliceableDataset[np.ndarray]:
+    return SliceableDataset.from_sequence(
+        np.arange(10 * 4 * 3, dtype=np.float32).reshape(10, 4, 3)
+    )
+
+
+def test_latency_histogram_quantiles() -> None:
+    histogram = LatencyHistogram()
+    for seconds in (1e-4,) * 99 + (1.0,):
+        histogram.record(seconds)
+
+    assert histogram.count == 100
+    assert 1e-4 <= histogram.quantile(0.5) <= 2e-4
+    assert histogram.quantile(1.0) == 1.0
+    assert histogram.total_seconds == pytest.approx(99e-4 + 1.0)
+
+
+def test_disabled_registry_records_nothing() -> None:
+    registry = MetricsRegistry()
+    registry.record("node", hits=1)
+    with registry.timing("node"):
+        pass
+
+    assert registry.snapshot() == {}
+
+
+def test_cache_hits_misses_and_bytes(tmp_path: Path, metrics: MetricsRegistry) -> None:
+    cache = NumpyCache(tmp_path / "cache", shape=(10, 4, 3), dtype=np.float32)
+    cached = _frames().map(np.negative).cache(cache)
+
+    cached.fetch([0, 1, 2])
+    cached.fetch([1, 2, 3])
+
+    cache_metrics = metrics.snapshot()[node_name(cache)]
+    assert cache_metrics["fetches"] == 2
+    assert (cache_metrics["hits"], cache_metrics["misses"]) == (2, 4)
+    assert cache_metrics["items_written"] == 4
+    assert cache_metrics["bytes_written"] == 4 * 4 * 3 * 4
+    assert cache_metrics["items_read"] == 6
+    assert cache_metrics["bytes_read"] == 6 * 4 * 3 * 4
+
+    map_name = next(name for name in metrics.snapshot() if "negative" in name)
+    assert metrics.snapshot()[map_name]["items_read"] == 4
+    assert map_name in metrics.report()
+
+
+def test_export_appends_json_lines(tmp_path: Path, metrics: MetricsRegistry) -> None:
+    cached = _frames().cache(MemoryCache())
+    cached.fetch([0, 1])
+    metrics.export(epoch=0)
+    cached.fetch([0, 1])
+    metrics.export(epoch=1)
+
+    lines = [
+        json.loads(line)
+        for line in (tmp_path / "metrics.jsonl").read_text().splitlines()
+    ]
+    assert [(line["epoch"], line["hits"], line["misses"]) for line in lines] == [
+        (0, 0, 2),
+        (1, 2, 2),
+    ]
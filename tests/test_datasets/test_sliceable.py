@@ -1,12 +1,25 @@
+import threading
 from collections.abc import Iterable
 from fractions import Fraction
 from random import sample
+from typing import Literal
 
 import numpy as np
+import pandas as pd
 import pytest
 
 from boiling_learning.datasets.bridging import sliceable_dataset_to_tensorflow_dataset
-from boiling_learning.datasets.sliceable import SliceableDataset
+from boiling_learning.datasets.sliceable import (
+    BufferRing,
+    ComposedIndicesSliceableDataset,
+    MapSliceableDataset,
+    SliceableDataset,
+    ZippedSliceableDataset,
+    features,
+    filter_targets,
+    map_targets,
+    targets,
+)
 from boiling_learning.utils.random import random_state
 
 
@@ -64,6 +77,22 @@ class TestSliceableDataset:
         assert list(sds[[False, True, False, False, True]]) == [10, 45]
         assert list(sds[[True, True, True, True, True]]) == [0, 10, 200, 3, 45]
 
+    def test_array_keys(self) -> None:
+        sds = SliceableDataset.from_sequence([0, 10, 200, 3, 45])
+        values = pd.Series([0, 10, 200, 3, 45], index=list("abcde"))
+
+        assert list(sds[np.array([False, True, False, False, True])]) == [10, 45]
+        assert list(sds[values > 5]) == [10, 200, 45]
+        assert list(sds[np.array([4, -1, 0])]) == [45, 45, 0]
+        assert list(sds[pd.Index([3, 0])]) == [3, 0]
+
+        selected = sds[values > 5]
+        assert isinstance(selected, ComposedIndicesSliceableDataset)
+        assert isinstance(selected._indices, np.ndarray)
+
+        with pytest.raises(ValueError, match="not a valid boolean mask"):
+            sds[np.array([True, False])]
+
     def test_selecting(self) -> None:
         sds = SliceableDataset.from_sequence([0, 10, 200, 3, 45])
 
@@ -108,6 +137,15 @@ class TestSliceableDataset:
         sds = SliceableDataset.from_sequence("abcd")
         assert list(sds.map(str.upper)) == ["A", "B", "C", "D"]
 
+    @pytest.mark.parametrize("executor", ["thread", "process"])
+    def test_parallel_map(self, executor: Literal["thread", "process"]) -> None:
+        sds = SliceableDataset.from_sequence("abcdefghijklmnopqrstuvwxyz")
+        mapped = sds.map(str.upper, num_parallel=4, executor=executor)
+
+        assert "".join(mapped.fetch()) == "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+        assert "".join(mapped[[25, 0, 13]].fetch()) == "ZAN"
+        assert "".join(mapped.fetch([3])) == "D"
+
     def test_split(self) -> None:
         sds = SliceableDataset.from_sequence("abcdefghijklmnopqrstuvwxyz")
         splits = sds.split(5, 0, None, Fraction(1, 4))
@@ -129,6 +167,52 @@ class TestSliceableDataset:
         assert "".join(shuffled) == shuffled_data == "yhczewmkouqnaglvxrtsibjpdf"
         assert "".join(shuffled.fetch(range(5, 10))) == "wmkou"
 
+    def test_seeded_shuffle(self) -> None:
+        sds = SliceableDataset.from_getitem(lambda index: index, length=1000)
+        shuffled = sds.shuffle(seed=1997)
+
+        assert sorted(shuffled) == list(range(1000))
+        assert list(shuffled) == list(sds.shuffle(seed=1997))
+        assert list(shuffled) != list(sds.shuffle(seed=1998))
+
+        train, test = shuffled.split(Fraction(3, 4), None)
+        assert sorted([*train, *test]) == list(range(1000))
+        assert list(train.fetch([2, 1])) == [shuffled[2], shuffled[1]]
+
+        sample = sds.sample(10, seed=0)
+        assert len(sample) == 10
+        assert list(sample) == list(sds.shuffle(seed=0).take(10))
+
+        for seed in (None, 0):
+            with pytest.raises(ValueError):
+                sds.sample(1001, seed=seed)
+            with pytest.raises(ValueError):
+                sds.sample(-1, seed=seed)
+
+    @pytest.mark.parametrize("mode", ["contiguous", "interleaved"])
+    def test_shard(self, mode: Literal["contiguous", "interleaved"]) -> None:
+        sds = SliceableDataset.from_sequence("abcdefghijklmnopqrstuvwxyz")
+        shards = [sds.shard(4, index, mode=mode) for index in range(4)]
+
+        assert sorted("".join("".join(shard) for shard in shards)) == list(
+            "abcdefghijklmnopqrstuvwxyz"
+        )
+        assert {len(shard) for shard in shards} == {6, 7}
+        if mode == "interleaved":
+            assert "".join(shards[1]) == "bfjnrvz"
+        else:
+            assert "".join(shards[1]) == "ghijklm"
+
+    def test_aligned_shard(self) -> None:
+        sds = SliceableDataset.range(100)
+        shards = [sds.shard(3, index, alignment=8) for index in range(3)]
+
+        assert [list(shard)[0] for shard in shards] == [0, 32, 64]
+        assert sum(len(shard) for shard in shards) == 100
+
+        with pytest.raises(ValueError):
+            sds.shard(3, 3)
+
     def test_take(self) -> None:
         sds = SliceableDataset.from_sequence("abcdefghijklmnopqrstuvwxyz")
         assert "".join(sds.take(10)) == "abcdefghij"
@@ -169,6 +253,41 @@ class TestSliceableDataset:
 
         assert db.database_fetches == [[0, 1, 2], [3, 4, 5], [6, 7]]
 
+    def test_background_prefetch(self) -> None:
+        db = MockDatabaseDataset()
+        prefetched = db.prefetch(3, in_flight=2)
+
+        assert list(prefetched) == [0, 1, 4, 9, 16, 25, 36, 49]
+        assert db.database_fetches == [[0, 1, 2], [3, 4, 5], [6, 7]]
+        assert prefetched.statistics.buffers == 3
+        assert prefetched.statistics.max_depth <= 2
+
+    def test_background_prefetch_shutdown(self) -> None:
+        db = MockDatabaseDataset()
+        thread_count = threading.active_count()
+        it = iter(db.prefetch(1, in_flight=1))
+
+        assert next(it) == 0
+        it.close()  # type: ignore[attr-defined]
+
+        assert threading.active_count() == thread_count
+        assert len(db.database_fetches) <= 3
+
+    def test_background_prefetch_propagates_errors(self) -> None:
+        def _fail(index: int) -> int:
+            if index == 2:
+                raise RuntimeError("boom")
+            return index
+
+        dataset = SliceableDataset.from_getitem(_fail, length=4).prefetch(
+            1, in_flight=2
+        )
+        it = iter(dataset)
+        assert next(it) == 0
+        assert next(it) == 1
+        with pytest.raises(RuntimeError, match="boom"):
+            next(it)
+
     def test_batch(self) -> None:
         sds = SliceableDataset.from_sequence("abcdefghijklmnopqrstuvwxyz")
         batched = sds.batch(4)
@@ -245,6 +364,27 @@ class TestComposedSliceableDataset:
         assert ds.fetch() == (9, 1, 16, 1, 25)
         assert ds.fetch((2, 0, 0, 1)) == (16, 9, 9, 1)
 
+    def test_nested_selection_fetches_once(self) -> None:
+        db = MockDatabaseDataset()
+        ds = db[1:][::2][[3, 0, 2]]
+
+        assert ds.fetch() == (49, 1, 25)
+        assert db.database_fetches == [[7, 1, 5]]
+
+    def test_numpy_indices(self) -> None:
+        db = MockDatabaseDataset()
+        ds = db[np.array([5, -1, 0])][np.array([2, 1])]
+
+        assert ds[0] == 0
+        assert ds.fetch() == (0, 49)
+        assert list(ds) == [0, 49]
+
+    def test_range_composition(self) -> None:
+        sds = SliceableDataset.from_getitem(lambda index: index, length=100)
+        ds = sds[10:90:2][5:][::3][[4, 2, 0]]
+
+        assert list(ds) == [list(range(100))[10:90:2][5:][::3][i] for i in (4, 2, 0)]
+
 
 def test_concatenate() -> None:
     sds1 = SliceableDataset.from_sequence("abcd")
@@ -260,6 +400,220 @@ def test_concatenate() -> None:
     assert "".join(concat[[0, 11, 5, 11]]) == "alfl"
     assert "".join(concat.fetch([0, 11, 5, 11])) == "alfl"
     assert concat.fetch() == tuple("abcdefghijkl")
+    assert concat[-1] == "l"
+
+
+def test_concatenate_fetch_routes_one_fetch_per_ancestor() -> None:
+    db1 = MockDatabaseDataset()
+    db2 = MockDatabaseDataset()
+    empty = SliceableDataset.from_sequence(())
+
+    concat = SliceableDataset.concatenate(db1, empty, db2)
+    assert len(concat) == 16
+    assert tuple(concat.fetch([9, 2, 15, 0, 8])) == (1, 4, 49, 0, 0)
+    assert db1.database_fetches == [[2, 0]]
+    assert db2.database_fetches == [[1, 7, 0]]
+
+    arrays = SliceableDataset.concatenate(
+        SliceableDataset.from_getitem(lambda index: np.full(2, index), length=3),
+        SliceableDataset.from_getitem(lambda index: np.full(2, -index), length=3),
+    )
+    assert np.array_equal(arrays.fetch([4, 1]), [[-1, -1], [1, 1]])
+
+
+def test_concatenate_fetch_keeps_mixed_arrays_apart() -> None:
+    small = SliceableDataset.from_sequence(np.zeros((3, 2, 2))).map_batched(np.asarray)
+    large = SliceableDataset.from_sequence(np.ones((3, 4, 4))).map_batched(np.asarray)
+    frames = SliceableDataset.from_sequence(
+        np.full((3, 2, 2), 7, dtype=np.uint8)
+    ).map_batched(np.asarray)
+
+    fetched = SliceableDataset.concatenate(small, large).fetch([4, 1])
+    assert [frame.shape for frame in fetched] == [(4, 4), (2, 2)]
+
+    # arrays of different dtypes are not upcast to a common one
+    fetched = SliceableDataset.concatenate(small, frames).fetch([4, 1])
+    assert [frame.dtype for frame in fetched] == [np.uint8, np.float64]
+
+
+class TestBatchedMapSliceableDataset:
+    def test_fetch(self) -> None:
+        db = MockDatabaseDataset()
+        calls: list[int] = []
+
+        def _double(batch: np.ndarray) -> np.ndarray:
+            calls.append(len(batch))
+            return batch * 2
+
+        mapped = db.map_batched(_double).map_batched(np.negative)[[6, 1]]
+
+        assert mapped.fetch().tolist() == [-72, -2]
+        assert mapped[1] == -2
+        assert calls == [2, 1]
+        assert db.database_fetches == [[6, 1], [1]]
+
+    def test_composes_with_zip_and_concatenate(self) -> None:
+        db = MockDatabaseDataset()
+        mapped = SliceableDataset.concatenate(
+            db.map_batched(np.sqrt), db.map_batched(np.negative)
+        )
+        zipped = SliceableDataset.zip(mapped, SliceableDataset.range(16))
+
+        assert [tuple(map(int, pair)) for pair in zipped.fetch([2, 9, 15])] == [
+            (2, 2),
+            (-1, 9),
+            (-49, 15),
+        ]
+
+    def test_leading_dimension_is_checked(self) -> None:
+        mapped = MockDatabaseDataset().map_batched(lambda batch: batch[:1])
+
+        with pytest.raises(ValueError, match="leading dimension"):
+            mapped.fetch([0, 1])
+
+
+class TestWindowSliceableDataset:
+    def test_windows(self) -> None:
+        db = MockDatabaseDataset()
+        windows = db.window(3, stride=2)
+
+        assert len(windows) == 3
+        assert windows[1].tolist() == [4, 9, 16]
+        assert windows.fetch().tolist() == [[0, 1, 4], [4, 9, 16], [16, 25, 36]]
+
+    def test_each_element_is_read_once(self) -> None:
+        db = MockDatabaseDataset()
+        windows = db.window(4)
+
+        assert windows.fetch([4, 0, 1]).tolist() == [
+            [16, 25, 36, 49],
+            [0, 1, 4, 9],
+            [1, 4, 9, 16],
+        ]
+        assert db.database_fetches == [[0, 1, 2, 3, 4, 5, 6, 7]]
+
+    def test_remainder(self) -> None:
+        db = MockDatabaseDataset()
+        windows = db.window(3, stride=3, drop_remainder=False)
+
+        assert len(windows) == 3
+        assert [window.tolist() for window in windows.fetch()] == [
+            [0, 1, 4],
+            [9, 16, 25],
+            [36, 49],
+        ]
+
+    def test_image_windows(self) -> None:
+        frames = SliceableDataset.from_sequence(np.arange(5 * 2 * 2).reshape(5, 2, 2))
+        windows = frames.window(2)
+
+        assert windows.fetch([3, 1]).shape == (2, 2, 2, 2)
+        assert np.array_equal(windows[3], frames.fetch([3, 4]))
+
+
+class TestFetchInto:
+    def test_wrappers_write_into_buffer(self) -> None:
+        db = MockDatabaseDataset()
+        dataset = SliceableDataset.concatenate(
+            db.map(lambda x: x + 1), db[[7, 6, 5, 4, 3, 2, 1, 0]], db.prefetch(2)
+        )[[0, 1, 15, 8, 23, 2]]
+
+        out = np.zeros(6, dtype=int)
+        result = dataset.fetch_into(None, out)
+
+        assert result is out
+        assert out.tolist() == [1, 2, 0, 49, 49, 5]
+
+    def test_checks_output_length(self) -> None:
+        with pytest.raises(ValueError, match="leading dimension"):
+            MockDatabaseDataset().fetch_into([0, 1], np.zeros(3))
+
+    def test_buffer_ring(self) -> None:
+        ring = BufferRing((4, 2), np.float32, size=2)
+        first = ring.next_buffer()
+        second = ring.next_buffer(3)
+
+        assert first.shape == (4, 2)
+        assert second.shape == (3, 2)
+        assert not np.shares_memory(first, second)
+        assert ring.next_buffer() is first
+
+
+class TestOptimize:
+    def test_fuses_maps_and_pushes_indices(self) -> None:
+        db = MockDatabaseDataset()
+        labels = SliceableDataset.from_sequence("abcdefgh")
+        pipeline = SliceableDataset.zip(
+            db.map(lambda x: x + 1).map(lambda x: x * 2), labels
+        ).map(lambda pair: pair)
+        selected = ComposedIndicesSliceableDataset(
+            ComposedIndicesSliceableDataset(pipeline, [7, 6, 5, 4, 3]), [4, 0]
+        )
+        optimized = selected.optimize()
+
+        assert list(optimized) == list(selected) == [(20, "d"), (100, "h")]
+        assert isinstance(optimized, MapSliceableDataset)
+
+        zipped = optimized._ancestor
+        assert isinstance(zipped, ZippedSliceableDataset)
+        fused, _ = zipped._ancestors
+        assert isinstance(fused, MapSliceableDataset)
+        assert isinstance(fused._ancestor, ComposedIndicesSliceableDataset)
+        assert fused._ancestor._ancestor is db
+
+    def test_drops_identity_selections(self) -> None:
+        db = MockDatabaseDataset()
+        assert ComposedIndicesSliceableDataset(db, range(8)).optimize() is db
+
+    def test_explain(self) -> None:
+        concat = SliceableDataset.concatenate(
+            MockDatabaseDataset(), MockDatabaseDataset()[:4]
+        ).map(str)
+
+        assert concat.explain().splitlines() == [
+            f"MapSliceableDataset({str!r}) [len=12, fetch~12]",
+            "  ConcatenateSliceableDataset [len=12, fetch~12]",
+            "    MockDatabaseDataset([0, 1, 4, 9, 16, 25, 36, 49]) [len=8, fetch~8]",
+            "    ComposedIndicesSliceableDataset(range(0, 4)) [len=4, fetch~4]",
+            "      MockDatabaseDataset([0, 1, 4, 9, 16, 25, 36, 49]) [len=8, fetch~4]",
+        ]
+
+
+def test_projection_does_not_fetch_other_branch() -> None:
+    db = MockDatabaseDataset()
+    labels = SliceableDataset.from_sequence("abcdefgh")
+
+    supervised = SliceableDataset.concatenate(
+        map_targets(SliceableDataset.zip(db, labels), str.upper)[[5, 1, 3]],
+        SliceableDataset.zip(db, labels).prefetch(2)[:2],
+    )
+
+    assert list(targets(supervised)) == ["F", "B", "D", "a", "b"]
+    assert not db.database_fetches
+
+    assert list(features(supervised)) == [25, 1, 9, 0, 1]
+    assert list(targets(supervised.map(lambda pair: pair[::-1]))) == list(
+        features(supervised)
+    )
+
+
+def test_filter_targets_does_not_fetch_features() -> None:
+    db = MockDatabaseDataset()
+    powers = SliceableDataset.from_sequence(
+        [{"power": power, "nominal": 10} for power in (9, 30, 11, 2, 10, 7, 12, 10)]
+    )
+
+    filtered = filter_targets(
+        SliceableDataset.zip(db, powers),
+        lambda columns: abs(columns["power"] - columns["nominal"]) < 2,
+    )
+
+    assert not db.database_fetches
+    assert list(features(filtered).fetch()) == [0, 4, 16, 49]
+    assert db.database_fetches == [[0, 2, 4, 7]]
+
+    with pytest.raises(ValueError, match="mask of shape"):
+        filter_targets(SliceableDataset.zip(db, powers), lambda _columns: True)
 
 
 def test_sliceable_to_tensorflow() -> None:
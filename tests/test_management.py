@@ -37,6 +37,21 @@ class TestAllocators:
         assert allocator.allocate("3.14", 0, name="pi") == allocator(p1)
         assert allocator.allocate("hello") == allocator(p2)
 
+    def test_JSONAllocator_sees_allocations_of_other_instances(
+        self, cache_path: Path
+    ) -> None:
+        first = JSONAllocator(cache_path)
+        second = JSONAllocator(cache_path)
+
+        first.allocate("a")
+        assert second.allocate("a") == first.allocate("a")
+
+        # `second` has already loaded the database, before `first` allocated "b"
+        b = first.allocate("b")
+        assert second.allocate("c") != b
+        assert second.allocate("b") == b
+        assert JSONAllocator(cache_path).allocate("c") == second.allocate("c")
+
 
 class TestCacher:
     def test_provide(self, allocator: JSONAllocator, filepath: Path):
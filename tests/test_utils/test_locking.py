@@ -0,0 +1,36 @@
+from pathlib import Path
+
+import pytest
+
+from boiling_learning.utils.locking import file_lock, lock_file
+
+
+def test_file_lock_is_reentrant_and_shared_by_the_process(tmp_path: Path) -> None:
+    lock = file_lock(tmp_path / "cache" / ".lock")
+    assert file_lock(str(tmp_path / "cache" / ".lock")) is lock
+
+    with lock(), lock(shared=True), lock():
+        assert lock.path.is_file()
+
+
+def test_shared_file_lock_cannot_be_upgraded(tmp_path: Path) -> None:
+    lock = file_lock(tmp_path / ".lock")
+
+    with lock(shared=True), pytest.raises(RuntimeError, match="cannot upgrade"):
+        with lock():
+            pass
+
+    # the lock is released and can be taken exclusively again
+    with lock():
+        pass
+
+
+def test_lock_file_conflicts_within_the_process(tmp_path: Path) -> None:
+    path = tmp_path / "directory" / ".in-use"
+
+    with lock_file(path, shared=True), lock_file(path, shared=True):
+        with pytest.raises(BlockingIOError):
+            lock_file(path, blocking=False)
+
+    with lock_file(path, blocking=False):
+        pass
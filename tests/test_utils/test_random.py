@@ -0,0 +1,43 @@
+import random
+
+import numpy as np
+import pytest
+
+from boiling_learning.utils.random import LazyPermutation, random_state
+
+
+@pytest.mark.parametrize("length", [0, 1, 2, 3, 10, 257, 10_000])
+def test_lazy_permutation_is_a_permutation(length: int) -> None:
+    permutation = LazyPermutation(length, seed=1997)
+
+    assert len(permutation) == length
+    assert sorted(permutation) == list(range(length))
+    assert np.array_equal(np.asarray(permutation), list(permutation))
+
+
+def test_lazy_permutation_is_reproducible() -> None:
+    with random_state(0):
+        first = list(LazyPermutation(100, seed=5))
+    with random_state(1):
+        random.random()
+        second = list(LazyPermutation(100, seed=5))
+
+    assert first == second
+    assert first != list(LazyPermutation(100, seed=6))
+
+
+def test_lazy_permutation_slicing() -> None:
+    permutation = LazyPermutation(50, seed=3)
+    elements = list(permutation)
+
+    assert list(permutation[10:40:3]) == elements[10:40:3]
+    assert list(permutation[10:40:3][2:]) == elements[10:40:3][2:]
+    assert permutation[-1] == elements[-1]
+    assert permutation.take(np.array([7, 0, 7])).tolist() == [
+        elements[7],
+        elements[0],
+        elements[7],
+    ]
+
+    with pytest.raises(IndexError):
+        permutation.take(np.array([50]))